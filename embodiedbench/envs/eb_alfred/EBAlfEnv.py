@@ -22,6 +22,7 @@ from PIL import Image
 import embodiedbench.envs.eb_alfred.utils as utils
 from embodiedbench.envs.eb_alfred.utils import alfred_objs, alfred_open_obj, alfred_pick_obj, alfred_slice_obj, alfred_open_obj, alfred_toggle_obj, alfred_recep
 from embodiedbench.envs.eb_alfred.thor_connector import ThorConnector
+from embodiedbench.envs.eb_alfred.episode_store import EpisodeStore
 from embodiedbench.envs.eb_alfred.data.preprocess import Dataset
 from embodiedbench.envs.eb_alfred.gen import constants
 from embodiedbench.main import logger
@@ -110,6 +111,8 @@ class EBAlfEnv(gym.Env):
         self.dataset = self._load_dataset(eval_set)
         if len(selected_indexes):
             self.dataset = [self.dataset[i] for i in selected_indexes]
+        # compact trajectories of the eval set, built from the pp jsons on first use
+        self.episode_store = EpisodeStore.open(eval_set, self.dataset)
         
         # Episode tracking
         self.number_of_episodes = len(self.dataset)
@@ -135,6 +138,8 @@ class EBAlfEnv(gym.Env):
         # feedback verbosity, 0: concise, 1: verbose
         self.feedback_verbosity = 0
         self.log_path = 'running/eb_alfred/{}'.format(exp_name)
+        # saves images in the background when set, see evaluator.episode_runner.ImageWriter
+        self.image_writer = None
 
         self.detection = detection_box # add detection in image
         self.name_to_id_dict = None
@@ -225,7 +230,7 @@ class EBAlfEnv(gym.Env):
         """Return current episode"""
         res = None
         try:
-            res = utils.load_task_json(self.dataset[self._current_episode_num])
+            res = self.episode_store.get(self.dataset[self._current_episode_num])
         except:
             print("episode failed to load trying next episode")
             self.current_episode_num += 1
@@ -234,7 +239,7 @@ class EBAlfEnv(gym.Env):
     
     def _reset_controller(self, task):
         """Restore scene from a task name and replace instruction"""
-        traj_data = utils.load_task_json(task)
+        traj_data = self.episode_store.get(task)
         traj_data['turk_annotations']['anns'][task['repeat_idx']]['task_desc'] = task["instruction"] 
         self.episode_data = traj_data
         args_dict = {'data': ALFRED_DATASET_PATH, 'pframe': 300, 'fast_epoch': False,
@@ -312,9 +317,10 @@ class EBAlfEnv(gym.Env):
         
         ## test calculate reward
         reward, done = self.env.get_transition_reward()
-        subgoal_met = self.env.get_goal_conditions_met()
-        info['task_success'] = float(self.env.get_goal_satisfied())
-        info['task_progress'] = subgoal_met[0] / subgoal_met[1]
+        # evaluated once for this event and shared with the reward above
+        goal_conditions = self.env.get_goal_conditions()
+        info['task_success'] = float(goal_conditions.success)
+        info['task_progress'] = goal_conditions.satisfied / goal_conditions.total
         
         # Add detailed goal condition info
         if hasattr(self.env, 'task') and self.env.task:
@@ -396,7 +402,10 @@ class EBAlfEnv(gym.Env):
 
         # time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
         image_path = os.path.join(folder, 'episode_{}_step_{}.png'.format(episode_idx, self._current_step)) #, time_stamp))
-        img.save(image_path)
+        if self.image_writer is not None:
+            self.image_writer.save(img, image_path)
+        else:
+            img.save(image_path)
         return image_path
 
     def save_episode_log(self):
@@ -420,6 +429,7 @@ class EBAlfEnv(gym.Env):
     def close(self):
         """Terminate the environment."""
         self.env.stop()
+        self.episode_store.close()
 
     
 
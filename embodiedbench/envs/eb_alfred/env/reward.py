@@ -33,11 +33,8 @@ class GotoLocationAction(BaseAction):
         prev_pose = prev_state.pose_discrete
         tar_pose = tuple([int(i) for i in subgoal['location'].split('|')[1:]])
 
-        prev_actions, _ = self.gt_graph.get_shortest_path(prev_pose, tar_pose)
-        curr_actions, _ = self.gt_graph.get_shortest_path(curr_pose, tar_pose)
-
-        prev_distance = len(prev_actions)
-        curr_distance = len(curr_actions)
+        prev_distance = self.gt_graph.get_path_length(prev_pose, tar_pose)
+        curr_distance = self.gt_graph.get_path_length(curr_pose, tar_pose)
         reward = (prev_distance - curr_distance) * 0.2 # distance reward factor?
 
         # [DEPRECATED] Old criteria which requires the next subgoal object to be visible
@@ -1,10 +1,61 @@
 import json
-import numpy as np
 from embodiedbench.envs.eb_alfred.gen.graph import graph_obj
-from embodiedbench.envs.eb_alfred.gen.utils.game_util import get_objects_with_name_and_prop
 from embodiedbench.envs.eb_alfred.env.reward import get_action
 
 
+class EventObjects(object):
+    '''
+    index over one event's metadata['objects'] for the goal condition checks:
+    objects grouped by property, with name lookups and receptacle contents memoized
+    '''
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.by_prop = {}
+        self.matches = {}
+        self.contents = {}
+
+    def with_name_and_prop(self, name, prop):
+        '''
+        same result as game_util.get_objects_with_name_and_prop
+        '''
+        key = (name, prop)
+        if key not in self.matches:
+            if prop not in self.by_prop:
+                self.by_prop[prop] = [obj for obj in self.metadata['objects'] if obj[prop]]
+            self.matches[key] = [obj for obj in self.by_prop[prop] if name in obj['objectId']]
+        return self.matches[key]
+
+    def receptacle_contents(self, obj):
+        '''
+        set of objectIds inside obj, empty if it holds nothing
+        '''
+        if obj['objectId'] not in self.contents:
+            ids = obj['receptacleObjectIds']
+            self.contents[obj['objectId']] = set(ids) if ids is not None else set()
+        return self.contents[obj['objectId']]
+
+
+class GoalConditions(object):
+    '''
+    goal conditions of a task for one event.
+    details is a list of (condition, satisfied, total) entries.
+    '''
+
+    def __init__(self, details):
+        self.details = details
+        self.satisfied = sum(d[1] for d in details)
+        self.total = sum(d[2] for d in details)
+
+    @property
+    def success(self):
+        return self.satisfied == self.total
+
+    @property
+    def counts(self):
+        return self.satisfied, self.total
+
+
 class BaseTask(object):
     '''
     base class for tasks
@@ -20,6 +71,9 @@ class BaseTask(object):
         self.reward_type = reward_type
         self.step_num = 0
         self.num_subgoals = self.get_num_subgoals(self.traj['plan']['high_pddl']) 
+        # compact episode store records only keep the count
+        plan = self.traj['plan']
+        self.num_low_actions = plan['num_low_actions'] if 'num_low_actions' in plan else len(plan['low_actions'])
         self.goal_finished = False
 
         # internal states
@@ -38,6 +92,10 @@ class BaseTask(object):
         # prev state
         self.prev_state = self.env.last_event
 
+        # goal conditions of the last evaluated event
+        self.goal_cache_key = None
+        self.goal_cache = None
+
     def load_reward_config(self, config_file):
         '''
         load json file with reward values
@@ -52,7 +110,8 @@ class BaseTask(object):
         '''
         floor_plan = self.traj['scene']['floor_plan']
         scene_num = self.traj['scene']['scene_num']
-        self.gt_graph = graph_obj.Graph(use_gt=True, construct_graph=True, scene_id=scene_num)
+        # shared per scene, only read by the reward functions
+        self.gt_graph = graph_obj.get_nav_graph(scene_num)
 
     def get_num_subgoals(self, high_pddl):
         '''
@@ -66,11 +125,34 @@ class BaseTask(object):
         else:
             return len(high_pddl) 
 
+    def check_goal_conditions(self, objects):
+        '''
+        list of (condition, satisfied, total) for the event indexed by objects
+        '''
+        raise NotImplementedError
+
+    def goal_conditions(self, state):
+        '''
+        GoalConditions for state, evaluated once per event.
+        the heated/cooled/cleaned sets are replaced (never mutated) by the env when they change.
+        '''
+        key = (state, self.env.heated_objects, self.env.cooled_objects, self.env.cleaned_objects)
+        if self.goal_cache_key is None or any(a is not b for a, b in zip(key, self.goal_cache_key)):
+            self.goal_cache = GoalConditions(self.check_goal_conditions(EventObjects(state.metadata)))
+            self.goal_cache_key = key
+        return self.goal_cache
+
     def goal_satisfied(self, state):
         '''
         check if the overall task goal was satisfied.
         '''
-        raise NotImplementedError
+        return self.goal_conditions(state).success
+
+    def goal_conditions_met(self, state):
+        '''
+        (satisfied, total) goal conditions
+        '''
+        return self.goal_conditions(state).counts
 
     def transition_reward(self, state):
         '''
@@ -112,7 +194,7 @@ class BaseTask(object):
             reward += self.reward_config['Generic']['failure']
 
         # step penalty
-        if self.step_num > len(self.traj['plan']['low_actions']):
+        if self.step_num > self.num_low_actions:
             reward += self.reward_config['Generic']['step_penalty']
 
         # save event
@@ -131,6 +213,8 @@ class BaseTask(object):
         self.finished = -1
         self.step_num = 0
         self.goal_finished = False
+        self.goal_cache_key = None
+        self.goal_cache = None
 
     def get_subgoal_idx(self):
         return self.finished
@@ -158,6 +242,37 @@ class BaseTask(object):
 
         return targets
 
+    def check_sliced(self, targets, pickupables, needed=1):
+        '''
+        slicing condition, only present when the target object is a slice
+        '''
+        if 'Sliced' not in targets['object']:
+            return []
+        num_sliced = len([p for p in pickupables if 'Sliced' in p['objectId']])
+        return [('sliced', min(num_sliced, needed), needed)]
+
+    def check_placed_with_state(self, objects, state_objects, state_name):
+        '''
+        shared by the heat/cool/clean tasks: object in the receptacle, object in the
+        given state, and one object that is both
+        '''
+        targets = self.get_targets()
+        receptacles = objects.with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = objects.with_name_and_prop(targets['object'], 'pickupable')
+
+        objs_in_place = [p['objectId'] for p in pickupables for r in receptacles
+                         if p['objectId'] in objects.receptacle_contents(r)]
+        objs_in_state = [p['objectId'] for p in pickupables if p['objectId'] in state_objects]
+
+        return self.check_sliced(targets, pickupables) + [
+            # check if object is in the receptacle
+            ('in_receptacle', int(len(objs_in_place) > 0), 1),
+            # check if some object was heated/cooled/cleaned
+            (state_name, int(len(objs_in_state) > 0), 1),
+            # check if the object is both in the receptacle and in that state
+            ('in_receptacle_and_' + state_name, int(any(obj_id in state_objects for obj_id in objs_in_place)), 1),
+        ]
+
 
 class PickAndPlaceSimpleTask(BaseTask):
     '''
@@ -167,31 +282,15 @@ class PickAndPlaceSimpleTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class is inside any receptacle of 'parent' class
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 1
-        s = 0
-
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-
-        # check if object needs to be sliced
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
-
-        if np.any([np.any([p['objectId'] in r['receptacleObjectIds']
-                           for r in receptacles if r['receptacleObjectIds'] is not None])
-                   for p in pickupables]):
-            s += 1
+        receptacles = objects.with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = objects.with_name_and_prop(targets['object'], 'pickupable')
 
-        return s, ts
+        in_place = any(p['objectId'] in objects.receptacle_contents(r)
+                       for p in pickupables for r in receptacles)
+        return self.check_sliced(targets, pickupables) + [('in_receptacle', int(in_place), 1)]
 
     def reset(self):
         super().reset()
@@ -205,30 +304,16 @@ class PickTwoObjAndPlaceTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if two objects of 'object' class are in any receptacle of 'parent' class
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 2
-        s = 0
-
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-
-        # check if object needs to be sliced
-        if 'Sliced' in targets['object']:
-            ts += 2
-            s += min(len([p for p in pickupables if 'Sliced' in p['objectId']]), 2)
+        receptacles = objects.with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = objects.with_name_and_prop(targets['object'], 'pickupable')
 
         # placing each object counts as a goal_condition
-        s += min(np.max([sum([1 if r['receptacleObjectIds'] is not None
-                                   and p['objectId'] in r['receptacleObjectIds'] else 0
-                              for p in pickupables])
-                         for r in receptacles]), 2)
-        return s, ts
+        num_in_place = max([sum(1 for p in pickupables if p['objectId'] in objects.receptacle_contents(r))
+                            for r in receptacles], default=0)
+        return self.check_sliced(targets, pickupables, needed=2) + [('in_receptacle', min(num_in_place, 2), 2)]
 
     def reset(self):
         super().reset()
@@ -242,34 +327,23 @@ class LookAtObjInLightTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class is being held in front of 'toggle' object that is turned on
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 2
-        s = 0
-
         targets = self.get_targets()
-        toggleables = get_objects_with_name_and_prop(targets['toggle'], 'toggleable', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-        inventory_objects = state.metadata['inventoryObjects']
-
-        # check if object needs to be sliced
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
+        toggleables = objects.with_name_and_prop(targets['toggle'], 'toggleable')
+        pickupables = objects.with_name_and_prop(targets['object'], 'pickupable')
+        inventory_objects = objects.metadata['inventoryObjects']
 
         # check if the right object is in hand
-        if len(inventory_objects) > 0 and inventory_objects[0]['objectId'] in [p['objectId'] for p in pickupables]:
-            s += 1
+        in_hand = len(inventory_objects) > 0 and \
+            inventory_objects[0]['objectId'] in [p['objectId'] for p in pickupables]
         # check if the lamp is visible and turned on
-        if np.any([t['isToggled'] and t['visible'] for t in toggleables]):
-            s += 1
+        light_on = any(t['isToggled'] and t['visible'] for t in toggleables)
 
-        return s, ts
+        return self.check_sliced(targets, pickupables) + [
+            ('in_hand', int(in_hand), 1),
+            ('light_on', int(light_on), 1),
+        ]
 
     def reset(self):
         super().reset()
@@ -283,40 +357,9 @@ class PickHeatThenPlaceInRecepTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class inside receptacle of 'parent' class is hot
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 3
-        s = 0
-
-        targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-
-        # check if object needs to be sliced
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
-
-        objs_in_place = [p['objectId'] for p in pickupables for r in receptacles
-                         if r['receptacleObjectIds'] is not None and p['objectId'] in r['receptacleObjectIds']]
-        objs_heated = [p['objectId'] for p in pickupables if p['objectId'] in self.env.heated_objects]
-
-        # check if object is in the receptacle
-        if len(objs_in_place) > 0:
-            s += 1
-        # check if some object was heated
-        if len(objs_heated) > 0:
-            s += 1
-        # check if the object is both in the receptacle and hot
-        if np.any([obj_id in objs_heated for obj_id in objs_in_place]):
-            s += 1
-
-        return s, ts
+        return self.check_placed_with_state(objects, self.env.heated_objects, 'heated')
 
     def reset(self):
         super().reset()
@@ -330,39 +373,9 @@ class PickCoolThenPlaceInRecepTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class inside receptacle of 'parent' class is cold
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 3
-        s = 0
-
-        targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
-
-        objs_in_place = [p['objectId'] for p in pickupables for r in receptacles
-                         if r['receptacleObjectIds'] is not None and p['objectId'] in r['receptacleObjectIds']]
-        objs_cooled = [p['objectId'] for p in pickupables if p['objectId'] in self.env.cooled_objects]
-
-        # check if object is in the receptacle
-        if len(objs_in_place) > 0:
-            s += 1
-        # check if some object was cooled
-        if len(objs_cooled) > 0:
-            s += 1
-        # check if the object is both in the receptacle and cold
-        if np.any([obj_id in objs_cooled for obj_id in objs_in_place]):
-            s += 1
-
-        return s, ts
+        return self.check_placed_with_state(objects, self.env.cooled_objects, 'cooled')
 
     def reset(self):
         super().reset()
@@ -376,39 +389,9 @@ class PickCleanThenPlaceInRecepTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class inside receptacle of 'parent' class is clean
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 3
-        s = 0
-
-        targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
-
-        objs_in_place = [p['objectId'] for p in pickupables for r in receptacles
-                         if r['receptacleObjectIds'] is not None and p['objectId'] in r['receptacleObjectIds']]
-        objs_cleaned = [p['objectId'] for p in pickupables if p['objectId'] in self.env.cleaned_objects]
-
-        # check if object is in the receptacle
-        if len(objs_in_place) > 0:
-            s += 1
-        # check if some object was cleaned
-        if len(objs_cleaned) > 0:
-            s += 1
-        # check if the object is both in the receptacle and clean
-        if np.any([obj_id in objs_cleaned for obj_id in objs_in_place]):
-            s += 1
-
-        return s, ts
+        return self.check_placed_with_state(objects, self.env.cleaned_objects, 'cleaned')
 
     def reset(self):
         super().reset()
@@ -422,45 +405,29 @@ class PickAndPlaceWithMovableRecepTask(BaseTask):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def goal_satisfied(self, state):
+    def check_goal_conditions(self, objects):
         # check if any object of 'object' class is inside any movable receptacle of 'mrecep' class at receptacle of 'parent' class
-        pcs = self.goal_conditions_met(state)
-        return pcs[0] == pcs[1]
-
-    def goal_conditions_met(self, state):
-        ts = 3
-        s = 0
-
         targets = self.get_targets()
-        receptacles = get_objects_with_name_and_prop(targets['parent'], 'receptacle', state.metadata)
-        pickupables = get_objects_with_name_and_prop(targets['object'], 'pickupable', state.metadata)
-        movables = get_objects_with_name_and_prop(targets['mrecep'], 'pickupable', state.metadata)
-
-        # check if object needs to be sliced
-        if 'Sliced' in targets['object']:
-            ts += 1
-            if len([p for p in pickupables if 'Sliced' in p['objectId']]) >= 1:
-                s += 1
+        receptacles = objects.with_name_and_prop(targets['parent'], 'receptacle')
+        pickupables = objects.with_name_and_prop(targets['object'], 'pickupable')
+        movables = objects.with_name_and_prop(targets['mrecep'], 'pickupable')
 
         pickup_in_place = [p for p in pickupables for m in movables
-                           if 'receptacleObjectIds' in p and m['receptacleObjectIds'] is not None
-                           and p['objectId'] in m['receptacleObjectIds']]
+                           if 'receptacleObjectIds' in p and p['objectId'] in objects.receptacle_contents(m)]
         movable_in_place = [m for m in movables for r in receptacles
-                            if 'receptacleObjectIds' in r and r['receptacleObjectIds'] is not None
-                            and m['objectId'] in r['receptacleObjectIds']]
-        # check if the object is in the final receptacle
-        if len(pickup_in_place) > 0:
-            s += 1
-        # check if the movable receptacle is in the final receptacle
-        if len(movable_in_place) > 0:
-            s += 1
+                            if 'receptacleObjectIds' in r and m['objectId'] in objects.receptacle_contents(r)]
         # check if both the object and movable receptacle stack is in the final receptacle
-        if np.any([np.any([p['objectId'] in m['receptacleObjectIds'] for p in pickupables]) and
-                   np.any([r['objectId'] in m['parentReceptacles'] for r in receptacles]) for m in movables
-                   if m['parentReceptacles'] is not None and m['receptacleObjectIds'] is not None]):
-            s += 1
-
-        return s, ts
+        stacked = any(any(p['objectId'] in m['receptacleObjectIds'] for p in pickupables) and
+                      any(r['objectId'] in m['parentReceptacles'] for r in receptacles) for m in movables
+                      if m['parentReceptacles'] is not None and m['receptacleObjectIds'] is not None)
+
+        return self.check_sliced(targets, pickupables) + [
+            # check if the object is in the final receptacle
+            ('object_in_movable', int(len(pickup_in_place) > 0), 1),
+            # check if the movable receptacle is in the final receptacle
+            ('movable_in_receptacle', int(len(movable_in_place) > 0), 1),
+            ('stacked_in_receptacle', int(stacked), 1),
+        ]
 
     def reset(self):
         super().reset()
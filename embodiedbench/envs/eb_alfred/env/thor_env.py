@@ -210,6 +210,12 @@ class ThorEnv(Controller):
         else:
             return self.task.goal_conditions_met(self.last_event)
 
+    def get_goal_conditions(self):
+        if self.task is None:
+            raise Exception("WARNING: no task setup for goal_conditions")
+        else:
+            return self.task.goal_conditions(self.last_event)
+
     def get_subgoal_idx(self):
         if self.task is None:
             raise Exception("WARNING: no task setup for subgoal_idx")
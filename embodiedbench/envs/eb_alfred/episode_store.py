@@ -0,0 +1,155 @@
+'''
+Compact per-eval-set store of the ALFRED trajectory fields the benchmark reads.
+
+The pp jsons under data/json_2.1.0/<task>/pp carry low-level action traces, image
+lists and annotations that EB-ALFRED never touches. The store keeps one compact json
+record per episode (scene config, init action, high_pddl plan, pddl_params and the
+number of low actions) in a single file that is memory mapped. Its first line is an
+index of the byte ranges of the records, so loading an episode reads and parses only
+its own record, and the index and the records are published together.
+
+Built on first use by EBAlfEnv, or ahead of time with:
+    python -m embodiedbench.envs.eb_alfred.episode_store --eval_sets base spatial
+'''
+import argparse
+import json
+import mmap
+import os
+
+import embodiedbench.envs.eb_alfred.utils as utils
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), 'data/json_2.1.0')
+ALFRED_SPLIT_PATH = os.path.join(os.path.dirname(__file__), 'data/splits/splits.json')
+STORE_VERSION = 2
+SCENE_KEYS = ['floor_plan', 'scene_num', 'random_seed', 'init_action',
+              'object_poses', 'object_toggles', 'dirty_and_empty']
+
+
+def task_key(task):
+    return '%s/%d' % (task['task'], task['repeat_idx'])
+
+
+def compact_traj(traj_data):
+    '''
+    the subset of a pp json read by EBAlfEnv, ThorEnv and the task/reward code
+    '''
+    scene = traj_data['scene']
+    return {
+        'task_id': traj_data.get('task_id'),
+        'task_type': traj_data['task_type'],
+        'pddl_params': traj_data['pddl_params'],
+        'scene': {k: scene[k] for k in SCENE_KEYS if k in scene},
+        'plan': {'high_pddl': traj_data['plan']['high_pddl'],
+                 'num_low_actions': len(traj_data['plan']['low_actions'])},
+        'turk_annotations': {'anns': [{'task_desc': ann['task_desc']}
+                                      for ann in traj_data['turk_annotations']['anns']]},
+    }
+
+
+class EpisodeStore(object):
+    '''
+    read-only view of a store written by EpisodeStore.build
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            header = self._file.readline()
+            self.index = json.loads(header.decode('utf-8'))
+            self.entries = self.index['entries']
+        except (ValueError, TypeError, KeyError):
+            self._file.close()
+            raise ValueError('%s is not an episode store' % path)
+        # records start after the index line
+        self._start = len(header)
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, task):
+        return task_key(task) in self.entries
+
+    def get(self, task):
+        '''
+        compact trajectory of task, a fresh dict the caller may modify
+        '''
+        offset, length = self.entries[task_key(task)]
+        offset += self._start
+        return json.loads(self._data[offset:offset + length].decode('utf-8'))
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    @staticmethod
+    def store_path(eval_set):
+        return os.path.join(STORE_DIR, '%s.episodes' % eval_set)
+
+    @staticmethod
+    def build(path, tasks):
+        '''
+        write the index and the records of tasks (entries of splits.json) to path.
+        the store is replaced with a single rename, so readers see either the old or
+        the new index and records, never a mix of them
+        '''
+        entries = {}
+        records = []
+        offset = 0
+        for task in tasks:
+            key = task_key(task)
+            if key in entries:
+                continue
+            record = json.dumps(compact_traj(utils.load_task_json(task)),
+                                separators=(',', ':')).encode('utf-8')
+            records.append(record)
+            entries[key] = [offset, len(record)]
+            offset += len(record)
+        index = {'version': STORE_VERSION,
+                 'splits_mtime': os.path.getmtime(ALFRED_SPLIT_PATH),
+                 'entries': entries}
+        tmp_path = '%s.tmp%d' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            # compact json has no newline, so the index is exactly the first line
+            f.write(json.dumps(index).encode('utf-8') + b'\n')
+            for record in records:
+                f.write(record)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, eval_set, tasks, rebuild=False):
+        '''
+        store for eval_set, (re)built when missing, outdated or not covering tasks.
+        a rebuild covers the whole split, not only the (down sampled) tasks.
+        '''
+        path = cls.store_path(eval_set)
+        if not rebuild and os.path.exists(path):
+            try:
+                store = cls(path)
+            except ValueError:
+                # written by an older version
+                store = None
+            if store is not None:
+                if store.index.get('version') == STORE_VERSION \
+                        and store.index.get('splits_mtime') == os.path.getmtime(ALFRED_SPLIT_PATH) \
+                        and all(task in store for task in tasks):
+                    return store
+                store.close()
+        with open(ALFRED_SPLIT_PATH) as f:
+            splits = json.load(f)
+        cls.build(path, splits.get(eval_set, []) + list(tasks))
+        return cls(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eval_sets', nargs='+', default=None, help='default: every split')
+    args = parser.parse_args()
+    with open(ALFRED_SPLIT_PATH) as f:
+        splits = json.load(f)
+    for eval_set in args.eval_sets or list(splits):
+        path = EpisodeStore.store_path(eval_set)
+        EpisodeStore.build(path, splits[eval_set])
+        print('%s: %d episodes -> %s (%.1f MB)' % (
+            eval_set, len(splits[eval_set]), path, os.path.getsize(path) / 1e6))
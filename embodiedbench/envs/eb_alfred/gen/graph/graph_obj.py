@@ -1,9 +1,12 @@
+import hashlib
 import os
 import random
 import time
 
 import networkx as nx
 import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
 
 import embodiedbench.envs.eb_alfred.gen.constants as constants
 from embodiedbench.envs.eb_alfred.gen.utils import game_util
@@ -13,6 +16,16 @@ PRED_WEIGHT_THRESH = 10
 EPSILON = 1e-4
 
 # Direction: 0: north, 1: east, 2: south, 3: west
+# (dy, dx) moved by MoveAhead for each direction
+DIRECTION_OFFSETS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+LAYOUTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'layouts')
+NAV_GRAPH_CACHE_DIR = os.environ.get(
+    'EB_ALFRED_NAV_GRAPH_CACHE', os.path.expanduser('~/.cache/embodiedbench/alfred_nav_graphs'))
+NAV_GRAPH_CACHE_VERSION = 1
+
+# ground-truth navigation graphs already built in this process, by scene id
+_nav_graphs = {}
 
 
 class Graph(object):
@@ -276,6 +289,10 @@ class Graph(object):
 
         return actions, path
 
+    def get_path_length(self, pose, goal_pose):
+        actions, _ = self.get_shortest_path(pose, goal_pose)
+        return len(actions)
+
     def get_shortest_path_unweighted(self, pose, goal_pose):
         assert(pose[2] in {0, 1, 2, 3})
         assert(goal_pose[2] in {0, 1, 2, 3})
@@ -373,6 +390,193 @@ class Graph(object):
                 path.append(path[-1])
 
 
+class NavGraph(object):
+    '''
+    read-only ground-truth navigation graph of a scene stored as a CSR adjacency matrix.
+
+    Nodes are poses (x, y, direction) in grid units, with the same edges and weights as
+    Graph(use_gt=True, construct_graph=True). Use get_nav_graph() to get the shared
+    instance of a scene instead of building one per task.
+    '''
+
+    def __init__(self, scene_id, points, bounds, memory, adjacency):
+        self.scene_id = scene_id
+        self.points = points
+        self.xMin, self.yMin, self.xMax, self.yMax = [int(b) for b in bounds]
+        self.memory = memory
+        self.adjacency = adjacency
+        self.width = self.xMax - self.xMin + 1
+        self.height = self.yMax - self.yMin + 1
+        self.reverse_adjacency = None
+        # goal node -> (next node towards the goal, actions-to-goal field)
+        self.distance_fields = {}
+
+    @classmethod
+    def build(cls, scene_id):
+        points = np.load(os.path.join(LAYOUTS_DIR, 'FloorPlan%s-layout.npy' % scene_id))
+        points /= constants.AGENT_STEP_SIZE
+        points = np.round(points).astype(np.int32)
+        bounds = (points[:, 0].min() - constants.SCENE_PADDING * 2,
+                  points[:, 1].min() - constants.SCENE_PADDING * 2,
+                  points[:, 0].max() + constants.SCENE_PADDING * 2,
+                  points[:, 1].max() + constants.SCENE_PADDING * 2)
+        x_min, y_min, x_max, y_max = bounds
+        memory = np.full((y_max - y_min + 1, x_max - x_min + 1), MAX_WEIGHT_IN_GRAPH, dtype=np.float32)
+        memory[points[:, 1] - y_min, points[:, 0] - x_min] = 1 + EPSILON
+
+        height, width = memory.shape
+        ys, xs = np.mgrid[0:height, 0:width]
+        rows, cols, weights = [], [], []
+        for direction in range(4):
+            node = (ys * width + xs) * 4
+            # rotating in place costs 1
+            for turn in (1, -1):
+                rows.append((node + direction).ravel())
+                cols.append((node + (direction + turn) % 4).ravel())
+                weights.append(np.ones(node.size, dtype=np.float32))
+            # moving ahead into a cell costs that cell's weight
+            dy, dx = DIRECTION_OFFSETS[direction]
+            back_direction = (direction + 2) % 4
+            src_y, src_x = ys + dy, xs + dx
+            valid = (src_y >= 0) & (src_y < height) & (src_x >= 0) & (src_x < width)
+            rows.append((src_y[valid] * width + src_x[valid]) * 4 + back_direction)
+            cols.append((ys[valid] * width + xs[valid]) * 4 + back_direction)
+            weights.append(memory[valid])
+        num_nodes = height * width * 4
+        adjacency = sparse.csr_matrix(
+            (np.concatenate(weights).astype(np.float64), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(num_nodes, num_nodes))
+        return cls(scene_id, points, bounds, memory, adjacency)
+
+    def save(self, path, layout_hash):
+        tmp_path = '%s.%d.tmp.npz' % (path[:-len('.npz')], os.getpid())
+        np.savez(tmp_path, version=NAV_GRAPH_CACHE_VERSION, layout_hash=layout_hash,
+                 points=self.points, bounds=np.array([self.xMin, self.yMin, self.xMax, self.yMax]),
+                 memory=self.memory, data=self.adjacency.data, indices=self.adjacency.indices,
+                 indptr=self.adjacency.indptr, shape=np.array(self.adjacency.shape))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, scene_id, path, layout_hash):
+        with np.load(path) as f:
+            if int(f['version']) != NAV_GRAPH_CACHE_VERSION or str(f['layout_hash']) != layout_hash:
+                return None
+            adjacency = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            return cls(scene_id, f['points'], f['bounds'], f['memory'], adjacency)
+
+    def node_index(self, pose):
+        return ((int(pose[1]) - self.yMin) * self.width + (int(pose[0]) - self.xMin)) * 4 + int(pose[2])
+
+    def node_pose(self, index):
+        cell, direction = divmod(int(index), 4)
+        yy, xx = divmod(cell, self.width)
+        return (xx + self.xMin, yy + self.yMin, direction)
+
+    def __contains__(self, pose):
+        return (self.xMin <= pose[0] <= self.xMax and self.yMin <= pose[1] <= self.yMax
+                and pose[2] in {0, 1, 2, 3})
+
+    def get_distance_field(self, goal_pose):
+        '''
+        single-target field for goal_pose (x, y, direction), computed once with a reverse
+        Dijkstra and kept for every later query in this scene.
+
+        returns (next_node, steps): the next node index on a shortest path to the goal for
+        every node, and a (height, width, 4) array with the number of moves along that path
+        before the goal or the first edge into an untraversable cell.
+        '''
+        goal = self.node_index(goal_pose)
+        if goal not in self.distance_fields:
+            if self.reverse_adjacency is None:
+                self.reverse_adjacency = self.adjacency.T.tocsr()
+            distances, next_node = csgraph.dijkstra(self.reverse_adjacency, indices=goal,
+                                                    return_predecessors=True)
+            # moving ahead costs the weight of the cell moved into, rotating costs 1
+            cells = np.arange(next_node.size) // 4
+            next_cells = np.where(next_node >= 0, next_node, 0) // 4
+            blocked = (cells != next_cells) & (self.memory.ravel()[next_cells] >= PRED_WEIGHT_THRESH)
+            steps = np.zeros(next_node.size, dtype=np.int32)
+            for node in np.argsort(distances, kind='stable'):
+                nxt = next_node[node]
+                if nxt >= 0 and not blocked[node]:
+                    steps[node] = steps[nxt] + 1
+            self.distance_fields[goal] = (next_node, steps.reshape(self.height, self.width, 4))
+        return self.distance_fields[goal]
+
+    def _check_poses(self, pose, goal_pose):
+        assert(pose[2] in {0, 1, 2, 3})
+        assert(goal_pose[2] in {0, 1, 2, 3})
+        try:
+            assert(pose[:3] in self), 'start point not in graph'
+            assert(goal_pose[:3] in self), 'start point not in graph'
+        except Exception as ex:
+            print('pose', pose, 'goal_pose', goal_pose)
+            raise ex
+
+    def get_path_length(self, pose, goal_pose):
+        '''
+        len(self.get_shortest_path(pose, goal_pose)[0]) as two array lookups
+        '''
+        self._check_poses(pose, goal_pose)
+        _, steps = self.get_distance_field(goal_pose)
+        length = int(steps[int(pose[1]) - self.yMin, int(pose[0]) - self.xMin, int(pose[2])])
+        curr_horizon, goal_horizon = int(pose[3]), int(goal_pose[3])
+        if curr_horizon < goal_horizon:
+            length += (goal_horizon - curr_horizon) // constants.AGENT_HORIZON_ADJ
+        elif curr_horizon > goal_horizon:
+            length += (curr_horizon - goal_horizon) // constants.AGENT_HORIZON_ADJ
+        return length
+
+    def get_shortest_path(self, pose, goal_pose):
+        '''
+        same contract as Graph.get_shortest_path: returns (actions, path) towards goal_pose,
+        cut before the first edge into an untraversable cell.
+        '''
+        self._check_poses(pose, goal_pose)
+
+        curr_horizon = int(pose[3])
+        goal_horizon = int(goal_pose[3])
+
+        next_node, steps = self.get_distance_field(goal_pose)
+        node = self.node_index(pose)
+        path = [tuple(int(pp) for pp in pose[:3])]
+        for _ in range(steps.ravel()[node]):
+            node = next_node[node]
+            path.append(self.node_pose(node))
+
+        actions = [Graph.get_plan_move(path[ii], path[ii + 1]) for ii in range(len(path) - 1)]
+        Graph.horizon_adjust(actions, path, curr_horizon, goal_horizon)
+
+        return actions, path
+
+
+def get_nav_graph(scene_id):
+    '''
+    ground-truth NavGraph of a FloorPlan, built once per process and cached on disk
+    (NAV_GRAPH_CACHE_DIR, keyed by the layout file content)
+    '''
+    if scene_id in _nav_graphs:
+        return _nav_graphs[scene_id]
+    with open(os.path.join(LAYOUTS_DIR, 'FloorPlan%s-layout.npy' % scene_id), 'rb') as f:
+        layout_hash = hashlib.sha1(f.read()).hexdigest()
+    cache_path = os.path.join(NAV_GRAPH_CACHE_DIR, 'FloorPlan%s.npz' % scene_id)
+    graph = None
+    if os.path.exists(cache_path):
+        try:
+            graph = NavGraph.load(scene_id, cache_path, layout_hash)
+        except (OSError, ValueError, KeyError):
+            graph = None
+    if graph is None:
+        graph = NavGraph.build(scene_id)
+        try:
+            os.makedirs(NAV_GRAPH_CACHE_DIR, exist_ok=True)
+            graph.save(cache_path, layout_hash)
+        except OSError as ex:
+            print('could not cache navigation graph of FloorPlan%s: %s' % (scene_id, ex))
+    _nav_graphs[scene_id] = graph
+    return graph
+
+
 if __name__ == '__main__':
     # Test graphs
     env = game_util.create_env()
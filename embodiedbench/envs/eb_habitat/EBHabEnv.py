@@ -12,10 +12,12 @@ Dependencies:
 - PIL
 """
 import gym
+import copy
 import os
+import types
 import time
 import json
-import imageio
+import math
 from PIL import Image 
 import numpy as np
 import habitat
@@ -25,14 +27,30 @@ from embodiedbench.envs.eb_habitat.config.default_structured_configs import (
     ThirdRGBSensorConfig,
 )
 from habitat.gym.gym_definitions import _add_sim_sensor_to_config
-from omegaconf import OmegaConf
+from habitat.core.dataset import BaseEpisode, Dataset, EpisodeIterator
+from habitat.core.embodied_task import Action, EmbodiedTask, Measure, Measurements
+from habitat.core.env import Env, RLEnv
+from habitat.core.simulator import Sensor, SensorSuite, Simulator
+from habitat.gym.gym_wrapper import HabGymWrapper
+from habitat.articulated_agents.articulated_agent_interface import ArticulatedAgentInterface
+from habitat.tasks.rearrange.articulated_agent_manager import ArticulatedAgentData, ArticulatedAgentManager
+from habitat.tasks.rearrange.marker_info import MarkerInfo
+from habitat.tasks.rearrange.rearrange_grasp_manager import RearrangeGraspManager
+from habitat.tasks.rearrange.utils import IkHelper
+from habitat.tasks.rearrange.multi_task.pddl_action import PddlAction
+from habitat.tasks.rearrange.multi_task.pddl_domain import PddlDomain
+from habitat.tasks.rearrange.multi_task.pddl_logical_expr import LogicalExpr
+from habitat.tasks.rearrange.multi_task.pddl_predicate import Predicate
+from habitat.tasks.rearrange.multi_task.rearrange_pddl import ExprType, PddlEntity, PddlSimInfo
+from omegaconf import DictConfig, ListConfig, OmegaConf
 
 from habitat_sim.utils import viz_utils as vut
 from embodiedbench.envs.eb_habitat.config import default_structured_configs
+from embodiedbench.envs.eb_habitat.dataset.episodes import shard_episodes_by_scene
 import embodiedbench.envs.eb_habitat.predicate_task
 import embodiedbench.envs.eb_habitat.config
 import embodiedbench.envs.eb_habitat.measures
-from embodiedbench.envs.eb_habitat.utils import observations_to_image, merge_to_file, draw_text
+from embodiedbench.envs.eb_habitat.utils import observations_to_image, process_image_array, merge_to_file, draw_text, get_action_language, VideoStreamWriter
 from embodiedbench.main import logger
 
 HABITAT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config/task/language_rearrangement.yaml')
@@ -43,6 +61,80 @@ ValidEvalSets = [
         'spatial_relationship', 'visual_appearance', 'long_horizon'
     ] 
 
+# 'full': every camera of the task config is rendered on every step and saved images are composited
+# 'light': only the cameras that are consumed are created, see EBHabEnv.__init__
+RenderProfiles = ['full', 'light']
+
+# EBHabEnv and habitat Env attributes saved by EBHabEnv.snapshot
+SNAPSHOT_ENV_KEYS = ['_current_step', '_cur_invalid_actions', 'is_holding', 'episode_log', '_last_obs']
+SNAPSHOT_HABITAT_ENV_KEYS = ['_elapsed_steps', '_episode_over']
+# Objects a snapshot refers to instead of copying: the simulator, its agents, grasp managers and
+# markers (whose state is saved by capture_state), the task machinery (saved attribute by
+# attribute), configs and the PDDL definitions, which do not change within an episode.
+# PddlSimInfo is shared with the sensors, whose caches follow its entity tracking.
+SNAPSHOT_SHARED_TYPES = (
+    Simulator, EmbodiedTask, Action, Measure, Measurements, Sensor, SensorSuite, Env, RLEnv,
+    ArticulatedAgentInterface, ArticulatedAgentData, ArticulatedAgentManager, RearrangeGraspManager,
+    MarkerInfo, IkHelper,
+    Dataset, EpisodeIterator, BaseEpisode, DictConfig, ListConfig, gym.Space,
+    PddlDomain, PddlSimInfo, PddlEntity, ExprType, Predicate, PddlAction, LogicalExpr,
+    type, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.ModuleType,
+)
+
+
+def _copy_state(value, memo):
+    """
+    Deep copy of value for a snapshot, except for the SNAPSHOT_SHARED_TYPES objects in it.
+    memo keeps objects referred to several times shared in the copy. Raises TypeError for a
+    value that cannot be copied rather than sharing it.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)) \
+            or isinstance(value, SNAPSHOT_SHARED_TYPES):
+        return value
+    if id(value) in memo:
+        return memo[id(value)]
+    if isinstance(value, (np.ndarray, np.generic)):
+        result = value.copy()
+    elif isinstance(value, list):
+        result = memo[id(value)] = []
+        result.extend(_copy_state(v, memo) for v in value)
+    elif isinstance(value, dict):
+        # keeps the class and e.g. the default_factory of a defaultdict
+        result = memo[id(value)] = copy.copy(value)
+        result.clear()
+        result.update((_copy_state(k, memo), _copy_state(v, memo)) for k, v in value.items())
+    elif isinstance(value, (tuple, set, frozenset)):
+        items = [_copy_state(v, memo) for v in value]
+        result = type(value)(*items) if hasattr(value, '_fields') else type(value)(items)
+    elif type(value).__module__.startswith('magnum'):
+        # vectors, matrices and quaternions copy construct
+        result = type(value)(value)
+    elif hasattr(value, '__dict__'):
+        result = memo[id(value)] = copy.copy(value)
+        vars(result).update({k: _copy_state(v, memo) for k, v in vars(value).items()})
+    else:
+        try:
+            result = copy.deepcopy(value)
+        except Exception as e:
+            raise TypeError('Cannot snapshot a {}: {}'.format(type(value).__name__, e))
+    memo[id(value)] = result
+    return result
+
+
+def _capture_attrs(obj, memo, keys=None):
+    """
+    Copies of the attributes of obj (only keys if given) for _restore_attrs.
+    """
+    if keys is None:
+        keys = list(vars(obj))
+    return {k: _copy_state(getattr(obj, k), memo) for k in keys}
+
+
+def _restore_attrs(obj, attrs, memo):
+    # copied again so that the snapshot can be restored more than once
+    vars(obj).update(_copy_state(attrs, memo))
+
+
 def add_receptacle(string, skill):
     if 'table_0' in skill[1][0]:
         string += 'table ' + skill[1][0].split('table_0')[1]
@@ -109,14 +201,27 @@ def transform_action_to_natural_language(skill_set):
 
 
 class EBHabEnv(gym.Env):
-    def __init__(self, eval_set='train', exp_name='', down_sample_ratio=1.0, start_epi_index=0, resolution=500, recording=False):
+    def __init__(self, eval_set='train', exp_name='', down_sample_ratio=1.0, start_epi_index=0, resolution=500, recording=False,
+                 video_fps=30, video_frame_stride=1, render_profile='full', language_only=False, num_shards=1, shard_id=0):
         """
         Initialize the HabitatRearrange environment.
+
+        The episodes (the first down_sample_ratio of the dataset) are split into num_shards shards of
+        whole scenes, of which shard_id is played, grouped by scene so each scene is loaded once.
+        Outputs are named after the episodes' position in the dataset, see episode_num.
+
+        With render_profile 'light', the third person camera is only created when recording, and
+        save_image writes the head camera without compositing. A language only run creates no
+        camera at all (and no renderer unless recording), save_image then returns None.
         """
         # load config
         hydra.core.global_hydra.GlobalHydra.instance().clear()
         self.config = habitat.get_config(HABITAT_CONFIG_PATH)
-        _add_sim_sensor_to_config(self.config, ThirdRGBSensorConfig())
+        assert render_profile in RenderProfiles
+        self.render_profile = render_profile
+        # the third person camera is only used by the video recorder
+        if render_profile == 'full' or recording:
+            _add_sim_sensor_to_config(self.config, ThirdRGBSensorConfig())
         # set the dataset
         assert eval_set in ValidEvalSets
         OmegaConf.set_readonly(self.config, False)
@@ -124,24 +229,44 @@ class EBHabEnv(gym.Env):
         self.config.habitat.simulator.agents.main_agent.sim_sensors.head_rgb_sensor.height = resolution
         self.config.habitat.simulator.agents.main_agent.sim_sensors.head_rgb_sensor.width = resolution
         self.resolution = resolution
+        # whether save_image has a head camera image to save
+        self.has_head_rgb = not (render_profile == 'light' and language_only)
+        if not self.has_head_rgb:
+            with habitat.config.read_write(self.config):
+                del self.config.habitat.simulator.agents.main_agent.sim_sensors['head_rgb_sensor']
+                self.config.habitat.gym.obs_keys = [k for k in self.config.habitat.gym.obs_keys if k != 'head_rgb']
+                if not recording:
+                    self.config.habitat.simulator.create_renderer = False
+                    self.config.habitat.simulator.renderer.composite_files = []
 
         # modify config path to ease data loading
         self.dataset = make_dataset(self.config.habitat.dataset.type, config=self.config.habitat.dataset)
 
+        # Episode tracking
+        self.down_sample_ratio = down_sample_ratio
+        num_episodes = math.ceil(len(self.dataset.episodes) * down_sample_ratio)
+        # dataset index of every episode of this shard, in the order they are played
+        self._episode_order = shard_episodes_by_scene(
+            self.dataset.episode_scene_ids[:num_episodes], num_shards)[shard_id]
+        self.number_of_episodes = len(self._episode_order)
+        # the skipped episodes are never loaded
+        self._first_episode_num = min(max(start_epi_index, 0), self.number_of_episodes)
+        self.dataset.set_episode_order(self._episode_order[self._first_episode_num:])
+        # the habitat env plays the dataset as it is
+        iterator_options = self.config.habitat.environment.iterator_options
+        iterator_options.shuffle = False
+        iterator_options.group_by_scene = False
+        iterator_options.max_scene_repeat_steps = -1
+
         # initilaize env
         self.env = habitat.gym.make_gym_from_config(self.config, self.dataset)
         self.observation_space = self.env.observation_space
         # action of LanguageRearangeEnv is discrete value from 0 to 69
         self.action_space = self.env.action_space
 
-        # Episode tracking
-        self.down_sample_ratio = down_sample_ratio
-        self.number_of_episodes = self.env.number_of_episodes * down_sample_ratio
         self._reset = False
-        self._current_episode_num = 0 
-        while start_epi_index >= 1 and self._current_episode_num < start_epi_index:
-            self.env.reset(return_info=False)
-            self._current_episode_num += 1
+        self._current_episode_num = self._first_episode_num
+        self.episode_index = None
 
         self._current_step = 0
         self._max_episode_steps = 30
@@ -155,31 +280,46 @@ class EBHabEnv(gym.Env):
         # init instruction and skill sets
         self.episode_language_instruction = ''
         self.episode_data = None
-        self.skill_set = self.env.env.env._env.task.actions['pddl_hl_action']._action_datas
-        self.language_skill_set = transform_action_to_natural_language(self.skill_set)
+        pddl_hl_action = self.env.env.env._env.task.actions['pddl_hl_action']
+        self.skill_set = pddl_hl_action._action_datas
+        self.language_skill_set = get_action_language(
+            pddl_hl_action.action_space_key, self.skill_set, transform_action_to_natural_language)
 
         # env feedback and image save
         # feedback verbosity, 0: concise, 1: verbose
         self.feedback_verbosity = 1
         self.log_path = 'running/eb_habitat/{}'.format(exp_name)
-        # video recorder
+        # saves images in the background when set, see evaluator.episode_runner.ImageWriter
+        self.image_writer = None
+        # video recorder, encodes each episode while it runs
         self.recording = recording
-        self.episode_video = []
+        self.video_fps = video_fps
+        self.video_frame_stride = video_frame_stride
+        self.video_writer = None
+        self._last_obs = None
         
     def current_episode(self, all_info: bool = False):
         return self.env.current_episode(all_info)
 
+    @property
+    def episode_num(self):
+        """
+        1-based position of the current episode in the dataset, used in the output file names.
+        """
+        return self.episode_index + 1
+
 
     def reset(self, **kwargs):
         """
         Reset the environment for a new episode. The env will iterate over all the task data from the dataset
         Returns: observation
         """
-        assert self._current_episode_num <= self.number_of_episodes
+        assert self._current_episode_num < self.number_of_episodes
         obs, info = self.env.reset(return_info=True, **kwargs)
         logger.info('Episode {}: {}'.format(str(self._current_episode_num), str(self.current_episode())))
         self.episode_language_instruction = info['lang_goal']
-        self.episode_data = self.dataset.episodes[self._current_episode_num]
+        self.episode_data = self.dataset.episodes[self._current_episode_num - self._first_episode_num]
+        self.episode_index = self._episode_order[self._current_episode_num]
         self._current_step = 0
         self._cur_invalid_actions = 0
         self._current_episode_num += 1
@@ -187,8 +327,16 @@ class EBHabEnv(gym.Env):
         self._reset = True
         self.episode_log = []
         if self.recording:
-            self.episode_video = []
+            self._discard_video()
+            folder = self.log_path + '/video'
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            # renamed with the number of steps once the episode is saved
+            self.video_writer = VideoStreamWriter(
+                os.path.join(folder, 'video_episode_{}_partial.mp4'.format(self.episode_num)),
+                fps=self.video_fps, frame_stride=self.video_frame_stride)
         self._episode_start_time = time.time()
+        self._last_obs = obs
         return obs
 
     def get_env_feedback(self, info):
@@ -255,8 +403,8 @@ class EBHabEnv(gym.Env):
         assert self._reset, 'Reset env before stepping'
         self._current_step += 1
         obs, reward, done, info = self.env.step(action, **kwargs)
-        if self.recording:
-            self.episode_video.append(self.env.render("rgb_array"))
+        if self.video_writer is not None:
+            self.video_writer.append(self.env.render("rgb_array"))
 
         if info['was_prev_action_invalid']:
             self._cur_invalid_actions += 1
@@ -287,41 +435,112 @@ class EBHabEnv(gym.Env):
             }
         
         self.episode_log.append(info)
+        self._last_obs = obs
         return obs, reward, done, info
 
+    def snapshot(self):
+        """
+        Captures the current state of the episode in memory, so that restore can branch from it
+        later, e.g. to try several plans from the same step without replaying the actions before it.
+        Saves the simulator state (poses, joint states and the held object), deep copies of the
+        state of the PDDL task, its actions and measures, the step counters and the last
+        observation. Only the SNAPSHOT_SHARED_TYPES objects are shared with the running episode.
+        """
+        assert self._reset, 'Reset env before taking a snapshot'
+        habitat_env = self.env.unwrapped._env
+        task = habitat_env.task
+        memo = {}
+        return {
+            'episode_id': self.current_episode().episode_id,
+            # fresh transforms and joint states, not views of the simulator
+            'sim': habitat_env.sim.capture_state(with_articulated_agent_js=True),
+            'habitat_env': _capture_attrs(habitat_env, memo, SNAPSHOT_HABITAT_ENV_KEYS),
+            'task': _capture_attrs(task, memo),
+            'task_actions': {name: _capture_attrs(action, memo) for name, action in task.actions.items()},
+            'measures': {name: _capture_attrs(measure, memo) for name, measure in task.measurements.measures.items()},
+            'env': _capture_attrs(self, memo, SNAPSHOT_ENV_KEYS),
+            'gym_last_obs': _copy_state(self._hab_gym_wrapper()._last_obs, memo),
+        }
+
+    def restore(self, snapshot):
+        """
+        Returns the episode to the state of a snapshot taken earlier in the same episode, and the
+        observation of that state. A recorded video keeps the frames of the abandoned branch.
+        """
+        assert self._reset, 'Reset env before restoring a snapshot'
+        assert snapshot['episode_id'] == self.current_episode().episode_id, \
+            'Snapshots can only be restored in the episode they were taken in'
+        habitat_env = self.env.unwrapped._env
+        task = habitat_env.task
+        habitat_env.sim.set_state(snapshot['sim'], set_hold=True)
+        memo = {}
+        _restore_attrs(habitat_env, snapshot['habitat_env'], memo)
+        _restore_attrs(task, snapshot['task'], memo)
+        for name, attrs in snapshot['task_actions'].items():
+            _restore_attrs(task.actions[name], attrs, memo)
+        for name, attrs in snapshot['measures'].items():
+            _restore_attrs(task.measurements.measures[name], attrs, memo)
+        _restore_attrs(self, snapshot['env'], memo)
+
+        # render the restored state rather than the last step of the abandoned branch
+        self._hab_gym_wrapper()._last_obs = _copy_state(snapshot['gym_last_obs'], memo)
+        return self._last_obs
+
+    def _hab_gym_wrapper(self):
+        wrapper = self.env
+        while not isinstance(wrapper, HabGymWrapper):
+            wrapper = wrapper.env
+        return wrapper
+
     def seed(self, seed=None):
         self.env.seed(seed)
 
     def save_image(self, obs, key='head_rgb'):
         """Save current agent observation as a PNG image."""
-        folder = self.log_path + '/images/episode_{}'.format(self._current_episode_num)
+        if not self.has_head_rgb:
+            return None
+        folder = self.log_path + '/images/episode_{}'.format(self.episode_num)
         if not os.path.exists(folder):
             os.makedirs(folder)
-        img = Image.fromarray(observations_to_image(obs, key))
+        if self.render_profile == 'light' and key in obs:
+            img = Image.fromarray(process_image_array(obs[key]))
+        else:
+            img = Image.fromarray(observations_to_image(obs, key))
         # time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-        image_path = os.path.join(folder, 'episode_{}_step_{}.png'.format(self._current_episode_num, self._current_step)) #, time_stamp))
-        img.save(image_path)
+        image_path = os.path.join(folder, 'episode_{}_step_{}.png'.format(self.episode_num, self._current_step)) #, time_stamp))
+        if self.image_writer is not None:
+            self.image_writer.save(img, image_path)
+        else:
+            img.save(image_path)
         return image_path
 
     def save_episode_log(self):
         if not os.path.exists(self.log_path):
             os.makedirs(self.log_path)
         # time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-        filename = 'episode_{}_step_{}.json'.format(self._current_episode_num, self._current_step) #, time_stamp)
+        filename = 'episode_{}_step_{}.json'.format(self.episode_num, self._current_step) #, time_stamp)
         if len(self.episode_log):
             with open(os.path.join(self.log_path, filename), 'w', encoding='utf-8') as f:
                 for item in self.episode_log:
                     json.dump(item, f, ensure_ascii=False)
                     f.write('\n')  
         
-        if len(self.episode_video):
-            folder = self.log_path + '/video'
-            if not os.path.exists(folder):
-                os.makedirs(folder)
-            video_writer = imageio.get_writer(os.path.join(folder, 'video_episode_{}_steps_{}.mp4'.format(self._current_episode_num, self._current_step)), fps=30)
-            for data in self.episode_video:
-                video_writer.append_data(data)
-            video_writer.close()
+        if self.video_writer is not None:
+            video_writer, self.video_writer = self.video_writer, None
+            if video_writer.close():
+                os.replace(video_writer.path, os.path.join(
+                    self.log_path, 'video', 'video_episode_{}_steps_{}.mp4'.format(self.episode_num, self._current_step)))
+
+    def _discard_video(self):
+        # the recording of an episode that was not saved
+        if self.video_writer is not None:
+            video_writer, self.video_writer = self.video_writer, None
+            try:
+                video_writer.close()
+            except RuntimeError as e:
+                logger.warning(str(e))
+            if os.path.exists(video_writer.path):
+                os.remove(video_writer.path)
 
 
 
@@ -330,6 +549,7 @@ class EBHabEnv(gym.Env):
 
     def close(self) -> None:
         """Terminate the environment."""
+        self._discard_video()
         self.env.close()
 
 
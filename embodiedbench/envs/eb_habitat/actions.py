@@ -13,7 +13,7 @@ from habitat.tasks.rearrange.actions.grip_actions import (
     SuctionGraspAction)
 from habitat.tasks.rearrange.rearrange_sim import RearrangeSim
 
-from embodiedbench.envs.eb_habitat.utils import get_allowed_actions
+from embodiedbench.envs.eb_habitat.utils import get_allowed_action_datas
 
 
 @registry.register_task_action
@@ -134,13 +134,11 @@ class KinematicArmEEAction(ArticulatedAgentAction):
 @registry.register_task_action
 class PddlHlAction(ArticulatedAgentAction):
     def __init__(self, *args, config, task, **kwargs):
-        actions = get_allowed_actions(task.pddl_problem, config.allowed_actions)
-
-        self._action_datas = []
-        for action in actions:
-            self._action_datas.append(
-                (action.name, [p.name for p in action.param_values])
-            )
+        # Grounding every action over every entity is slow, the result is
+        # cached on disk by the action space.
+        self.action_space_key, self._action_datas = get_allowed_action_datas(
+            task.pddl_problem, config.allowed_actions
+        )
         super().__init__(*args, config=config, task=task, **kwargs)
 
     @property
@@ -2,6 +2,7 @@
 # For licensing see accompanying LICENSE file.
 # Copyright (C) 2024 Apple Inc. All Rights Reserved.
 #
+import contextlib
 import gzip
 import os
 import os.path as osp
@@ -9,7 +10,6 @@ import pickle
 import random
 from collections import defaultdict
 from dataclasses import dataclass, field
-from threading import Thread
 from typing import TYPE_CHECKING, Any, Dict, List
 
 import numpy as np
@@ -32,6 +32,7 @@ from generator import (LangRearrangeEpisodeGenerator,
                                      generate_all_instructions,
                                      get_flat_eps_split)
 from utils import get_category_info
+from work_queue import run_work_queue
 from ..utils import get_parser
 
 
@@ -41,20 +42,37 @@ class LangEpisodeGeneratorConfig(RearrangeEpisodeGeneratorConfig):
     recep_cat_groups: Dict[str, Any] = field(default_factory=dict)
 
 
-def generate_episodes(args, cfg, conn, iter_eps, proc_idx):
-    with LangRearrangeEpisodeGenerator(
-        cfg=cfg,
-        instruct_path=args.instruct_path,
-        iter_eps=iter_eps,
-        debug_visualization=args.debug,
-        limit_scene_set=args.limit_scene_set,
-        proc_idx=proc_idx,
-    ) as ep_gen:
-        if not osp.isdir(args.db_output):
-            os.makedirs(args.db_output)
-        ep_gen.vdb.output_path = osp.abspath(args.db_output)
-        conn.send(ep_gen.generate_episodes(args.num_episodes, args.verbose))
-        conn.close()
+def generate_episodes(worker_idx, args, cfg, procs_per_gpu, batches):
+    """
+    Work queue worker. A batch is a slice of the episode plan of one split
+    (`proc_idx`, which also fixes the scene). The generator is only rebuilt
+    when the split changes.
+    """
+
+    use_cfg = cfg.copy()
+    use_cfg.gpu_device_id = worker_idx // procs_per_gpu
+    cur_split = None
+    with contextlib.ExitStack() as stack:
+        for key, (split_idx, iter_eps) in batches:
+            if split_idx != cur_split:
+                stack.close()
+                ep_gen = stack.enter_context(
+                    LangRearrangeEpisodeGenerator(
+                        cfg=use_cfg,
+                        instruct_path=args.instruct_path,
+                        iter_eps=iter_eps,
+                        debug_visualization=args.debug,
+                        limit_scene_set=args.limit_scene_set,
+                        proc_idx=split_idx,
+                    )
+                )
+                if not osp.isdir(args.db_output):
+                    os.makedirs(args.db_output)
+                ep_gen.vdb.output_path = osp.abspath(args.db_output)
+                cur_split = split_idx
+            else:
+                ep_gen.set_iter_eps(iter_eps)
+            yield key, ep_gen.generate_episodes(len(iter_eps), args.verbose)
 
 
 def summarize_episodes(episodes, show_examples=False, tokenizer_name=None):
@@ -182,13 +200,12 @@ def start(args):
     for k in ep_keys:
         rng.shuffle(all_eps[k])
 
-    proc_infos = []
     to_gen_distinct_instructs = defaultdict(lambda: [set(), 0])
 
+    # Each of the `n_procs` splits is cut into batches that any worker can
+    # pick up. Keys are stable for the same seed so `--resume` can skip them.
+    batches = []
     for i in range(args.n_procs):
-        use_cfg = cfg.copy()
-        use_cfg.gpu_device_id = i // procs_per_gpu
-        parent_conn, child_conn = mp_ctx.Pipe()
         iter_eps = get_flat_eps_split(
             all_eps,
             i,
@@ -201,20 +218,10 @@ def start(args):
         for ep in iter_eps:
             to_gen_distinct_instructs[ep.instruct_info.instruct_id][0].add(ep.instruct)
             to_gen_distinct_instructs[ep.instruct_info.instruct_id][1] += 1
-
-        if args.proc_debug:
-            p = Thread(
-                target=generate_episodes,
-                args=(args, use_cfg, child_conn, iter_eps, i),
+        for batch_start in range(0, len(iter_eps), args.batch_size):
+            batches.append(
+                ((i, batch_start), (i, iter_eps[batch_start : batch_start + args.batch_size]))
             )
-        else:
-            p = mp_ctx.Process(
-                target=generate_episodes,
-                args=(args, use_cfg, child_conn, iter_eps, i),
-            )
-        print(f"Starting worker {i}")
-        p.start()
-        proc_infos.append((parent_conn, p))
 
     total_distinct = sum(len(x[0]) for x in to_gen_distinct_instructs.values())
     total_instructs = sum(x[1] for x in to_gen_distinct_instructs.values())
@@ -223,28 +230,27 @@ def start(args):
         print(f"    {k}: {len(v[0])} distinct, {v[1]} total")
     print()
 
-    not_collected = list(range((len(proc_infos))))
-    for i, (conn, proc) in enumerate(proc_infos):
-        try:
-            result = conn.recv()
-        except EOFError as e:
-            logger.warning(f"Problem in worker {i}. Could not generate any episodes.")
-            continue
-        proc.join()
+    results = run_work_queue(
+        generate_episodes,
+        (args, cfg, procs_per_gpu),
+        batches,
+        args.n_procs,
+        checkpoint_path=args.out + ".ckpt",
+        resume=args.resume,
+        proc_debug=args.proc_debug,
+    )
+
+    for key, (_, iter_eps) in batches:
+        result = results.get(key)
         if result is None:
-            print("Result is none skipping")
+            logger.warning(f"Problem in batch {key}. Could not generate any episodes.")
             continue
-        n_eps_collected = len(result)
-        not_collected.pop(not_collected.index(i))
-        print(
-            f"Collected {n_eps_collected} episodes from worker {i}. Waiting for {not_collected}"
-        )
         dataset.episodes.extend(result)
-        if n_eps_collected != args.num_episodes:
+        if len(result) != len(iter_eps):
             logger.warning(
-                f"Problem collecting episodes from worker {i}. Expected {args.num_episodes}, got {n_eps_collected}"
+                f"Problem collecting episodes from batch {key}. Expected {len(iter_eps)}, got {len(result)}"
             )
-        print("Done extending episodes list.")
+    print("Done extending episodes list.")
     print("Summarizing the episodes")
     summarize_episodes(dataset.episodes)
 
@@ -288,6 +294,17 @@ if __name__ == "__main__":
         help="The maximum number of instruction allowed per instruction type.",
     )
     parser.add_argument("--proc-debug", action="store_true")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10,
+        help="Episodes per work queue batch.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the batches already generated in <out>.ckpt.",
+    )
     parser.add_argument(
         "--instruct-dir", default="interactive_and_embodied/projects/llarp/instructs"
     )
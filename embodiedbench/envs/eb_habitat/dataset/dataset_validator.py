@@ -4,13 +4,14 @@
 #
 import argparse
 import gzip
+import heapq
+import itertools
 import os.path as osp
 import pickle
 import time
 from collections import defaultdict, deque
 from dataclasses import dataclass
-from threading import Thread
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
 import habitat
 import magnum as mn
@@ -18,11 +19,11 @@ import numpy as np
 import torch
 from habitat.dataset import make_dataset
 from habitat.tasks.rearrange.multi_task.pddl_action import PddlAction
+from habitat.tasks.rearrange.multi_task.pddl_logical_expr import LogicalExprType
 from habitat.tasks.rearrange.multi_task.pddl_predicate import Predicate
 from habitat.tasks.rearrange.multi_task.rearrange_pddl import (
     PddlEntity, SimulatorObjectType)
 from PIL import Image
-from torch import multiprocessing as mp
 from tqdm import tqdm
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, T5Model
 
@@ -34,6 +35,7 @@ import dataset
 from create_episodes import summarize_episodes
 from utils import get_instruct_data
 from utils import PLACABLE_RECEP_TYPE, get_allowed_actions
+from work_queue import run_work_queue
 
 RECEP_ACTIONS = [
     "open_fridge",
@@ -53,6 +55,11 @@ ALLOWED_ACTIONS = ["nav", "pick", "place", *RECEP_ACTIONS]
 SEARCH_DEPTH_TIMEOUT = 15
 LOG_INTERVAL = 20
 
+# "sim": BFS that steps the simulator for every expanded node.
+# "symbolic": BFS over predicate sets, the simulator only replays the found plan.
+# "astar": like "symbolic", ordered by the number of unsatisfied goal predicates.
+SEARCH_MODES = ["sim", "symbolic", "astar"]
+
 
 def stack_obs(obs: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
     ks = obs[0].keys()
@@ -91,6 +98,15 @@ class SearchNode:
     obs: Dict[str, np.ndarray]
 
 
+@dataclass(frozen=True)
+class SymbolicNode:
+    pred_state: List[Predicate]
+    pred_keys: FrozenSet[str]
+    prev_action: PddlAction
+    parent: "SymbolicNode"
+    depth: int
+
+
 @dataclass
 class EpisodeInfo:
     actions: np.ndarray
@@ -105,6 +121,22 @@ def find_action(search, all_actions):
     return None
 
 
+def count_unsatisfied(expr, pred_keys) -> int:
+    """
+    Number of goal predicates still missing from `pred_keys`, taking the
+    cheapest branch of OR expressions. Negated expressions count as 0.
+    """
+
+    if isinstance(expr, Predicate):
+        return 0 if expr.compact_str in pred_keys else 1
+    counts = [count_unsatisfied(sub_expr, pred_keys) for sub_expr in expr.sub_exprs]
+    if expr.expr_type == LogicalExprType.AND:
+        return sum(counts)
+    if expr.expr_type == LogicalExprType.OR:
+        return min(counts, default=0)
+    return 0
+
+
 def extract_entities(expr):
     if isinstance(expr, Predicate):
         return set(expr._arg_values)
@@ -139,7 +171,11 @@ def get_obs(env):
 
 
 class DataValidator:
-    def __init__(self):
+    def __init__(self, search_mode: str = "sim"):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {search_mode}")
+        self._search_mode = search_mode
+        self._search_fallbacks = defaultdict(int)
         self._bad_ep_ids = []
         self._good_idxs = []
         self._bad_causes = defaultdict(int)
@@ -187,39 +223,46 @@ class DataValidator:
             else:
                 yield action
 
-    def _get_preds(self):
+    def _is_tracked_pred(self, pred) -> bool:
+        """
+        If the predicate is part of the search state.
+        """
+
         recep_type = self._pddl.expr_types[
             SimulatorObjectType.ARTICULATED_RECEPTACLE_ENTITY.value
         ]
-        new_preds = self._pddl.get_true_predicates()
-        ret_preds = []
-        for pred in new_preds:
-            if pred.name not in self._core_preds:
-                continue
-
-            if pred.name == "on_top":
-                obj_entity = pred._arg_values[0]
-                if obj_entity not in self._relevant_entities:
-                    continue
+        if pred.name not in self._core_preds:
+            return False
+
+        if pred.name == "on_top":
+            obj_entity = pred._arg_values[0]
+            if obj_entity not in self._relevant_entities:
+                return False
+
+        # Ignore the object in robot_at if it is not of interest
+        if (
+            pred.name in ["robot_at", "robot_at_obj"]
+            and pred._arg_values[0].expr_type.parent.name
+            == SimulatorObjectType.MOVABLE_ENTITY.value
+            and pred._arg_values[0] not in self._relevant_entities
+        ):
+            return False
+
+        if (
+            pred.name in ["robot_at", "robot_at_obj"]
+            and pred._arg_values[0].expr_type.is_subtype_of(recep_type)
+            and not self._has_recep_entity
+        ):
+            return False
+
+        return True
 
-            # Ignore the object in robot_at if it is not of interest
-            if (
-                pred.name in ["robot_at", "robot_at_obj"]
-                and pred._arg_values[0].expr_type.parent.name
-                == SimulatorObjectType.MOVABLE_ENTITY.value
-                and pred._arg_values[0] not in self._relevant_entities
-            ):
-                continue
-
-            if (
-                pred.name in ["robot_at", "robot_at_obj"]
-                and pred._arg_values[0].expr_type.is_subtype_of(recep_type)
-                and not self._has_recep_entity
-            ):
-                continue
-
-            ret_preds.append(pred)
-        return ret_preds
+    def _get_preds(self):
+        return [
+            pred
+            for pred in self._pddl.get_true_predicates()
+            if self._is_tracked_pred(pred)
+        ]
 
     def _setup_core_preds(self):
         recep_type = self._pddl.expr_types[
@@ -264,6 +307,188 @@ class DataValidator:
             ret_acs = [ac for ac in self._all_actions if ac.name != "place"]
         return ret_acs
 
+    def _make_pred(self, name, args):
+        """
+        Grounds predicate `name` with `args`. Returns None if the argument
+        types don't match.
+        """
+
+        if not self._pddl.predicates[name].are_args_compatible(args):
+            return None
+        return self._pddl.parse_predicate(
+            f"{name}({','.join(x.name for x in args)})", {x.name: x for x in args}
+        )
+
+    @staticmethod
+    def _bound_post_conds(action: PddlAction) -> List[Predicate]:
+        """
+        The post conditions `action.apply` would set, with the quantifier
+        entities bound from the last precondition check.
+        """
+
+        post_conds = action.post_cond
+        if action._post_cond_search is not None:
+            for sat, assign in zip(
+                action.precond.prev_truth_vals, action._post_cond_search
+            ):
+                if sat is not None and sat:
+                    return [p.clone().sub_in(assign) for p in post_conds]
+            return []
+        return post_conds
+
+    def _apply_symbolic(self, pred_state, action: PddlAction) -> List[Predicate]:
+        """
+        Applies the effects of `action` to the predicate set. The domain only
+        lists the added predicates, the predicates they cancel (and the ones
+        implied by robot placement) are filled in here. Must be called right
+        after `action.is_precond_satisfied_from_predicates(pred_state)`.
+        """
+
+        preds = {pred.compact_str: pred for pred in pred_state}
+
+        def drop(should_drop):
+            for k in [k for k, pred in preds.items() if should_drop(pred)]:
+                del preds[k]
+
+        def add(pred):
+            if pred is not None and self._is_tracked_pred(pred):
+                preds[pred.compact_str] = pred
+
+        for post_cond in self._bound_post_conds(action):
+            args = post_cond._arg_values
+            if post_cond.name == "holding":
+                # Picking the object lifts it off of its receptacle.
+                drop(
+                    lambda p: p.name == "not_holding"
+                    or (p.name in ["on_top", "in"] and p._arg_values[0] == args[0])
+                )
+                add(post_cond)
+            elif post_cond.name == "not_holding":
+                drop(lambda p: p.name == "holding")
+                add(post_cond)
+            elif post_cond.name == "at":
+                # Placed objects are tracked through `on_top`.
+                add(self._make_pred("on_top", args))
+            elif post_cond.name == "robot_at_closest":
+                target = args[0]
+                held = [p._arg_values[0] for p in preds.values() if p.name == "holding"]
+                drop(
+                    lambda p: p.name == "robot_at"
+                    or (p.name == "robot_at_obj" and p._arg_values[0] not in held)
+                )
+                add(self._make_pred("robot_at", [target]))
+                # Objects on or in the target are now in reach.
+                for p in list(preds.values()):
+                    if p.name in ["on_top", "in"] and p._arg_values[1] == target:
+                        add(self._make_pred("robot_at_obj", [p._arg_values[0]]))
+            elif post_cond.name.startswith(("opened_", "closed_")):
+                state, recep_kind = post_cond.name.split("_", 1)
+                other = "closed" if state == "opened" else "opened"
+                drop(
+                    lambda p: p.name == f"{other}_{recep_kind}"
+                    and p._arg_values == args
+                )
+                add(post_cond)
+            else:
+                add(post_cond)
+        return list(preds.values())
+
+    def _search_symbolic(self, goal_expr, start_preds) -> Optional[List[PddlAction]]:
+        """
+        BFS (or A* in "astar" mode) over predicate sets from `start_preds` to
+        `goal_expr` without touching the simulator. Returns the action
+        sequence or None if no plan was found within the depth limit.
+        """
+
+        def heuristic(pred_keys):
+            if self._search_mode != "astar":
+                return 0
+            return count_unsatisfied(goal_expr, pred_keys)
+
+        start_keys = frozenset(p.compact_str for p in start_preds)
+        tie_break = itertools.count()
+        Q = [(heuristic(start_keys), next(tie_break), SymbolicNode(start_preds, start_keys, None, None, 0))]
+        visited = set([start_keys])
+
+        goal_node = None
+        while len(Q) != 0 and goal_node is None:
+            _, _, node = heapq.heappop(Q)
+            if node.depth >= SEARCH_DEPTH_TIMEOUT:
+                continue
+
+            for action in self._get_cur_actions(node):
+                if not action.is_precond_satisfied_from_predicates(node.pred_state):
+                    continue
+                new_preds = self._apply_symbolic(node.pred_state, action)
+                new_keys = frozenset(p.compact_str for p in new_preds)
+                new_node = SymbolicNode(new_preds, new_keys, action, node, node.depth + 1)
+
+                if goal_expr.is_true_from_predicates(new_preds):
+                    goal_node = new_node
+                    break
+
+                if new_keys not in visited:
+                    visited.add(new_keys)
+                    heapq.heappush(
+                        Q, (new_node.depth + heuristic(new_keys), next(tie_break), new_node)
+                    )
+
+        if goal_node is None:
+            return None
+        plan = []
+        node = goal_node
+        while node.prev_action is not None:
+            plan.insert(0, node.prev_action)
+            node = node.parent
+        return plan
+
+    def _rollout(self, env, ordered_actions, use_actions, goal_expr, start_preds, start_obs):
+        """
+        Executes `use_actions` in the simulator from its current state,
+        recording the predicate subgoals and observations along the way.
+
+        Returns None if the episode is bad.
+        """
+
+        sim_info = self._pddl.sim_info
+        pred_state = start_preds
+        pred_subgoals = []
+        all_obs = [start_obs]
+
+        for action in use_actions:
+            if not action.is_precond_satisfied_from_predicates(pred_state):
+                return None, "Couldn't apply action"
+
+            action.apply(sim_info)
+
+            pred_state = self._get_preds()
+
+            all_obs.append({k: np.copy(v) for k, v in get_obs(env).items()})
+
+            subgoal_preds = [
+                pred_to_str(pred) for pred in pred_state if pred not in start_preds
+            ]
+            if len(subgoal_preds) != 0:
+                pred_subgoals.append(subgoal_preds)
+
+        if not goal_expr.is_true_from_predicates(pred_state):
+            return None, "Solution didn't satisfy goal"
+
+        all_obs = stack_obs(all_obs)
+
+        head_rgb = all_obs["head_rgb"]
+        sums = head_rgb.reshape(head_rgb.shape[0], -1).sum(1)
+        if np.all(sums == sums[0]) and len(use_actions) > 2:
+            print(f"Got static demo", use_actions)
+            # If the demo consists of only the same observation, there is a problem.
+            return None, "static_demo"
+        action_idxs = [ordered_actions.index(ac.compact_str) for ac in use_actions]
+
+        return (
+            EpisodeInfo(np.array(action_idxs), pred_subgoals, all_obs),
+            "good_episode",
+        )
+
     def _compute_subgoals(self, env, ordered_actions):
         """
         Performs BFS to find a path from the start to the predicate goal state.
@@ -313,6 +538,20 @@ class DataValidator:
 
         start_state = sim.capture_state()
 
+        if self._search_mode != "sim":
+            plan = self._search_symbolic(goal_expr, start_preds)
+            if plan is not None:
+                ep_info, msg = self._rollout(
+                    env, ordered_actions, plan, goal_expr, start_preds, start_obs
+                )
+                sim.set_state(start_state)
+                if ep_info is not None or msg == "static_demo":
+                    return ep_info, msg
+                self._search_fallbacks[f"plan failed: {msg}"] += 1
+            else:
+                self._search_fallbacks["no symbolic plan"] += 1
+            # The symbolic effects missed something, search in the simulator.
+
         Q = deque([SearchNode(start_preds, None, None, start_state, 0, start_obs)])
         visited = set([get_pred_hash(start_preds)])
 
@@ -399,6 +638,10 @@ class DataValidator:
         print(f"Bad/Good episodes: {len(self._bad_ep_ids)}/{len(self._good_idxs)}")
         for k, v in self._bad_causes.items():
             print(f"{k}: {v}")
+        if self._search_mode != "sim":
+            print("Simulator search fallbacks:")
+            for k, v in self._search_fallbacks.items():
+                print(f"{k}: {v}")
         all_instruct_ks = list(
             set(list(self._bad_lang_ids.keys()) + list(self._good_lang_ids.keys()))
         )
@@ -431,43 +674,9 @@ class DataValidator:
             use_actions.append(all_actions[all_action_strs.index(sol_entry)])
 
         start_preds = self._get_preds()
-        pred_state = start_preds
-        pred_subgoals = []
-        all_obs = [{k: np.copy(v) for k, v in get_obs(env).items()}]
-
-        for action in use_actions:
-            if not action.is_precond_satisfied_from_predicates(pred_state):
-                return None, "Couldn't apply action"
-
-            # Set sim state to capture the observation
-            action.apply(sim_info)
-
-            pred_state = self._get_preds()
-
-            all_obs.append({k: np.copy(v) for k, v in get_obs(env).items()})
-
-            subgoal_preds = [
-                pred_to_str(pred) for pred in pred_state if pred not in start_preds
-            ]
-            if len(subgoal_preds) != 0:
-                pred_subgoals.append(subgoal_preds)
-
-        if not goal_expr.is_true_from_predicates(pred_state):
-            return None, "Solution didn't satisfy goal"
-
-        all_obs = stack_obs(all_obs)
-
-        head_rgb = all_obs["head_rgb"]
-        sums = head_rgb.reshape(head_rgb.shape[0], -1).sum(1)
-        if np.all(sums == sums[0]) and len(use_actions) > 2:
-            print(f"Got static demo", use_actions)
-            # If the demo consists of only the same observation, there is a problem.
-            return None, "static_demo"
-        action_idxs = [ordered_actions.index(ac.compact_str) for ac in use_actions]
-
-        return (
-            EpisodeInfo(np.array(action_idxs), pred_subgoals, all_obs),
-            "good_episode",
+        start_obs = {k: np.copy(v) for k, v in get_obs(env).items()}
+        return self._rollout(
+            env, ordered_actions, use_actions, goal_expr, start_preds, start_obs
         )
 
     def validate_eps(self, env):
@@ -538,21 +747,34 @@ class DataValidator:
         return ret_eps
 
 
-def validate_eps(config, eps, conn):
-    dataset = make_dataset(
-        config.habitat.dataset.type, config=config.habitat.dataset, preset_eps=eps
-    )
-    data_validator = DataValidator()
-    with habitat.Env(config=config, dataset=dataset) as env:
-        print("Starting validation")
-        conn.send(data_validator.validate_eps(env))
-    conn.close()
+def validate_eps(worker_idx, config, search_mode, batches):
+    """
+    Work queue worker: validates each batch of episodes with one env.
+    """
+
+    data_validator = DataValidator(search_mode)
+    env = None
+    try:
+        for key, eps in batches:
+            if env is None:
+                dataset = make_dataset(
+                    config.habitat.dataset.type,
+                    config=config.habitat.dataset,
+                    preset_eps=eps,
+                )
+                env = habitat.Env(config=config, dataset=dataset)
+                print(f"Starting validation on worker {worker_idx}")
+            else:
+                env.episodes = eps
+            yield key, data_validator.validate_eps(env)
+    finally:
+        if env is not None:
+            env.close()
 
 
 def start(args):
     config = habitat.get_config(args.cfg, args.opts)
     dataset = make_dataset(config.habitat.dataset.type, config=config.habitat.dataset)
-    split_datasets = []
     eps = dataset.episodes
     if args.limit_count is not None:
         eps = eps[: args.limit_count]
@@ -566,51 +788,31 @@ def start(args):
     if args.only_summarize:
         return
 
-    split_size = len(eps) // args.n_procs
-    for i in range(args.n_procs):
-        split_datasets.append(eps[split_size * i : (i + 1) * split_size])
-
-    proc_infos = []
-    mp_ctx = mp.get_context("forkserver")
+    save_prefix = config.habitat.dataset.data_path.split(".")[0]
 
-    for split_dataset in split_datasets:
-        parent_conn, child_conn = mp_ctx.Pipe()
-        if args.proc_debug:
-            p = Thread(
-                target=validate_eps,
-                args=(config, split_dataset, child_conn),
-            )
-        else:
-            p = mp_ctx.Process(
-                target=validate_eps,
-                args=(config, split_dataset, child_conn),
-            )
-        p.start()
-        proc_infos.append((parent_conn, p))
+    # Keyed by the episode IDs so a resumed run skips the same batches.
+    batches = []
+    for i in range(0, len(eps), args.batch_size):
+        batch_eps = eps[i : i + args.batch_size]
+        batches.append((tuple(ep.episode_id for ep in batch_eps), batch_eps))
+
+    results = run_work_queue(
+        validate_eps,
+        (config, args.search_mode),
+        batches,
+        args.n_procs,
+        checkpoint_path=save_prefix + "_val.ckpt",
+        resume=args.resume,
+        proc_debug=args.proc_debug,
+    )
 
     dataset.episodes = []
-    all_actions = []
-    all_obs = defaultdict(list)
-    all_masks = []
-    all_instructs = []
-
-    orig_ordered_instruct = None
-    for i, (conn, proc) in enumerate(proc_infos):
-        try:
-            ret_eps = conn.recv()
-        except EOFError as e:
-            print(e)
-            print(f"Process {i} crashed")
-            continue
-        dataset.episodes.extend(ret_eps)
-
-        proc.join()
-        print(f"Process {i} finished")
+    for key, _ in batches:
+        if key in results:
+            dataset.episodes.extend(results[key])
 
     summarize_episodes(dataset.episodes)
 
-    save_prefix = config.habitat.dataset.data_path.split(".")[0]
-
     new_ep_path = save_prefix + "_val.pickle"
     num_distinct_instructs = len(set(ep.instruction for ep in dataset.episodes))
     print(
@@ -634,6 +836,18 @@ if __name__ == "__main__":
     parser.add_argument("--n-procs", default=1, type=int)
     parser.add_argument("--proc-debug", action="store_true")
     parser.add_argument("--only-summarize", action="store_true")
+    parser.add_argument("--search-mode", default="sim", choices=SEARCH_MODES)
+    parser.add_argument(
+        "--batch-size",
+        default=8,
+        type=int,
+        help="Episodes per work queue batch.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the batches already validated in <data_path>_val.ckpt.",
+    )
     parser.add_argument(
         "opts",
         default=None,
@@ -4,14 +4,16 @@
 #
 import os
 import json
+import mmap
 import pickle
 import random
+from collections.abc import Sequence
 from itertools import groupby
 from typing import Any, Dict, List, Optional
 
 import attr
 import numpy as np
-from habitat.core.dataset import EpisodeIterator
+from habitat.core.dataset import ALL_SCENES_MASK, EpisodeIterator
 from habitat.core.logging import logger
 from habitat.core.registry import registry
 from habitat.core.utils import DatasetFloatJSONEncoder
@@ -21,6 +23,7 @@ from habitat.datasets.rearrange.rearrange_dataset import (RearrangeDatasetV0,
 from habitat.tasks.rearrange.multi_task.pddl_predicate import Predicate
 
 DEFAULT_PHYSICS_CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../data/default.physics_config.json')
+EPISODE_RECORDS_VERSION = 1
 
 def check_and_gen_physics_config():
     if os.path.exists(DEFAULT_PHYSICS_CONFIG_PATH):
@@ -52,6 +55,142 @@ class LangRearrangeEpisode(RearrangeEpisode):
     subgoals: List[List[str]] = None
 
 
+class EpisodeRecords(Sequence):
+    """
+    Episodes of a dataset pickle, materialized on access.
+
+    The episodes are stored one pickle record each in `<dataset>.episodes`,
+    which is memory mapped, so processes reading the same dataset share its
+    pages. `<dataset>.episodes.index.json` holds the byte range and scene of
+    every record. Both are (re)built from the dataset pickle when missing or
+    older than it.
+
+    A view (`view`, slicing) shares the records and only has its own order.
+    """
+
+    def __init__(self, path: str, order: Optional[List[int]] = None) -> None:
+        with open(path + ".index.json") as f:
+            index = json.load(f)
+        self._init(path, index, order)
+
+    def _init(self, path, index, order):
+        self.path = path
+        self.index = index
+        self._entries = index["entries"]
+        self._order = list(range(len(self._entries))) if order is None else list(order)
+        self._file = open(path, "rb")
+        # an empty file cannot be mapped
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(path) > 0
+            else b""
+        )
+
+    @classmethod
+    def open(cls, dataset_path: str, rebuild: bool = False) -> "EpisodeRecords":
+        path = os.path.splitext(dataset_path)[0] + ".episodes"
+        if not rebuild and os.path.exists(path + ".index.json"):
+            records = cls(path)
+            if records.index.get("version") == EPISODE_RECORDS_VERSION and records.index.get(
+                "source_mtime"
+            ) == os.path.getmtime(dataset_path):
+                return records
+            records.close()
+        cls.build(dataset_path, path)
+        return cls(path)
+
+    @staticmethod
+    def build(dataset_path: str, path: str) -> None:
+        logger.info(f"Writing episode records of {dataset_path} to {path}")
+        with open(dataset_path, "rb") as f:
+            data_dict = pickle.load(f)
+        entries = []
+        offset = 0
+        tmp_suffix = f".tmp{os.getpid()}"
+        with open(path + tmp_suffix, "wb") as f:
+            for ep in LangRearrangeDatasetV0.decode_binary_eps(data_dict):
+                record = pickle.dumps(ep, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(record)
+                entries.append([offset, len(record), ep["scene_id"]])
+                offset += len(record)
+        index = {
+            "version": EPISODE_RECORDS_VERSION,
+            "source_mtime": os.path.getmtime(dataset_path),
+            "entries": entries,
+        }
+        with open(path + ".index.json" + tmp_suffix, "w") as f:
+            json.dump(index, f)
+        os.replace(path + tmp_suffix, path)
+        os.replace(path + ".index.json" + tmp_suffix, path + ".index.json")
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def view(self, order: List[int]) -> "EpisodeRecords":
+        """
+        Records at positions `order` of this view.
+        """
+        records = EpisodeRecords.__new__(EpisodeRecords)
+        records.path = self.path
+        records.index = self.index
+        records._entries = self._entries
+        records._order = [self._order[i] for i in order]
+        records._file = self._file
+        records._data = self._data
+        return records
+
+    def shuffle(self) -> None:
+        # Same permutation as `random.shuffle` on a list of this length.
+        random.shuffle(self._order)
+
+    @property
+    def scene_ids(self) -> List[str]:
+        return [self._entries[i][2] for i in self._order]
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.view(range(len(self._order))[i])
+        offset, length, _ = self._entries[self._order[i]]
+        return LangRearrangeEpisode(**pickle.loads(self._data[offset : offset + length]))
+
+    def __iter__(self):
+        return EpisodeRecordsIterator(self)
+
+    def __getstate__(self):
+        return {"path": self.path, "index": self.index, "order": self._order}
+
+    def __setstate__(self, state):
+        self._init(state["path"], state["index"], state["order"])
+
+
+class EpisodeRecordsIterator:
+    def __init__(self, records: EpisodeRecords) -> None:
+        self._records = records
+        self._pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> LangRearrangeEpisode:
+        if self._pos >= len(self._records):
+            raise StopIteration
+        self._pos += 1
+        return self._records[self._pos - 1]
+
+    def remaining(self) -> EpisodeRecords:
+        """
+        The records not returned yet. Exhausts the iterator.
+        """
+        rest = self._records.view(range(self._pos, len(self._records)))
+        self._pos = len(self._records)
+        return rest
+
+
 @registry.register_dataset(name="LangRearrangeDataset-v0")
 class LangRearrangeDatasetV0(RearrangeDatasetV0):
     def __init__(self, config=None, preset_eps=None) -> None:
@@ -67,15 +206,48 @@ class LangRearrangeDatasetV0(RearrangeDatasetV0):
         if preset_eps is None:
             datasetfile_path = config.data_path.format(split=config.split)
             logger.info(f"Loading from {datasetfile_path}")
-            with open(datasetfile_path, "rb") as f:
-                self.from_binary(pickle.load(f), scenes_dir=config.scenes_dir)
-
-            self.episodes = list(
-                filter(self.build_content_scenes_filter(config), self.episodes)
-            )
+            try:
+                records = EpisodeRecords.open(datasetfile_path)
+            except OSError as e:
+                # e.g. a read-only dataset directory
+                logger.warning(f"Loading all episodes, no episode records: {e}")
+                with open(datasetfile_path, "rb") as f:
+                    self.from_binary(pickle.load(f), scenes_dir=config.scenes_dir)
+                self.episodes = list(
+                    filter(self.build_content_scenes_filter(config), self.episodes)
+                )
+                return
+
+            scenes_to_load = set(config.content_scenes)
+            if ALL_SCENES_MASK in scenes_to_load:
+                self.episodes = records
+            else:
+                self.episodes = records.view([
+                    i for i, scene_id in enumerate(records.scene_ids)
+                    if self.scene_from_scene_path(scene_id) in scenes_to_load
+                ])
         else:
             self.episodes = preset_eps
 
+    @property
+    def scene_ids(self) -> List[str]:
+        if isinstance(self.episodes, EpisodeRecords):
+            return sorted(set(self.episodes.scene_ids))
+        return super().scene_ids
+
+    @property
+    def episode_scene_ids(self) -> List[str]:
+        """
+        Scene id of every episode, in episode order.
+        """
+        return _episode_scene_ids(self.episodes)
+
+    def set_episode_order(self, order: List[int]) -> None:
+        """
+        Keeps only the episodes at the indices `order`, in that order.
+        """
+        self.episodes = _reorder_episodes(self.episodes, order)
+
     def to_json(self) -> str:
         result = DatasetFloatJSONEncoder().encode(self)
         return result
@@ -150,6 +322,15 @@ class LangRearrangeDatasetV0(RearrangeDatasetV0):
     def from_binary(
         self, data_dict: Dict[str, Any], scenes_dir: Optional[str] = None
     ) -> None:
+        for ep in self.decode_binary_eps(data_dict):
+            self.episodes.append(LangRearrangeEpisode(**ep))
+
+    @staticmethod
+    def decode_binary_eps(data_dict: Dict[str, Any]):
+        """
+        Yields the `LangRearrangeEpisode` arguments of every episode in the
+        output of `to_binary`.
+        """
         all_T = data_dict["all_transforms"]
         idx_to_name = data_dict["idx_to_name"]
         for i, ep in enumerate(data_dict["all_eps"]):
@@ -175,10 +356,8 @@ class LangRearrangeDatasetV0(RearrangeDatasetV0):
                     }
                 )
             ep["markers"] = new_markers
-
-            rearrangement_episode = LangRearrangeEpisode(**ep)
-            rearrangement_episode.episode_id = str(i)
-            self.episodes.append(rearrangement_episode)
+            ep["episode_id"] = str(i)
+            yield ep
 
     def from_json(self, json_str: str, scenes_dir: Optional[str] = None) -> None:
         deserialized = json.loads(json_str)
@@ -193,6 +372,56 @@ class LangRearrangeDatasetV0(RearrangeDatasetV0):
         return CustomEpisodeIterator(self.episodes, *args, **kwargs)
 
 
+def shard_episodes_by_scene(
+    scene_ids: List[str], num_shards: int = 1
+) -> List[List[int]]:
+    """
+    Splits the episode indices into `num_shards` shards of whole scenes,
+    assigning the largest scenes first to the shard with the fewest episodes.
+    Within a shard the episodes of a scene are contiguous (scenes by first
+    appearance, episodes in their original order), so a worker playing its
+    shard in order loads every scene once.
+
+    :param scene_ids: Scene id of every episode, see
+        `LangRearrangeDatasetV0.episode_scene_ids`.
+    """
+
+    scene_episodes: Dict[str, List[int]] = {}
+    for i, scene_id in enumerate(scene_ids):
+        scene_episodes.setdefault(scene_id, []).append(i)
+
+    shard_scenes: List[List[List[int]]] = [[] for _ in range(num_shards)]
+    shard_sizes = [0] * num_shards
+    for idxs in sorted(scene_episodes.values(), key=len, reverse=True):
+        shard = min(range(num_shards), key=lambda j: shard_sizes[j])
+        shard_scenes[shard].append(idxs)
+        shard_sizes[shard] += len(idxs)
+
+    return [
+        [i for idxs in sorted(scenes, key=lambda idxs: idxs[0]) for i in idxs]
+        for scenes in shard_scenes
+    ]
+
+
+def _episode_scene_ids(episodes) -> List[str]:
+    if isinstance(episodes, EpisodeRecords):
+        return episodes.scene_ids
+    return [e.scene_id for e in episodes]
+
+
+def _reorder_episodes(episodes, order: List[int]):
+    if isinstance(episodes, EpisodeRecords):
+        return episodes.view(order)
+    return [episodes[i] for i in order]
+
+
+def _shuffle_episodes(episodes) -> None:
+    if isinstance(episodes, EpisodeRecords):
+        episodes.shuffle()
+    else:
+        random.shuffle(episodes)
+
+
 class CustomEpisodeIterator(EpisodeIterator):
     def __init__(
         self,
@@ -212,11 +441,16 @@ class CustomEpisodeIterator(EpisodeIterator):
 
         # sample episodes
         if num_episode_sample >= 0:
-            episodes = np.random.choice(  # type: ignore[assignment]
-                episodes, num_episode_sample, replace=False  # type: ignore[arg-type]
-            )
+            if isinstance(episodes, EpisodeRecords):
+                episodes = episodes.view(
+                    np.random.choice(len(episodes), num_episode_sample, replace=False)
+                )
+            else:
+                episodes = np.random.choice(  # type: ignore[assignment]
+                    episodes, num_episode_sample, replace=False  # type: ignore[arg-type]
+                )
 
-        if not isinstance(episodes, list):
+        if not isinstance(episodes, (list, EpisodeRecords)):
             episodes = list(episodes)
 
         self.episodes = episodes
@@ -225,7 +459,7 @@ class CustomEpisodeIterator(EpisodeIterator):
         self.shuffle = shuffle
 
         if shuffle:
-            random.shuffle(self.episodes)
+            _shuffle_episodes(self.episodes)
 
         if group_by_scene:
             self.episodes = self._group_scenes(self.episodes)
@@ -269,22 +503,31 @@ class CustomEpisodeIterator(EpisodeIterator):
         self._prev_scene_id = next_episode.scene_id
         return next_episode
 
+    def _remaining_episodes(self):
+        if isinstance(self._iterator, EpisodeRecordsIterator):
+            return self._iterator.remaining()
+        return list(self._iterator)
+
     def _forced_scene_switch(self) -> None:
-        grouped_episodes = [
-            list(g) for k, g in groupby(self._iterator, key=lambda x: x.scene_id)
+        episodes = self._remaining_episodes()
+        grouped_idxs = [
+            [i for i, _ in g]
+            for k, g in groupby(
+                enumerate(_episode_scene_ids(episodes)), key=lambda x: x[1]
+            )
         ]
 
-        if len(grouped_episodes) > 1:
+        if len(grouped_idxs) > 1:
             # Ensure we swap by moving the current group to the end
-            grouped_episodes = grouped_episodes[1:] + grouped_episodes[0:1]
+            grouped_idxs = grouped_idxs[1:] + grouped_idxs[0:1]
 
-        self._iterator = iter(sum(grouped_episodes, []))
+        self._iterator = iter(_reorder_episodes(episodes, sum(grouped_idxs, [])))
 
     def _shuffle(self) -> None:
         assert self.shuffle
-        episodes = list(self._iterator)
+        episodes = self._remaining_episodes()
 
-        random.shuffle(episodes)
+        _shuffle_episodes(episodes)
 
         if self.group_by_scene:
             episodes = self._group_scenes(episodes)
@@ -294,12 +537,16 @@ class CustomEpisodeIterator(EpisodeIterator):
     def _group_scenes(self, episodes):
         assert self.group_by_scene
 
+        scene_ids = _episode_scene_ids(episodes)
         scene_sort_keys: Dict[str, int] = {}
-        for e in episodes:
-            if e.scene_id not in scene_sort_keys:
-                scene_sort_keys[e.scene_id] = len(scene_sort_keys)
+        for scene_id in scene_ids:
+            if scene_id not in scene_sort_keys:
+                scene_sort_keys[scene_id] = len(scene_sort_keys)
 
-        return sorted(episodes, key=lambda e: scene_sort_keys[e.scene_id])
+        return _reorder_episodes(
+            episodes,
+            sorted(range(len(episodes)), key=lambda i: scene_sort_keys[scene_ids[i]]),
+        )
 
     def step_taken(self) -> None:
         self._step_count += 1
@@ -368,6 +368,14 @@ class LangRearrangeEpisodeGenerator(RearrangeEpisodeGenerator):
             goal_preds=goal_preds,
         )
 
+    def set_iter_eps(self, iter_eps) -> None:
+        """
+        Replaces the episodes to generate, starting again from the first one.
+        """
+
+        self._iter_eps = iter_eps
+        self._cur_ep_idx = 0
+
     def _on_successful_sample(self):
         # Move onto generating the next episode.
         self._cur_ep_idx += 1
@@ -0,0 +1,208 @@
+#
+# For licensing see accompanying LICENSE file.
+# Copyright (C) 2024 Apple Inc. All Rights Reserved.
+#
+"""
+Work-stealing process pool used by `create_episodes.py` and
+`dataset_validator.py`.
+
+Work is split into small keyed batches that are handed to whichever worker
+is free, so a slow scene only holds up its own batch. Each finished batch is
+sent back (and appended to an optional checkpoint file) as soon as it is
+done. If a worker dies, the batch it was working on is put back on the queue
+and the worker is replaced.
+"""
+import os
+import os.path as osp
+import pickle
+from collections import defaultdict, deque
+from multiprocessing.connection import wait
+from threading import Thread
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from habitat.core.logging import logger
+from torch import multiprocessing as mp
+
+# A batch that kills this many workers is dropped.
+MAX_BATCH_CRASHES = 2
+# A worker slot that dies this many times in a row without finishing a batch
+# is not restarted again.
+MAX_WORKER_RESTARTS = 3
+POLL_INTERVAL = 1.0
+
+
+def load_checkpoint(checkpoint_path: str) -> Dict[Hashable, Any]:
+    """
+    Reads the batches finished by a previous run. A record cut off by a crash
+    at the end of the file is ignored.
+    """
+
+    done = {}
+    if not osp.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "rb") as f:
+        while True:
+            try:
+                key, result = pickle.load(f)
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, AttributeError):
+                logger.warning(f"Ignoring truncated record in {checkpoint_path}")
+                break
+            done[key] = result
+    return done
+
+
+def _worker_main(worker_fn, slot, worker_args, conn):
+    def batches():
+        while True:
+            batch = conn.recv()
+            if batch is None:
+                return
+            yield batch
+
+    for key, result in worker_fn(slot, *worker_args, batches()):
+        conn.send((key, result))
+    conn.close()
+
+
+def run_work_queue(
+    worker_fn: Callable,
+    worker_args: Tuple,
+    batches: List[Tuple[Hashable, Any]],
+    n_procs: int,
+    checkpoint_path: str = None,
+    resume: bool = False,
+    proc_debug: bool = False,
+) -> Dict[Hashable, Any]:
+    """
+    Runs `batches` on `n_procs` workers and returns the result of every
+    finished batch by its key.
+
+    :param worker_fn: Generator function called once per worker as
+        `worker_fn(slot, *worker_args, batches)`. It must yield one
+        `(key, result)` pair for every `(key, items)` pair taken from
+        `batches`. Expensive setup (simulators, models) belongs before the
+        loop so it is shared by all batches of the worker.
+    :param batches: `(key, items)` pairs. Keys must be picklable and the same
+        across runs for `resume` to work.
+    :param checkpoint_path: File the finished batches are appended to.
+    :param resume: Skip the batches already in `checkpoint_path`.
+    :param proc_debug: Run the workers as threads of this process.
+    """
+
+    results = {}
+    if checkpoint_path is not None:
+        if resume:
+            results = load_checkpoint(checkpoint_path)
+            logger.info(f"Resuming with {len(results)} finished batches")
+        elif osp.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    pending = {key: items for key, items in batches if key not in results}
+    if len(pending) == 0:
+        return results
+
+    mp_ctx = mp.get_context("forkserver")
+    todo = deque(pending.keys())
+    # slot -> (worker, pipe). Every worker has its own pipe so one that dies
+    # mid-message cannot block the others.
+    workers = {}
+    # The batch each busy worker was handed. Idle workers wait for a batch
+    # requeued by a crash, or for the stop signal.
+    in_flight = {}
+    idle = set()
+    batch_crashes = defaultdict(int)
+    worker_restarts = defaultdict(int)
+    remaining = len(pending)
+
+    def start_worker(slot):
+        parent_conn, child_conn = mp_ctx.Pipe()
+        args = (worker_fn, slot, worker_args, child_conn)
+        if proc_debug:
+            p = Thread(target=_worker_main, args=args)
+        else:
+            p = mp_ctx.Process(target=_worker_main, args=args)
+        print(f"Starting worker {slot}")
+        p.start()
+        if not proc_debug:
+            # So the pipe reports EOF once the worker is gone.
+            child_conn.close()
+        workers[slot] = (p, parent_conn)
+        dispatch(slot)
+
+    def dispatch(slot):
+        if len(todo) == 0:
+            idle.add(slot)
+            return
+        idle.discard(slot)
+        key = todo.popleft()
+        in_flight[slot] = key
+        workers[slot][1].send((key, pending[key]))
+
+    def on_worker_lost(slot):
+        nonlocal remaining
+        p, conn = workers.pop(slot)
+        conn.close()
+        idle.discard(slot)
+        logger.warning(f"Worker {slot} crashed")
+        key = in_flight.pop(slot, None)
+        if key is not None and key not in results:
+            batch_crashes[key] += 1
+            if batch_crashes[key] >= MAX_BATCH_CRASHES:
+                logger.warning(f"Dropping batch {key} after {batch_crashes[key]} crashes")
+                remaining -= 1
+            else:
+                todo.append(key)
+                for idle_slot in list(idle):
+                    dispatch(idle_slot)
+        worker_restarts[slot] += 1
+        if worker_restarts[slot] >= MAX_WORKER_RESTARTS:
+            logger.warning(f"Not restarting worker {slot} again")
+        elif len(todo) > 0:
+            start_worker(slot)
+
+    checkpoint_f = open(checkpoint_path, "ab") if checkpoint_path is not None else None
+    try:
+        for slot in range(min(n_procs, len(pending))):
+            start_worker(slot)
+
+        while remaining > 0 and len(workers) > 0:
+            conn_slots = {conn: slot for slot, (_, conn) in workers.items()}
+            for conn in wait(list(conn_slots), timeout=POLL_INTERVAL):
+                slot = conn_slots[conn]
+                try:
+                    key, result = conn.recv()
+                except (EOFError, OSError):
+                    on_worker_lost(slot)
+                    continue
+                in_flight.pop(slot, None)
+                worker_restarts[slot] = 0
+                if key not in results:
+                    results[key] = result
+                    remaining -= 1
+                    if checkpoint_f is not None:
+                        pickle.dump((key, result), checkpoint_f)
+                        checkpoint_f.flush()
+                    print(f"Finished batch {key} on worker {slot}, {remaining} left")
+                dispatch(slot)
+
+            # Threads (and processes killed before closing their pipe) don't
+            # always produce an EOF.
+            for slot, (p, conn) in list(workers.items()):
+                if not p.is_alive() and not conn.poll():
+                    on_worker_lost(slot)
+    finally:
+        if checkpoint_f is not None:
+            checkpoint_f.close()
+        for p, conn in workers.values():
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for p, _ in workers.values():
+            p.join()
+
+    if remaining > 0:
+        logger.warning(f"No workers left, {remaining} batches were not run")
+    return results
@@ -6,7 +6,8 @@ import inspect
 import os.path as osp
 import random
 import time
-from typing import Any, Dict, List
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
 
 import hydra
 import magnum as mn
@@ -22,13 +23,15 @@ from habitat.tasks.rearrange.rearrange_task import RearrangeTask
 from habitat.tasks.rearrange.utils import add_perf_timing_func
 from omegaconf import DictConfig, ListConfig
 from PIL import Image
-from transformers import AutoTokenizer
 
 import embodiedbench.envs.eb_habitat.config
 from embodiedbench.envs.eb_habitat.dataset.episodes import LangRearrangeEpisode
 from embodiedbench.envs.eb_habitat.dataset.utils import get_category_info
 from embodiedbench.envs.eb_habitat.actions import KinematicArmEEAction
-from embodiedbench.envs.eb_habitat.utils import PLACABLE_RECEP_TYPE, get_pddl 
+from embodiedbench.envs.eb_habitat.utils import PLACABLE_RECEP_TYPE, get_parser, get_pddl
+
+# Number of entity sets whose grounded PDDL actions are kept
+BOUND_ACTIONS_CACHE_SIZE = 8
 
 
 @registry.register_task(name="RearrangePredicateTask-v0")
@@ -51,7 +54,6 @@ class RearrangePredicateTask(RearrangeTask):
             should_place_articulated_agent=not self._fix_agent_pos,
             **kwargs,
         )
-        # self._tokenizer = get_parser(config.tokenizer_name)
 
         self._start_template = self._config.start_template
         self._goal_template = self._config.goal_template
@@ -63,10 +65,15 @@ class RearrangePredicateTask(RearrangeTask):
         self._goal_expr = None
         self._is_first_reset = True
         self._is_freeform = False
+        self._bound_actions_cache: "OrderedDict[Tuple[PddlEntity, ...], Dict[str, Any]]" = OrderedDict()
 
-    # @property
-    # def tokenizer(self):
-    #     return self._tokenizer
+    @property
+    def tokenizer(self):
+        """
+        Tokenizer of the language sensors, loaded on first use since the
+        default evaluation does not observe tokens.
+        """
+        return get_parser(self._config.tokenizer_name)
 
     @add_perf_timing_func()
     def _load_start_goal(self, episode):
@@ -84,7 +91,7 @@ class RearrangePredicateTask(RearrangeTask):
         self._setup_pddl_entities(episode)
 
         if self._is_first_reset or not self._force_scene_per_worker:
-            self.pddl.bind_actions()
+            self._bind_actions()
             self._is_first_reset = False
 
         self._sim.internal_step(-1)
@@ -97,6 +104,25 @@ class RearrangePredicateTask(RearrangeTask):
             self._sim.add_perf_timing("goal_expand_quantifiers", t_start)
         self._load_start_preds(episode)
 
+    @add_perf_timing_func()
+    def _bind_actions(self):
+        """
+        Grounds the PDDL actions for the entities of this episode. The
+        grounding only depends on the entities and their types, so the one of
+        an earlier episode with the same entities (e.g. the same scene) is
+        reused.
+        """
+        entities_key = tuple(self.pddl.all_entities.values())
+        bound_actions = self._bound_actions_cache.get(entities_key)
+        if bound_actions is None:
+            self.pddl.bind_actions()
+            self._bound_actions_cache[entities_key] = dict(self.pddl.actions)
+            while len(self._bound_actions_cache) > BOUND_ACTIONS_CACHE_SIZE:
+                self._bound_actions_cache.popitem(last=False)
+        else:
+            self._bound_actions_cache.move_to_end(entities_key)
+            self.pddl.actions.update(bound_actions)
+
     def _load_sampled_names(self):
         t_start = time.time()
         self.new_entities: Dict[str, PddlEntity] = {}
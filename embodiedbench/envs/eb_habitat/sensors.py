@@ -3,11 +3,12 @@
 # Copyright (C) 2024 Apple Inc. All Rights Reserved.
 #
 import os.path as osp
-from typing import List
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List
 
 import gym.spaces as spaces
 import numpy as np
-import torch
 from habitat.core.registry import registry
 from habitat.core.simulator import Sensor, SensorTypes
 from habitat.tasks.rearrange.multi_task.pddl_predicate import Predicate
@@ -19,6 +20,18 @@ from embodiedbench.envs.eb_habitat.dataset.utils import get_category_info, get_n
 from embodiedbench.envs.eb_habitat.utils import get_parser
 
 
+@lru_cache(maxsize=None)
+def load_vocab_embeddings(embed_path):
+    """
+    The `(embeddings, episode id -> embedding index)` saved at `embed_path`,
+    loaded once per process and shared by all envs.
+    """
+    import torch
+
+    embed_dat = torch.load(embed_path)
+    return embed_dat["hxs"], embed_dat["ep_idx_to_hxs_idx"]
+
+
 @registry.register_sensor
 class OneHotTargetSensor(Sensor):
     def __init__(self, *args, task, **kwargs):
@@ -192,9 +205,12 @@ class T5VocabLangGoalSensor(Sensor):
 
     def __init__(self, *args, config, **kwargs):
         self._max_len = config.max_len
-        self._tokenizer = get_parser("google/flan-t5-small")
         super().__init__(*args, config=config, **kwargs)
 
+    @property
+    def tokenizer(self):
+        return get_parser("google/flan-t5-small")
+
     def _get_uuid(self, *args, **kwargs):
         return T5VocabLangGoalSensor.uuid
 
@@ -210,7 +226,7 @@ class T5VocabLangGoalSensor(Sensor):
         )
 
     def get_observation(self, *args, task, **kwargs):
-        tokens = self._tokenizer(
+        tokens = self.tokenizer(
             task.lang_goal,
             return_tensors="np",
             padding="max_length",
@@ -230,9 +246,13 @@ class LlamaVocabLangGoalSensor(Sensor):
 
     def __init__(self, *args, config, **kwargs):
         self._max_len = config.max_len
-        self._tokenizer = get_parser(config.tokenizer_name)
+        self._tokenizer_name = config.tokenizer_name
         super().__init__(*args, config=config, **kwargs)
 
+    @property
+    def tokenizer(self):
+        return get_parser(self._tokenizer_name)
+
     def _get_uuid(self, *args, **kwargs):
         return LlamaVocabLangGoalSensor.uuid
 
@@ -248,7 +268,7 @@ class LlamaVocabLangGoalSensor(Sensor):
         )
 
     def get_observation(self, *args, task, **kwargs):
-        tokens = self._tokenizer(
+        tokens = self.tokenizer(
             task.lang_goal,
             return_tensors="np",
             padding="max_length",
@@ -266,6 +286,15 @@ class ObsLangSensor(Sensor):
         self._max_len = config.max_len
         self._task = task
         self._predicates_list = None
+        # Truth value of every entry of `predicates_list` at the last step,
+        # the entries to re-check when an entity changes and the entries that
+        # refer to no entity, which are re-checked on every step.
+        self._pred_truths: List[bool] = []
+        self._entity_preds: Dict[str, List[int]] = {}
+        self._unindexed_preds: List[int] = []
+        self._tracked_entities = []
+        self._state_s = None
+        self._tokens = None
         super().__init__(*args, config=config, task=task, **kwargs)
 
     def _get_uuid(self, *args, **kwargs):
@@ -282,6 +311,23 @@ class ObsLangSensor(Sensor):
 
         if self._predicates_list is None:
             self._predicates_list = self._task.pddl_problem.get_possible_predicates()
+            self._pred_truths = [False] * len(self._predicates_list)
+            entity_preds = defaultdict(set)
+            tracked_entities = {}
+            self._unindexed_preds = []
+            for i, pred in enumerate(self._predicates_list):
+                # Indexed by every entity the predicate's state refers to,
+                # e.g. `not_holding()` depends on the robot only.
+                entities = pred.entities
+                if not entities:
+                    self._unindexed_preds.append(i)
+                for entity in entities:
+                    entity_preds[entity.name].add(i)
+                    tracked_entities[entity.name] = entity
+            self._entity_preds = {
+                name: sorted(preds) for name, preds in entity_preds.items()
+            }
+            self._tracked_entities = list(tracked_entities.values())
         return self._predicates_list
 
     def _get_observation_space(self, *args, config, **kwargs):
@@ -294,9 +340,25 @@ class ObsLangSensor(Sensor):
 
     def get_observation(self, *args, **kwargs):
         # Fetch the predicates that are true in the current simulator step.
+        # Only the predicates that refer to entities whose state changed since
+        # the last step, or to no entity at all, are checked again. `sim_info`
+        # is new every episode so the first step of an episode checks all of
+        # them.
         sim_info = self._task.pddl_problem.sim_info
+        predicates_list = self.predicates_list
+        dirty_entities = sim_info.get_dirty_entities(
+            ObsLangSensor.uuid, self._tracked_entities
+        )
+        if dirty_entities is None:
+            dirty_preds = range(len(predicates_list))
+        else:
+            dirty_preds = set(self._unindexed_preds)
+            for name in dirty_entities:
+                dirty_preds.update(self._entity_preds.get(name, []))
+        for i in dirty_preds:
+            self._pred_truths[i] = predicates_list[i].is_true(sim_info)
         true_preds: List[Predicate] = [
-            p for p in self.predicates_list if p.is_true(sim_info)
+            p for p, is_true in zip(predicates_list, self._pred_truths) if is_true
         ]
 
         # Conver the predicates to a string representation.
@@ -305,22 +367,28 @@ class ObsLangSensor(Sensor):
         # Join all the predicate strings by sentences.
         state_s = ". ".join(true_preds_s)
 
-        # Return the tokenized version.
-        return self._task.tokenizer(
-            state_s,
-            return_tensors="np",
-            padding="max_length",
-            max_length=self._max_len,
-            truncation=True,
-        )["input_ids"][0]
+        # Return the tokenized version, which is kept while the state holds.
+        if state_s != self._state_s:
+            self._tokens = self._task.tokenizer(
+                state_s,
+                return_tensors="np",
+                padding="max_length",
+                max_length=self._max_len,
+                truncation=True,
+            )["input_ids"][0]
+            self._state_s = state_s
+        return self._tokens.copy()
 
 
 @registry.register_sensor
 class VocabEmbedSensor(Sensor):
+    """
+    The embeddings are loaded on the first observation, so configuring the
+    sensor without observing it costs nothing.
+    """
+
     def __init__(self, *args, config, **kwargs):
-        embed_dat = torch.load(config.embed_path)
-        self._embeddings = embed_dat["hxs"]
-        self._ep_idx_to_idx = embed_dat["ep_idx_to_hxs_idx"]
+        self._embed_path = config.embed_path
         super().__init__(*args, config=config, **kwargs)
 
     def _get_uuid(self, *args, **kwargs):
@@ -338,8 +406,9 @@ class VocabEmbedSensor(Sensor):
         )
 
     def get_observation(self, *args, task, **kwargs):
-        pt_idx = self._ep_idx_to_idx[task._episode_id]
-        return self._embeddings[pt_idx]
+        embeddings, ep_idx_to_idx = load_vocab_embeddings(self._embed_path)
+        pt_idx = ep_idx_to_idx[task._episode_id]
+        return embeddings[pt_idx]
 
 
 @registry.register_sensor
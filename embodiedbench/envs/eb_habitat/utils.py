@@ -2,9 +2,16 @@
 # For licensing see accompanying LICENSE file.
 # Copyright (C) 2024 Apple Inc. All Rights Reserved.
 #
+import hashlib
 import inspect
+import json
+import os
 import os.path as osp
-from typing import Dict, List, Tuple
+import queue
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+import imageio
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import yaml
@@ -14,15 +21,16 @@ from habitat.tasks.rearrange.multi_task.pddl_logical_expr import (
     LogicalExpr, LogicalQuantifierType)
 from habitat.tasks.rearrange.multi_task.rearrange_pddl import (
     ExprType, PddlEntity, SimulatorObjectType)
-from transformers import (AutoConfig, AutoModelForSeq2SeqLM, AutoTokenizer,
-                          LlamaForCausalLM, LlamaModel, LlamaTokenizer,
-                          T5Model)
 from habitat.utils.visualizations.utils import (tile_images, draw_collision)
 import embodiedbench.envs.eb_habitat.config
 import embodiedbench.envs.eb_habitat.dataset
 
 # Also defined in the PDDL
 PLACABLE_RECEP_TYPE = "place_receptacle"
+ACTION_CACHE_DIR = os.environ.get(
+    "EB_HABITAT_ACTION_CACHE", osp.expanduser("~/.cache/embodiedbench/habitat_actions")
+)
+ACTION_CACHE_VERSION = 1
 
 
 def draw_text(img, text, position):
@@ -94,6 +102,64 @@ def observations_to_image(observation, info, key=None):
 
 
 
+class VideoStreamWriter:
+    """
+    Encodes an episode video while it is recorded. Frames go through a bounded
+    queue to a background thread that appends them to the mp4, so only
+    `max_queue` frames are held in memory and `append` blocks when the encoder
+    falls behind. Only every `frame_stride`-th frame is kept.
+    """
+
+    def __init__(self, path: str, fps: int = 30, max_queue: int = 32, frame_stride: int = 1):
+        self.path = path
+        self.fps = fps
+        self.frame_stride = max(1, frame_stride)
+        self.num_frames = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._encode, daemon=True)
+        self._thread.start()
+
+    def _encode(self):
+        writer = None
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                # keep draining so `append` never blocks on a dead encoder
+                continue
+            try:
+                if writer is None:
+                    writer = imageio.get_writer(self.path, fps=self.fps)
+                writer.append_data(frame)
+            except Exception as e:
+                self._error = e
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception as e:
+                self._error = self._error or e
+
+    def append(self, frame):
+        if self._error is not None:
+            raise RuntimeError(f"Encoding {self.path} failed: {self._error}")
+        if self.num_frames % self.frame_stride == 0:
+            self._queue.put(frame)
+        self.num_frames += 1
+
+    def close(self):
+        """
+        Waits for the queued frames to be encoded. Returns False when no
+        frame was written.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Encoding {self.path} failed: {self._error}")
+        return self.num_frames > 0
+
+
 def get_allowed_actions(pddl, allowed_substrings):
     all_actions = pddl.get_possible_actions()
 
@@ -104,6 +170,101 @@ def get_allowed_actions(pddl, allowed_substrings):
     return [ac for ac in all_actions if matches_any(ac, allowed_substrings)]
 
 
+def _type_chain(expr_type) -> List[str]:
+    names = []
+    while expr_type is not None:
+        names.append(expr_type.name)
+        expr_type = expr_type.parent
+    return names
+
+
+def action_space_key(pddl, allowed_substrings) -> str:
+    """
+    Hash of everything `get_allowed_actions` depends on: the allowed action
+    prefixes, the action names and parameter types and the entities with
+    their types, all in order. Preconditions are not part of it since the
+    grounding only checks argument types.
+    """
+    key_data = {
+        "version": ACTION_CACHE_VERSION,
+        "allowed": list(allowed_substrings),
+        "actions": [
+            [action.name, [_type_chain(p.expr_type) for p in action.params]]
+            for action in pddl.actions.values()
+        ],
+        "entities": [
+            [name, _type_chain(entity.expr_type)]
+            for name, entity in pddl.all_entities.items()
+        ],
+    }
+    return hashlib.sha1(json.dumps(key_data).encode("utf-8")).hexdigest()
+
+
+def _load_action_cache(key: str) -> Dict:
+    try:
+        with open(osp.join(ACTION_CACHE_DIR, key + ".json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_action_cache(key: str, entry: Dict) -> None:
+    path = osp.join(ACTION_CACHE_DIR, key + ".json")
+    try:
+        os.makedirs(ACTION_CACHE_DIR, exist_ok=True)
+        with open(path + f".tmp{os.getpid()}", "w") as f:
+            json.dump(entry, f)
+        os.replace(path + f".tmp{os.getpid()}", path)
+    except OSError as e:
+        print(f"Could not cache the action space in {path}: {e}")
+
+
+def get_allowed_action_datas(
+    pddl, allowed_substrings
+) -> Tuple[str, List[Tuple[str, List[str]]]]:
+    """
+    The `(action name, parameter names)` of every action from
+    `get_allowed_actions`, read from `ACTION_CACHE_DIR` when the same action
+    space was grounded before. Also returns the cache key, which
+    `get_action_language` uses.
+    """
+    key = action_space_key(pddl, allowed_substrings)
+    entry = _load_action_cache(key)
+    if "actions" in entry:
+        return key, [(name, list(param_names)) for name, param_names in entry["actions"]]
+
+    action_datas = [
+        (action.name, [p.name for p in action.param_values])
+        for action in get_allowed_actions(pddl, allowed_substrings)
+    ]
+    _save_action_cache(key, {"actions": action_datas})
+    return key, action_datas
+
+
+def get_action_language(
+    key: Optional[str], action_datas, to_language: Callable
+) -> List[str]:
+    """
+    `to_language(action_datas)`, cached next to the action space `key`. The
+    cached text is only used if the module defining `to_language` did not
+    change since.
+    """
+    if key is None:
+        return to_language(action_datas)
+    with open(inspect.getsourcefile(to_language), "rb") as f:
+        source_hash = hashlib.sha1(f.read()).hexdigest()
+    entry = _load_action_cache(key)
+    if entry.get("language_source") == source_hash and "language" in entry:
+        return entry["language"]
+
+    language = to_language(action_datas)
+    if "actions" in entry:
+        entry["language"] = language
+        entry["language_source"] = source_hash
+        _save_action_cache(key, entry)
+    return language
+
+
 def _recur_replace(expr, search, replace):
     if isinstance(expr, LogicalExpr):
         for subexpr in expr.sub_exprs:
@@ -193,7 +354,14 @@ def get_pddl(task_config, all_cats, obj_cats) -> PddlDomain:
     return flatten_actions(pddl, obj_cats)
 
 
+@lru_cache(maxsize=None)
 def get_parser(llm_id):
+    """
+    Tokenizer of `llm_id`, loaded once per process and shared by every env
+    and sensor asking for it. transformers is only imported on first use.
+    """
+    from transformers import AutoTokenizer, LlamaTokenizer
+
     if "llama" in llm_id.lower():
         tokenizer = LlamaTokenizer.from_pretrained(llm_id)
         # llama has no pad token by default. As per this thread:
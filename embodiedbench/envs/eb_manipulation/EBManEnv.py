@@ -16,6 +16,8 @@ from pathlib import Path
 from amsolver.utils import name_to_task_class
 from embodiedbench.envs.eb_manipulation.eb_man_utils import get_continous_action_from_discrete
 import os
+import re
+import json
 import time
 from PIL import Image
 from embodiedbench.main import logger
@@ -30,17 +32,107 @@ EVAL_SETS = {
 
 ValidEvalSets = ['base', 'common_sense', 'complex', 'spatial', 'visual']
 
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _variation_episode(path):
+    match = re.search(r'variation(\d+)/episodes/episode(\d+)', str(path))
+    if match:
+        return (int(match.group(1)), int(match.group(2)))
+    return (float('inf'), float('inf'))
+
+
+def _dir_mtimes(data_folder, dirs):
+    try:
+        return {d: os.stat(data_folder / d).st_mtime_ns for d in dirs}
+    except OSError:
+        return None
+
+
+def build_episode_manifest(data_folder):
+    """Walks an eval data tree once and indexes every episode by task.
+
+    Besides the episode paths, the manifest stores the mtimes of every
+    directory above the episode folders, so adding or removing a task,
+    variation or episode invalidates it without walking the tree again.
+    """
+    data_folder = Path(data_folder)
+    tasks = {}
+    watched = set()
+    for path in data_folder.rglob('configs*'):
+        episode_dir = path.parent
+        task_dir = path.parents[3]
+        tasks.setdefault(task_dir.name, set()).add(episode_dir)
+        for d in [episode_dir.parent, episode_dir.parents[1]] + list(task_dir.parents):
+            watched.add(str(d.relative_to(data_folder)))
+            if d == data_folder:
+                break
+        watched.add(str(task_dir.relative_to(data_folder)))
+    watched.add('.')
+    manifest = {'version': MANIFEST_VERSION, 'mtimes': _dir_mtimes(data_folder, sorted(watched)), 'tasks': {}}
+    for task_name, episode_dirs in tasks.items():
+        entries = []
+        for e in sorted(episode_dirs, key=_variation_episode):
+            rel = e.relative_to(data_folder)
+            variation, episode = _variation_episode(e)
+            entries.append({
+                'path': str(rel),
+                'variation': variation,
+                'episode': episode,
+                'task_base': str(rel / 'task_base.ttm'),
+                'waypoint_sets': str(rel / 'waypoint_sets.ttm'),
+                'config': str(rel / 'configs.pkl'),
+            })
+        manifest['tasks'][task_name] = entries
+    return manifest
+
+
+def load_episode_manifest(data_folder, rebuild=False):
+    """Returns the episode manifest of a data tree, (re)building and saving
+    it when missing, stale or when `rebuild` is set.
+
+    The manifest is saved next to the data tree (e.g. `eval.manifest.json`
+    for an `eval` folder) so that writing it does not touch the mtimes it
+    records.
+    """
+    data_folder = Path(data_folder)
+    manifest_path = data_folder.with_name(data_folder.name + MANIFEST_SUFFIX)
+    if not rebuild and manifest_path.exists():
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION and \
+                    _dir_mtimes(data_folder, manifest['mtimes']) == manifest['mtimes']:
+                return manifest
+        except (ValueError, KeyError, TypeError):
+            pass
+        logger.info(f"Episode manifest {manifest_path} is stale, rebuilding ...")
+    manifest = build_episode_manifest(data_folder)
+    # Write atomically, several workers may share the same data tree
+    tmp_path = manifest_path.with_name('{}.{}.tmp'.format(manifest_path.name, os.getpid()))
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        logger.warning(f"Could not save episode manifest to {manifest_path}: {e}")
+    return manifest
+
 class EBManEnv(gym.Env):
     metadata = {'render.modes': ['human', 'rgb_array']}
 
-    def __init__(self, eval_set, render_mode='human', img_size=(500, 500), down_sample_ratio=1.0, log_path = None, selected_indexes=[]):
+    def __init__(self, eval_set, render_mode='human', img_size=(500, 500), down_sample_ratio=1.0, log_path = None, selected_indexes=[], rebuild_index=False):
         obs_config = ObservationConfig()
         obs_config.set_all(True)
         obs_config.set_image_size(img_size)
 
         action_mode = ActionMode(ArmActionMode.ABS_EE_POSE_PLAN_WORLD_FRAME)        
+        # Discrete actions are only judged at the end of each planned path,
+        # and recurring (start, target) pairs reuse their planned path
         self.env = Environment(
-            action_mode, obs_config=obs_config, headless=True)
+            action_mode, obs_config=obs_config, headless=True,
+            success_check_stride=0, use_path_cache=True)
         self.env.launch()
         self._render_mode = render_mode
 
@@ -50,7 +142,7 @@ class EBManEnv(gym.Env):
         self.task_files = EVAL_SETS[eval_set]
         eval_tasks = [task_file_to_task_class(t, parent_folder = 'vlm') for t in self.task_files]
         data_folder = Path(os.path.join(TTMS_FOLDER, f'data/{eval_set}/eval'))
-        self.dataset = self._load_dataset(eval_tasks, data_folder, self.task_files)
+        self.dataset = self._load_dataset(eval_tasks, data_folder, self.task_files, rebuild_index)
         if len(selected_indexes) > 0:
             self.dataset = [self.dataset[i] for i in selected_indexes]
         else:
@@ -91,33 +183,19 @@ class EBManEnv(gym.Env):
         else:
             self.log_path = log_path
     
-    def load_test_config(self, data_folder, task_name):
-        episode_list = []
-        for path in data_folder.rglob('configs*'):
-            t_name = path.parents[3].name
-            if t_name == task_name:
-                episode_list.append(path.parent)
-
-        def extract_variation_episode(path):
-            import re
-            match = re.search(r'variation(\d+)/episodes/episode(\d+)', str(path))
-            if match:
-                variation = int(match.group(1))
-                episode = int(match.group(2))
-                return (variation, episode)
-            return (float('inf'), float('inf'))
-
-        episode_list = sorted(episode_list, key=extract_variation_episode)
-        return episode_list
+    @staticmethod
+    def load_test_config(data_folder, task_name, rebuild_index=False):
+        manifest = load_episode_manifest(data_folder, rebuild=rebuild_index)
+        return [data_folder / e['path'] for e in manifest['tasks'].get(task_name, [])]
     
-    def _load_dataset(self, eval_tasks, data_folder, task_files):
+    def _load_dataset(self, eval_tasks, data_folder, task_files, rebuild_index=False):
         dataset = []
+        manifest = load_episode_manifest(data_folder, rebuild=rebuild_index)
         for i, task_to_use in enumerate(eval_tasks):
-            e_path = self.load_test_config(data_folder, task_files[i])
-            for num, e in enumerate(e_path):
-                task_base = str(e/"task_base.ttm")
-                waypoint_sets = str(e/"waypoint_sets.ttm")
-                config = str(e/"configs.pkl")
+            for e in manifest['tasks'].get(task_files[i], []):
+                task_base = str(data_folder / e['task_base'])
+                waypoint_sets = str(data_folder / e['waypoint_sets'])
+                config = str(data_folder / e['config'])
                 dataset.append((task_to_use, task_base, waypoint_sets, config, task_files[i]))
         return dataset
     
@@ -79,17 +79,35 @@ class DetectedCondition(Condition):
         self._detector = detector.get_name()
         self._negated = negated
 
+    def _resolve(self):
+        # Names are stored so that the condition survives pickling into the
+        # task configs; the handles are looked up once and then reused.
+        resolved = getattr(self, '_resolved', None)
+        if resolved is None:
+            resolved = (Object.get_object(self._obj),
+                        ProximitySensor(self._detector))
+            self._resolved = resolved
+        return resolved
+
     def condition_met(self):
-        obj = Object.get_object(self._obj)
-        detector = ProximitySensor(self._detector)
         try:
+            obj, detector = self._resolve()
             met = detector.is_detected(obj)
             if self._negated:
                 met = not met
             return met, False
         except:
+            self._resolved = None
             return False, False
 
+    def reset(self):
+        self._resolved = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_resolved', None)
+        return state
+
 class NothingGrasped(Condition):
     def __init__(self, gripper: Gripper):
         self._gripper = gripper
@@ -119,13 +137,17 @@ class DetectedSeveralCondition(Condition):
 
     def condition_met(self):
         count = 0
+        remaining = len(self._objects)
         for ob in self._objects:
             if self._detector.is_detected(ob):
                 count += 1
-        met = False
-        if count >= self._number_needed:
-            met = True
-        return met, False
+            remaining -= 1
+            # Stop querying the detector as soon as the outcome is known
+            if count >= self._number_needed:
+                return True, False
+            if count + remaining < self._number_needed:
+                break
+        return count >= self._number_needed, False
 
 
 class EmptyCondition(Condition):
@@ -82,3 +82,24 @@ class Observation(object):
             if data is not None:
                 low_dim_data.append(data)
         return np.concatenate(low_dim_data) if len(low_dim_data) > 0 else np.array([])
+
+
+class RobotState(object):
+    """Low-dimensional robot state that is read without touching any camera.
+
+    Use this instead of a full :class:`Observation` for internal logic that
+    only needs the gripper/arm state (e.g. auto grasping), since building an
+    Observation renders every enabled vision sensor.
+    """
+
+    def __init__(self,
+                 gripper_pose: np.ndarray,
+                 gripper_open: float,
+                 gripper_open_amount: np.ndarray,
+                 grasped_objects: list,
+                 joint_positions: np.ndarray):
+        self.gripper_pose = gripper_pose
+        self.gripper_open = gripper_open
+        self.gripper_open_amount = gripper_open_amount
+        self.grasped_objects = grasped_objects
+        self.joint_positions = joint_positions
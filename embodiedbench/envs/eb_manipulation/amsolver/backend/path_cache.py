@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+from pyrep.robots.arms.arm import Arm
+from pyrep.robots.configuration_paths.arm_configuration_path import (
+    ArmConfigurationPath)
+from scipy.spatial.transform import Rotation as R
+
+
+class PathCache(object):
+    """Reuses planned arm paths for targets that were already planned from
+    (almost) the same start configuration.
+
+    Entries are keyed by the bucketed start joint configuration, the target
+    voxel, the target rotation bin and whether collisions were checked. The
+    default resolutions match the EB-Manipulation discrete action space
+    (1cm voxels, 3 degree rotation bins). Every cached path is validated
+    against the current scene before it is handed out again.
+    """
+
+    def __init__(self, arm: Arm, position_resolution: float = 0.01,
+                 rotation_resolution: float = 3.,
+                 joint_resolution: float = 0.01,
+                 max_size: int = 20000,
+                 collision_check_every: int = 5):
+        self._arm = arm
+        self._position_resolution = position_resolution
+        self._rotation_resolution = rotation_resolution
+        self._joint_resolution = joint_resolution
+        self._max_size = max_size
+        self._collision_check_every = collision_check_every
+        # The last configuration of each path is its IK solution
+        self._paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, start_joints, position, quaternion,
+            collision_checking: bool) -> Tuple:
+        start = tuple(np.round(
+            np.asarray(start_joints) / self._joint_resolution).astype(int))
+        voxel = tuple(np.floor(
+            np.asarray(position) / self._position_resolution).astype(int))
+        euler = R.from_quat(quaternion).as_euler('xyz', degrees=True)
+        rotation = tuple(
+            np.round(euler / self._rotation_resolution).astype(int))
+        return start, voxel, rotation, bool(collision_checking)
+
+    def get(self, key: Tuple, start_joints,
+            collision_checking: bool) -> Optional[ArmConfigurationPath]:
+        points = self._paths.get(key)
+        if points is None or not self._is_valid(
+                points, start_joints, collision_checking):
+            if points is not None:
+                del self._paths[key]
+            self.misses += 1
+            return None
+        self._paths.move_to_end(key)
+        self.hits += 1
+        points = points.copy()
+        # Start from where the arm actually is, not the bucket's first entry
+        points[:len(start_joints)] = start_joints
+        return ArmConfigurationPath(self._arm, points)
+
+    def add(self, key: Tuple, path: ArmConfigurationPath) -> None:
+        points = np.array(path._path_points, dtype=float)
+        self._paths[key] = points
+        self._paths.move_to_end(key)
+        while len(self._paths) > self._max_size:
+            self._paths.popitem(last=False)
+
+    def clear(self) -> None:
+        self._paths.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._paths)
+
+    def _is_valid(self, points: np.ndarray, start_joints,
+                  collision_checking: bool) -> bool:
+        num_joints = len(self._arm.joints)
+        if np.max(np.abs(points[:num_joints] - np.asarray(start_joints))
+                  ) > self._joint_resolution:
+            return False
+        if not collision_checking:
+            return True
+        # Objects may have moved since the path was planned
+        configs = points.reshape(-1, num_joints)
+        checked = list(configs[::self._collision_check_every]) + [configs[-1]]
+        init_angles = self._arm.get_joint_positions()
+        try:
+            for config in checked:
+                self._arm.set_joint_positions(config)
+                if self._arm.check_arm_collision():
+                    return False
+        finally:
+            self._arm.set_joint_positions(init_angles)
+        return True
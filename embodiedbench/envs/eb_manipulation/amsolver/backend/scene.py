@@ -12,7 +12,7 @@ from pyrep.objects.vision_sensor import VisionSensor
 
 from amsolver.backend.exceptions import (
     WaypointError, BoundaryError, NoWaypointsError, DemoError)
-from amsolver.backend.observation import Observation
+from amsolver.backend.observation import Observation, RobotState
 from amsolver.backend.robot import Robot
 from amsolver.backend.spawn_boundary import SpawnBoundary
 from amsolver.backend.task import Task
@@ -175,6 +175,21 @@ class Scene(object):
             self._workspace_boundary._boundaries[0]._contained_objects.remove(d)
             self.distractors = []
 
+    def get_robot_state(self) -> RobotState:
+        """Returns the tip pose, gripper and joint state of the robot.
+
+        Unlike :meth:`get_observation`, no vision sensor is handled and no
+        task/camera information is gathered, so this is cheap enough to be
+        called on every internal step.
+        """
+        open_amount = np.array(self._robot.gripper.get_open_amount())
+        return RobotState(
+            gripper_pose=np.array(self._robot.arm.get_tip().get_pose()),
+            gripper_open=1.0 if open_amount[0] > 0.9 else 0.0,
+            gripper_open_amount=open_amount,
+            grasped_objects=self._robot.gripper.get_grasped_objects(),
+            joint_positions=np.array(self._robot.arm.get_joint_positions()))
+
     def get_observation(self) -> Observation:
         tip = self._robot.arm.get_tip()
 
@@ -26,6 +26,7 @@ from amsolver.backend.scene import Scene
 from amsolver.backend.task import Task
 from amsolver.backend.const import *
 from amsolver.backend.robot import Robot
+from amsolver.backend.path_cache import PathCache
 from os.path import exists, dirname, abspath, join
 import importlib
 from typing import Type, List
@@ -58,7 +59,9 @@ class Environment(object):
                  frequency: int=1,
                  visual_randomization_config: VisualRandomizationConfig=None,
                  dynamics_randomization_config: DynamicsRandomizationConfig=None,
-                 attach_grasped_objects: bool = True
+                 attach_grasped_objects: bool = True,
+                 success_check_stride: int = 1,
+                 use_path_cache: bool = False
                  ):
 
         self._dataset_root = dataset_root
@@ -73,6 +76,8 @@ class Environment(object):
         self._visual_randomization_config = visual_randomization_config
         self._dynamics_randomization_config = dynamics_randomization_config
         self._attach_grasped_objects = attach_grasped_objects
+        self._success_check_stride = success_check_stride
+        self._use_path_cache = use_path_cache
 
         if robot_configuration not in SUPPORTED_ROBOTS.keys():
             raise ValueError('robot_configuration must be one of %s' %
@@ -91,6 +96,7 @@ class Environment(object):
         self._robot = None
         self._scene = None
         self._prev_task = None
+        self._path_cache = None
 
     def _set_arm_control_action(self):
         self._robot.arm.set_control_loop_enabled(True)
@@ -165,6 +171,9 @@ class Environment(object):
                 self._dynamics_randomization_config)
 
         self._set_arm_control_action()
+        if self._use_path_cache:
+            # Shared by all task environments so paths survive across episodes
+            self._path_cache = PathCache(self._robot.arm)
 
     def shutdown(self):
         if self._pyrep is not None:
@@ -183,7 +192,8 @@ class Environment(object):
         return TaskEnvironment(
             self._pyrep, self._robot, self._scene, task,
             self._action_mode, self._dataset_root, self._obs_config,
-            self._static_positions, self._attach_grasped_objects)
+            self._static_positions, self._attach_grasped_objects,
+            self._success_check_stride, self._path_cache)
 
     @property
     def action_size(self):
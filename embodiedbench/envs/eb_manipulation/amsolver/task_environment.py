@@ -14,7 +14,8 @@ from pyrep.objects import Dummy, Object
 from amsolver import utils
 from amsolver.action_modes import ArmActionMode, ActionMode
 from amsolver.backend.exceptions import BoundaryError, WaypointError
-from amsolver.backend.observation import Observation
+from amsolver.backend.observation import Observation, RobotState
+from amsolver.backend.path_cache import PathCache
 from amsolver.backend.robot import Robot
 from amsolver.backend.scene import Scene
 from amsolver.backend.task import Task
@@ -46,7 +47,9 @@ class TaskEnvironment(object):
                  action_mode: ActionMode, dataset_root: str,
                  obs_config: ObservationConfig,
                  static_positions: bool = False,
-                 attach_grasped_objects: bool = True):
+                 attach_grasped_objects: bool = True,
+                 success_check_stride: int = 1,
+                 path_cache: PathCache = None):
         self._pyrep = pyrep
         self._robot = robot
         self._scene = scene
@@ -57,6 +60,8 @@ class TaskEnvironment(object):
         self._obs_config = obs_config
         self._static_positions = static_positions
         self._attach_grasped_objects = attach_grasped_objects
+        self._success_check_stride = success_check_stride
+        self._path_cache = path_cache
         self._reset_called = False
         self._prev_ee_velocity = None
         self._enable_path_observations = False
@@ -86,6 +91,22 @@ class TaskEnvironment(object):
     def variation_count(self) -> int:
         return self._task.variation_count()
 
+    def set_success_check_stride(self, stride: int) -> None:
+        """How often the success conditions are evaluated while following a
+        planned path.
+
+        :param stride: Evaluate every `stride` physics ticks. The last tick
+            of a path is always evaluated, so a value <= 0 only checks the
+            pose reached at the end of each path.
+        """
+        self._success_check_stride = stride
+
+    def _should_check_success(self, tick: int, done: bool) -> bool:
+        if done:
+            return True
+        return self._success_check_stride > 0 and \
+            tick % self._success_check_stride == 0
+
     def reset(self) -> Tuple[List[str], Observation]:
         self._scene.reset()
         try:
@@ -108,6 +129,9 @@ class TaskEnvironment(object):
     def get_observation(self) -> Observation:
         return self._scene.get_observation()
 
+    def get_robot_state(self) -> RobotState:
+        return self._scene.get_robot_state()
+
     def _assert_action_space(self, action, expected_shape):
         if np.shape(action) != expected_shape:
             raise RuntimeError(
@@ -152,15 +176,26 @@ class TaskEnvironment(object):
             done = reached or not_moving
 
     def _path_action_get_path(self, action, collision_checking, relative_to):
+        cache_key = None
+        if self._path_cache is not None and relative_to is None:
+            start_joints = self._robot.arm.get_joint_positions()
+            cache_key = self._path_cache.key(
+                start_joints, action[:3], action[3:], collision_checking)
+            path = self._path_cache.get(
+                cache_key, start_joints, collision_checking)
+            if path is not None:
+                return path
         try:
             path = self._robot.arm.get_path(
                 action[:3], quaternion=action[3:],
                 ignore_collisions=not collision_checking,
                 relative_to=relative_to,
               )
-            return path
         except IKError as e:
             raise InvalidActionError('Could not find a path.') from e
+        if cache_key is not None:
+            self._path_cache.add(cache_key, path)
+        return path
 
     def _path_action(self, action, collision_checking=False, relative_to=None, recorder=None):
         self._assert_unit_quaternion(action[3:])
@@ -195,6 +230,7 @@ class TaskEnvironment(object):
                     action, collision_checking, relative_to)
                 [s.set_collidable(True) for s in colliding_shapes]
                 # Only run this path until we are no longer colliding
+                small_step = 0
                 while not done:
                     done = path.step()
                     self._scene.step()
@@ -205,11 +241,13 @@ class TaskEnvironment(object):
                     colliding = self._robot.arm.check_arm_collision()
                     if not colliding:
                         break
-                    success, terminate = self._task.success()
-                    # If the task succeeds while traversing path, then break early
-                    if success:
-                        done = True
-                        break
+                    if self._should_check_success(small_step, done):
+                        success, terminate = self._task.success()
+                        # If the task succeeds while traversing path, then break early
+                        if success:
+                            done = True
+                            break
+                    small_step += 1
         if not done:
             path = self._path_action_get_path(
                 action, collision_checking, relative_to)
@@ -221,12 +259,15 @@ class TaskEnvironment(object):
                     observations.append(self._scene.get_observation())
                 if recorder is not None:
                     recorder.take_snap()
-                success, terminate = self._task.success()
-                # If the task succeeds while traversing path, then break early
-                # if success:
-                #     break
-                if success:
-                    success_in_path.append(small_step)
+                # Ticks are only recorded when evaluated, so the first entry
+                # is the earliest success seen at the configured stride.
+                if self._should_check_success(small_step, done):
+                    success, terminate = self._task.success()
+                    # If the task succeeds while traversing path, then break early
+                    # if success:
+                    #     break
+                    if success:
+                        success_in_path.append(small_step)
                 small_step += 1
 
         return observations, success_in_path
@@ -245,8 +286,9 @@ class TaskEnvironment(object):
             raise ValueError('Gripper action expected to be within 0 and 1.')
 
         # Discretize the gripper action
-        open_condition = all(x > 0.9 for x in self._robot.gripper.get_open_amount())
-        open_condition &= (len(self._robot.gripper.get_grasped_objects())==0)
+        state = self._scene.get_robot_state()
+        open_condition = all(x > 0.9 for x in state.gripper_open_amount)
+        open_condition &= (len(state.grasped_objects)==0)
         current_ee = 1.0 if open_condition else 0.0
 
         if ee_action > 0.5:
@@ -324,8 +366,7 @@ class TaskEnvironment(object):
             pass_this_step = False
             # if current_ee == 1.0 and ee_action == 0.0:
             if current_ee != ee_action and use_auto_move:
-                obs = self._scene.get_observation()
-                _, new_arm_action = self.auto_grasp(obs, arm_action, ee_action)
+                _, new_arm_action = self.auto_grasp(state, arm_action, ee_action)
                 if new_arm_action is not None:
                     arm_action = new_arm_action
             if collision_checking is None:
@@ -341,8 +382,7 @@ class TaskEnvironment(object):
             pass_this_step = False
             # if current_ee == 1.0 and ee_action == 0.0:
             if current_ee != ee_action and use_auto_move:
-                obs = self._scene.get_observation()
-                _, new_arm_action = self.auto_grasp(obs, arm_action, ee_action)
+                _, new_arm_action = self.auto_grasp(state, arm_action, ee_action)
                 if new_arm_action is not None:
                     arm_action = new_arm_action
             if collision_checking is None:
@@ -430,7 +470,7 @@ class TaskEnvironment(object):
         reward = float(success)
         return obs, reward, terminate
 
-    def auto_grasp(self, obs, goal_tip_pose, ee_action):
+    def auto_grasp(self, state: RobotState, goal_tip_pose, ee_action):
         def angle_distance(q1, q2):
             # same as rad2deg(2arccos(theta)), here qw = cos(theta/2). need to select min of (x, 2pi - x)
             # reference: https://math.stackexchange.com/questions/90081/quaternion-distance
@@ -463,7 +503,8 @@ class TaskEnvironment(object):
                     for g_obj in self._task.get_graspable_objects():
                         gripper.grasp(g_obj)
 
-        info = obs.object_informations
+        # Waypoint poses are read from the task directly when needed
+        # (self._task.objects_information()), no camera has to be rendered.
         waypoints = self._task.get_waypoints()
         success = False
         new_action = None
@@ -473,7 +514,7 @@ class TaskEnvironment(object):
         #     if gripper_control is not None:
         #         if gripper_control[1]!=ee_action:
         #             continue
-        #         target_pose = info[name]['pose'][0]
+        #         target_pose = self._task.objects_information()[name]['pose'][0]
         #         t_error, r_error = get_errors(target_pose, goal_tip_pose)
         #         print("Waypoint: ", name, "Translate Error: ", t_error, "Rotation Error: ", r_error)
                 # if t_error<0.05 and r_error>0.9:
@@ -0,0 +1,77 @@
+"""Measures how much a step saves by querying the robot state instead of a
+full observation (which renders every enabled camera).
+
+Run from the repository root, e.g.:
+    python embodiedbench/envs/eb_manipulation/tools/benchmark_robot_state.py --repeats 50
+"""
+import argparse
+import os
+import sys
+from os.path import join, dirname, abspath
+from pathlib import Path
+from time import perf_counter
+
+CURRENT_DIR = dirname(abspath(__file__))
+sys.path.insert(0, join(CURRENT_DIR, '..'))  # Use local amsolver rather than installed
+import numpy as np
+from amsolver.action_modes import ArmActionMode, ActionMode
+from amsolver.backend.utils import task_file_to_task_class
+from amsolver.environment import Environment
+from amsolver.observation_config import ObservationConfig
+from amsolver.task_environment import TTMS_FOLDER
+
+TASKS = ['pick_cube_shape', 'stack_cubes_color']
+
+
+def first_episode(data_folder: Path, task_name: str) -> Path:
+    for path in sorted(data_folder.glob(
+            '**/%s/variation*/episodes/episode*/configs*' % task_name)):
+        return path.parent
+    raise FileNotFoundError(
+        'No episode found for %s under %s' % (task_name, data_folder))
+
+
+def time_call(fn, repeats: int) -> np.ndarray:
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        fn()
+        timings.append(perf_counter() - start)
+    return np.array(timings) * 1000.
+
+
+def main(args):
+    obs_config = ObservationConfig()
+    obs_config.set_all(True)
+    obs_config.set_image_size(args.image_size)
+    env = Environment(
+        ActionMode(ArmActionMode.ABS_EE_POSE_PLAN_WORLD_FRAME),
+        obs_config=obs_config, headless=True)
+    env.launch()
+    data_folder = Path(os.path.join(TTMS_FOLDER, 'data/%s/eval' % args.eval_set))
+    try:
+        for task_name in TASKS:
+            episode = first_episode(data_folder, task_name)
+            task_env = env.get_task(
+                task_file_to_task_class(task_name, parent_folder='vlm'))
+            task_env.load_config(str(episode / 'task_base.ttm'),
+                                 str(episode / 'waypoint_sets.ttm'),
+                                 str(episode / 'configs.pkl'))
+            full = time_call(task_env.get_observation, args.repeats)
+            light = time_call(task_env.get_robot_state, args.repeats)
+            print('%s (%d repeats, %dx%d images)' % (
+                task_name, args.repeats, *args.image_size))
+            print('  get_observation: %8.2f ms +- %.2f' % (full.mean(), full.std()))
+            print('  get_robot_state: %8.2f ms +- %.2f' % (light.mean(), light.std()))
+            print('  saved per step:  %8.2f ms (%.1fx)' % (
+                full.mean() - light.mean(), full.mean() / max(light.mean(), 1e-9)))
+    finally:
+        env.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eval_set', default='base')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--image_size', type=int, nargs=2, default=[500, 500])
+    main(parser.parse_args())
@@ -93,6 +93,8 @@ class EBNavigationEnv(gym.Env):
         # set log and verbosity(0 for concise)
         self.feedback_verbosity = 0
         self.log_path = 'running/eb_nav/{}'.format(exp_name)
+        # saves images in the background when set, see evaluator.episode_runner.ImageWriter
+        self.image_writer = None
 
         self.multiview = multiview
         self.boundingbox = boundingbox
@@ -354,6 +356,12 @@ class EBNavigationEnv(gym.Env):
         self.env.random_initilize(seed)
 
 
+    def _save_png(self, img, image_path):
+        if self.image_writer is not None:
+            self.image_writer.save(img, image_path)
+        else:
+            img.save(image_path)
+
     def save_image(self, *args, **kwargs):
         """Save current agent view as a PNG image."""
         episode_idx = self._current_episode_num if not len(self.selected_indexes) else self.selected_indexes[self._current_episode_num - 1] + 1
@@ -367,8 +375,8 @@ class EBNavigationEnv(gym.Env):
             # image_path = 'episode_{}_step_{}_{}.png'.format(self._current_episode_num, self._current_step, time_stamp)
             image_path1 = os.path.join(self.log_path, 'episode_{}_step_{}_{}_front.png'.format(episode_idx, self._current_step, time_stamp))
             image_path2 = os.path.join(self.log_path, 'episode_{}_step_{}_{}_top.png'.format(episode_idx, self._current_step, time_stamp))
-            img1.save(image_path1)
-            img2.save(image_path2)
+            self._save_png(img1, image_path1)
+            self._save_png(img2, image_path2)
             return [image_path1, image_path2]
         
         elif self.multistep:
@@ -377,7 +385,7 @@ class EBNavigationEnv(gym.Env):
             time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
             # image_path = 'episode_{}_step_{}_{}.png'.format(self._current_episode_num, self._current_step, time_stamp)
             image_path = os.path.join(self.log_path, 'episode_{}_step_{}_{}_front.png'.format(episode_idx, self._current_step, time_stamp))
-            img.save(image_path)
+            self._save_png(img, image_path)
             self.img_paths.append(image_path)
             if self._current_step<3:
                 return self.img_paths
@@ -390,7 +398,7 @@ class EBNavigationEnv(gym.Env):
                 time_stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
                 # image_path = 'episode_{}_step_{}_{}.png'.format(self._current_episode_num, self._current_step, time_stamp)
                 image_path = os.path.join(self.log_path, 'episode_{}_step_{}_{}_front.png'.format(episode_idx, self._current_step, time_stamp))
-                img.save(image_path)
+                self._save_png(img, image_path)
                 return image_path
             else:
                 img = Image.fromarray(self.env.last_event.frame)
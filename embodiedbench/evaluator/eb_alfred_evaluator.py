@@ -7,6 +7,7 @@ from embodiedbench.envs.eb_alfred.EBAlfEnv import EBAlfEnv, ValidEvalSets
 from embodiedbench.planner.vlm_planner import VLMPlanner
 from embodiedbench.evaluator.summarize_result import average_json_values
 from embodiedbench.evaluator.evaluator_utils import load_saved_data, update_config_with_args
+from embodiedbench.evaluator.episode_runner import EpisodeRunner, END_EMPTY_PLAN, END_INVALID_ACTIONS
 from embodiedbench.evaluator.config.system_prompts import alfred_system_prompt
 from embodiedbench.main import logger
 
@@ -70,6 +71,8 @@ class EB_AlfredEvaluator():
 
     def evaluate(self):
         progress_bar = tqdm(total=self.env.number_of_episodes, desc="Episodes")
+        runner = EpisodeRunner.from_config(self.config)
+        self.env.image_writer = runner.image_writer
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'num_invalid_actions': 0, 'empty_plan': 0}
@@ -81,10 +84,16 @@ class EB_AlfredEvaluator():
             self.planner.reset()
             # update the action space for alfred due to dynamic objects
             self.planner.set_actions(self.env.language_skill_set)
+            runner.start_episode()
+            info = {
+                'task_success': 0,
+                'task_progress': 0,
+                'env_step': self.env._current_step,
+            }
             done = False
-            while not done:
-                try: 
-                    action, reasoning = self.planner.act(img_path, user_instruction)
+            while runner.should_continue(done):
+                with runner.guard():
+                    action, reasoning = runner.plan(self.planner.act, img_path, user_instruction)
                     print(f"Planner Output Action: {action}")
                     if action == -2: # empty plan stop here
                         episode_info['empty_plan'] = 1
@@ -99,6 +108,7 @@ class EB_AlfredEvaluator():
                             'task_progress': episode_info.get("task_progress", 0),
                             'env_step': self.env._current_step,
                         }
+                        runner.end(END_EMPTY_PLAN)
                         break 
                     if action == -1:
                         self.env._cur_invalid_actions += 1
@@ -116,13 +126,14 @@ class EB_AlfredEvaluator():
                             'env_step': self.env._current_step,
                         }
                         if self.env._cur_invalid_actions >= self.env._max_invalid_actions:
+                            runner.end(END_INVALID_ACTIONS)
                             break
                         continue
                     
                     # mutiple actions
                     if type(action) == list:
                         for action_single in action[:min(self.env._max_episode_steps - self.env._current_step, len(action))]:
-                            obs, reward, done, info = self.env.step(action_single, reasoning=reasoning)
+                            obs, reward, done, info = runner.step(self.env.step, action_single, reasoning=reasoning)
                             action_str = action_single if type(action_single) == str else self.env.language_skill_set[action_single]
                             print(f"Executed action: {action_str}, Task success: {info['task_success']}")
                             logger.debug(f"reward: {reward}")
@@ -136,7 +147,7 @@ class EB_AlfredEvaluator():
                                 print("Invalid action or task complete. If invalid then Replanning.")
                                 break
                     else: # single action
-                        obs, reward, done, info = self.env.step(action, reasoning=reasoning)
+                        obs, reward, done, info = runner.step(self.env.step, action, reasoning=reasoning)
                         action_str = action if type(action) == str else self.env.language_skill_set[action]
                         print(f"Executed action: {action_str}, Task success: {info['task_success']}")
                         logger.debug(f"reward: {reward}")
@@ -146,10 +157,6 @@ class EB_AlfredEvaluator():
                         img_path = self.env.save_image(obs)
                         episode_info['reward'].append(reward)
                         episode_info['num_invalid_actions'] += (info['last_action_success'] == 0)
-                
-                except Exception as e: 
-                    print(e)
-                    time.sleep(30)
 
             # evaluation metrics
             episode_info['instruction'] = user_instruction
@@ -162,10 +169,14 @@ class EB_AlfredEvaluator():
             episode_info["num_invalid_actions"] = episode_info['num_invalid_actions']
             episode_info["num_invalid_action_ratio"] = episode_info['num_invalid_actions'] / info["env_step"] if info['env_step'] > 0 else 0
             episode_info["episode_elapsed_seconds"] = info.get("episode_elapsed_seconds", time.time() - self.env._episode_start_time)
+            episode_info.update(runner.summary())
+            runner.flush_images()
 
             self.env.save_episode_log()
             self.save_episode_metric(episode_info)
             progress_bar.update()
+        runner.close()
+        self.env.image_writer = None
 
 
 if __name__ == '__main__':
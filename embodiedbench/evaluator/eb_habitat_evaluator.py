@@ -7,6 +7,7 @@ from embodiedbench.envs.eb_habitat.EBHabEnv import EBHabEnv, ValidEvalSets
 from embodiedbench.planner.vlm_planner import VLMPlanner
 from embodiedbench.evaluator.summarize_result import average_json_values
 from embodiedbench.evaluator.evaluator_utils import load_saved_data, update_config_with_args
+from embodiedbench.evaluator.episode_runner import EpisodeRunner, END_EMPTY_PLAN, END_INVALID_ACTIONS
 from embodiedbench.evaluator.config.system_prompts import habitat_system_prompt
 from embodiedbench.main import logger
 
@@ -42,7 +43,7 @@ class EB_HabitatEvaluator():
         
         
     def save_episode_metric(self, episode_info):
-        filename = 'episode_{}_final_res.json'.format(self.env._current_episode_num)
+        filename = 'episode_{}_final_res.json'.format(self.env.episode_num)
         res_path = os.path.join(self.env.log_path, 'results')
         if not os.path.exists(res_path):
             os.makedirs(res_path)
@@ -60,11 +61,15 @@ class EB_HabitatEvaluator():
                 self.env.close()
             self.eval_set = eval_set
             logger.info(f'Current eval set: {eval_set}')
+            model_type = self.config.get('model_type', 'remote')
             exp_name = f"{self.model_name.split('/')[-1]}_{self.config['exp_name']}/{eval_set}" if len(self.config['exp_name']) else f"{self.model_name.split('/')[-1]}/{eval_set}"
             self.env = EBHabEnv(eval_set=self.eval_set, down_sample_ratio=self.config['down_sample_ratio'], exp_name=exp_name,
-                                             start_epi_index=self.config.get('start_epi_index', 0), resolution=self.config.get('resolution', 500))
+                                             start_epi_index=self.config.get('start_epi_index', 0), resolution=self.config.get('resolution', 500),
+                                             render_profile=self.config.get('render_profile') or 'full',
+                                             # the custom model server always takes an image
+                                             language_only=bool(self.config['language_only']) and model_type != 'custom',
+                                             num_shards=self.config.get('num_shards') or 1, shard_id=self.config.get('shard_id') or 0)
 
-            model_type = self.config.get('model_type', 'remote')
             self.planner = VLMPlanner(self.model_name, model_type, self.env.language_skill_set, self.system_prompt, examples, n_shot=self.config['n_shots'], obs_key='head_rgb',
                                                  chat_history=self.config['chat_history'], language_only=self.config['language_only'], 
                                                  use_feedback=self.config.get('env_feedback', True), multistep=self.config.get('multistep', 0), tp=self.config.get('tp', 1))
@@ -76,6 +81,10 @@ class EB_HabitatEvaluator():
 
     def evaluate(self):
         progress_bar = tqdm(total=self.env.number_of_episodes, desc="Episodes")
+        runner = EpisodeRunner.from_config(self.config)
+        self.env.image_writer = runner.image_writer
+        # with the light profile only the images the planner reads are saved, multistep reads the earlier ones too
+        save_every_step = self.env.render_profile == 'full' or self.config.get('multistep', 0)
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'num_invalid_actions': 0, 'empty_plan': 0}
@@ -85,10 +94,17 @@ class EB_HabitatEvaluator():
             print(f"Instruction: {user_instruction}")
 
             self.planner.reset()
+            runner.start_episode()
+            info = {
+                'task_success': 0,
+                'task_progress': 0,
+                'subgoal_reward': 0,
+                'env_step': self.env._current_step,
+            }
             done = False
-            while not done:
-                try: 
-                    action, reasoning = self.planner.act(img_path, user_instruction)
+            while runner.should_continue(done):
+                with runner.guard():
+                    action, reasoning = runner.plan(self.planner.act, img_path, user_instruction)
                     print(f"Planner Output Action: {action}")
 
                     if action == -2: # empty plan stop here
@@ -105,6 +121,7 @@ class EB_HabitatEvaluator():
                             'subgoal_reward': episode_info.get("subgoal_reward", 0),
                             'env_step': self.env._current_step,
                         }
+                        runner.end(END_EMPTY_PLAN)
                         break 
                     if action == -1:
                         self.env._cur_invalid_actions += 1
@@ -123,27 +140,31 @@ class EB_HabitatEvaluator():
                             'env_step': self.env._current_step,
                         }
                         if self.env._cur_invalid_actions >= self.env._max_invalid_actions:
+                            runner.end(END_INVALID_ACTIONS)
                             break
                         continue
                     # multiple actions
                     if type(action) == list:
                         for action_single in action[:min(self.env._max_episode_steps - self.env._current_step, len(action))]:
-                            obs, reward, done, info = self.env.step(action_single, reasoning=reasoning)
+                            obs, reward, done, info = runner.step(self.env.step, action_single, reasoning=reasoning)
                             action_str = action_single if type(action_single) == str else self.env.language_skill_set[action_single]
                             print(f"Executed action: {action_str}, Task success: {info['task_success']}")
                             logger.debug(f"reward: {reward}")
                             logger.debug(f"terminate: {done}\n")
                             
                             self.planner.update_info(info)
-                            img_path = self.env.save_image(obs)
+                            if save_every_step:
+                                img_path = self.env.save_image(obs)
                             episode_info['reward'].append(reward)
                             episode_info['num_invalid_actions'] += (info['last_action_success'] == 0)
                             if done or info['last_action_success'] == 0:
                                 # stop or replanning
                                 print("Invalid action or task complete. If invalid then Replanning.")
                                 break
+                        if not save_every_step:
+                            img_path = self.env.save_image(obs)
                     else:
-                        obs, reward, done, info = self.env.step(action, reasoning=reasoning)
+                        obs, reward, done, info = runner.step(self.env.step, action, reasoning=reasoning)
                         action_str = action if type(action) == str else self.env.language_skill_set[action]
                         print(f"Executed action: {action_str}, Task success: {info['task_success']}")
                         logger.debug(f"reward: {reward}")
@@ -153,10 +174,6 @@ class EB_HabitatEvaluator():
                         img_path = self.env.save_image(obs)
                         episode_info['reward'].append(reward)
                         episode_info['num_invalid_actions'] += (info['last_action_success'] == 0)
-                
-                except Exception as e: 
-                    print(e)
-                    time.sleep(30)
 
             # evaluation metrics
             episode_info['instruction'] = user_instruction
@@ -170,10 +187,14 @@ class EB_HabitatEvaluator():
             episode_info["num_invalid_actions"] = episode_info['num_invalid_actions']
             episode_info["num_invalid_action_ratio"] = episode_info['num_invalid_actions'] / info["env_step"] if info['env_step'] > 0 else 0
             episode_info["episode_elapsed_seconds"] = info.get("episode_elapsed_seconds", time.time() - self.env._episode_start_time)
+            episode_info.update(runner.summary())
+            runner.flush_images()
             
             self.env.save_episode_log()
             self.save_episode_metric(episode_info)
             progress_bar.update()
+        runner.close()
+        self.env.image_writer = None
 
 
 if __name__ == '__main__':
@@ -1,17 +1,38 @@
 import re
 import os
+import shutil
+import time
 import numpy as np
 from tqdm import tqdm
 import json
 import copy
 import argparse
+import multiprocessing as mp
+from collections import Counter
+from pathlib import Path
 from embodiedbench.evaluator.config.system_prompts import eb_manipulation_system_prompt
-from embodiedbench.envs.eb_manipulation.EBManEnv import EBManEnv, EVAL_SETS, ValidEvalSets
+from embodiedbench.envs.eb_manipulation.EBManEnv import EBManEnv, EVAL_SETS, ValidEvalSets, TTMS_FOLDER, load_episode_manifest
 from embodiedbench.envs.eb_manipulation.eb_man_utils import form_object_coord_for_input, draw_bounding_boxes, draw_xyz_coordinate
 from embodiedbench.planner.manip_planner import ManipPlanner
+from embodiedbench.evaluator.episode_runner import EpisodeRunner, END_EMPTY_PLAN, END_CRASHED
 from embodiedbench.evaluator.config.eb_manipulation_example import vlm_examples_baseline, llm_examples, vlm_examples_ablation
 from embodiedbench.main import logger
 
+# A simulator crash on the same episode this many times skips the episode
+MAX_EPISODE_CRASHES = 2
+
+
+def _evaluate_shard(config, eval_set, log_path, selected_indexes):
+    """Worker entry point: evaluates a subset of an eval set in its own
+    CoppeliaSim instance, writing results under `log_path`."""
+    evaluator = EB_ManipulationEvaluator(config)
+    evaluator.eval_set = eval_set
+    evaluator.log_path = log_path
+    evaluator.env = EBManEnv(eval_set=eval_set, img_size=(config['resolution'], config['resolution']), log_path=log_path, selected_indexes=selected_indexes)
+    evaluator.planner = evaluator.build_planner()
+    evaluator.evaluate()
+
+
 class EB_ManipulationEvaluator():
     def __init__(self, config):
         self.model_name = config['model_name']
@@ -90,7 +111,7 @@ class EB_ManipulationEvaluator():
         task_log["avg_planner_steps"] = planner_steps / total_number_of_task
         task_log["output_format_error"] = output_format_error
 
-        res_path = os.path.join(self.env.log_path, 'results')
+        res_path = os.path.join(self.log_path, 'results')
         if not os.path.exists(res_path):
             os.makedirs(res_path)
         with open(os.path.join(res_path, filename), 'w', encoding='utf-8') as f:
@@ -98,6 +119,7 @@ class EB_ManipulationEvaluator():
 
     def evaluate(self):
         progress_bar = tqdm(total=self.env.number_of_episodes, desc="Episodes")
+        runner = EpisodeRunner.from_config(self.config)
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': [], 'action_success': []}
@@ -122,49 +144,53 @@ class EB_ManipulationEvaluator():
             user_instruction = self.env.episode_language_instruction
             print(f"Instruction: {user_instruction}")
             self.planner.reset()
+            runner.start_episode()
+            info = {'task_success': 0, 'episode_elapsed_seconds': 0}
             done = False
             reasoning_list = []
 
-            while not done:
-                if self.config['multistep']:
-                    action, reasoning = self.planner.act(image_history, user_instruction, str(avg_obj_coord), self.env.current_task_variation)
-                else:
-                    action, reasoning = self.planner.act(img_path_list, user_instruction, str(avg_obj_coord), self.env.current_task_variation)
-                print(f"Planner Output Action: {action}")
-                reasoning_list.append(reasoning)
-                if len(action) == 0:
-                    episode_info['reward'].append(0)
-                    episode_info['action_success'].append(0)
-                    info = {'task_success': 0, 'episode_elapsed_seconds': 0}
-                    break
-                else:
-                    for action_single in action[:min(self.env._max_episode_steps - self.env._current_step, len(action))]:
-                        obs, reward, done, info = self.env.step(action_single)
-                        print(f"Executed action: {action_single}, Task success: {info['task_success']}")
-                        logger.debug(f"reward: {reward}")
-                        logger.debug(f"terminate: {done}\n")
-                        self.planner.update_info(info)
-                        img_path_list = self.env.save_image(camera_views)
-                        for img_path in img_path_list:
-                            if self.config['multistep']:
-                                image_history.append(img_path)
-                        episode_info['reward'].append(reward)
-                        episode_info['action_success'].append(info['action_success'])
-                        if done:
-                            break
+            while runner.should_continue(done):
+                with runner.guard():
+                    if self.config['multistep']:
+                        action, reasoning = runner.plan(self.planner.act, image_history, user_instruction, str(avg_obj_coord), self.env.current_task_variation)
+                    else:
+                        action, reasoning = runner.plan(self.planner.act, img_path_list, user_instruction, str(avg_obj_coord), self.env.current_task_variation)
+                    print(f"Planner Output Action: {action}")
+                    reasoning_list.append(reasoning)
+                    if len(action) == 0:
+                        episode_info['reward'].append(0)
+                        episode_info['action_success'].append(0)
+                        info = {'task_success': 0, 'episode_elapsed_seconds': 0}
+                        runner.end(END_EMPTY_PLAN)
+                        break
+                    else:
+                        for action_single in action[:min(self.env._max_episode_steps - self.env._current_step, len(action))]:
+                            obs, reward, done, info = runner.step(self.env.step, action_single)
+                            print(f"Executed action: {action_single}, Task success: {info['task_success']}")
+                            logger.debug(f"reward: {reward}")
+                            logger.debug(f"terminate: {done}\n")
+                            self.planner.update_info(info)
+                            img_path_list = self.env.save_image(camera_views)
+                            for img_path in img_path_list:
+                                if self.config['multistep']:
+                                    image_history.append(img_path)
+                            episode_info['reward'].append(reward)
+                            episode_info['action_success'].append(info['action_success'])
+                            if done:
+                                break
                 
-                avg_obj_coord, all_avg_point_list, camera_extrinsics_list, camera_intrinsics_list = form_object_coord_for_input(copy.deepcopy(obs), self.env.task_class, camera_views)
-                if not done:
-                    if not self.config['language_only']:
-                        for i, img_path in enumerate(img_path_list):
-                            if 'front_rgb' in img_path:
-                                img_path_list[i] = draw_xyz_coordinate(img_path, self.config['resolution'])
-                    if self.config['detection_box'] and not self.config['language_only']:
-                        img_path_list = draw_bounding_boxes(img_path_list, all_avg_point_list, camera_extrinsics_list, camera_intrinsics_list)
-                        if self.config['multistep']:
-                            if image_history[-1].split('.png')[0] in img_path_list[0]:
-                                image_history.pop()
-                                image_history.append(img_path_list[0])
+                    avg_obj_coord, all_avg_point_list, camera_extrinsics_list, camera_intrinsics_list = form_object_coord_for_input(copy.deepcopy(obs), self.env.task_class, camera_views)
+                    if not done:
+                        if not self.config['language_only']:
+                            for i, img_path in enumerate(img_path_list):
+                                if 'front_rgb' in img_path:
+                                    img_path_list[i] = draw_xyz_coordinate(img_path, self.config['resolution'])
+                        if self.config['detection_box'] and not self.config['language_only']:
+                            img_path_list = draw_bounding_boxes(img_path_list, all_avg_point_list, camera_extrinsics_list, camera_intrinsics_list)
+                            if self.config['multistep']:
+                                if image_history[-1].split('.png')[0] in img_path_list[0]:
+                                    image_history.pop()
+                                    image_history.append(img_path_list[0])
             
             # evaluation metrics
             episode_info['instruction'] = user_instruction
@@ -174,11 +200,134 @@ class EB_ManipulationEvaluator():
             episode_info['planner_steps'] = self.planner.planner_steps
             episode_info['planner_output_error'] = self.planner.output_json_error
             episode_info["episode_elapsed_seconds"] = info["episode_elapsed_seconds"]
+            episode_info.update(runner.summary())
             self.save_episode_metric(episode_info)
             self.save_planner_outputs(reasoning_list)
             progress_bar.update()
         self.print_task_eval_results(filename="summary.json")
         self.env.close()
+
+    def evaluate_parallel(self, num_workers):
+        """Evaluates the current eval set with `num_workers` CoppeliaSim
+        instances, one per process.
+
+        Episodes are dealt round-robin to the workers. A worker that dies is
+        relaunched on the episodes it has not finished yet, and results are
+        merged back into the same layout (and episode numbering) as a
+        serial run.
+        """
+        data_folder = Path(os.path.join(TTMS_FOLDER, f'data/{self.eval_set}/eval'))
+        manifest = load_episode_manifest(data_folder, rebuild=self.config.get('rebuild_index', False))
+        number_of_episodes = sum(len(manifest['tasks'].get(t, [])) for t in EVAL_SETS[self.eval_set])
+        if self.config['down_sample_ratio'] < 1.0:
+            number_of_episodes = int(number_of_episodes * self.config['down_sample_ratio'])
+        pending = {k: list(range(number_of_episodes))[k::num_workers] for k in range(num_workers)}
+        crashes = Counter()
+        runs = []
+        active = {}
+        ctx = mp.get_context('spawn')
+
+        def launch(k):
+            run_log_path = os.path.join(self.log_path, 'workers', 'run_{}'.format(len(runs)))
+            runs.append((run_log_path, pending[k]))
+            p = ctx.Process(target=_evaluate_shard, args=(self.config, self.eval_set, run_log_path, pending[k]))
+            p.start()
+            active[k] = (p, len(runs) - 1)
+
+        for k in range(num_workers):
+            if len(pending[k]) > 0:
+                launch(k)
+        progress_bar = tqdm(total=number_of_episodes, desc="Episodes")
+        finished = 0
+        while len(active) > 0:
+            time.sleep(5)
+            done_now = sum(len(self._finished_episodes(*run)) for run in runs)
+            progress_bar.update(done_now - finished)
+            finished = done_now
+            for k, (p, run_id) in list(active.items()):
+                if p.is_alive():
+                    continue
+                del active[k]
+                done = self._finished_episodes(*runs[run_id])
+                pending[k] = [i for i in pending[k] if i not in done]
+                if len(pending[k]) == 0:
+                    continue
+                # Episodes run in order, so the first unfinished one crashed
+                crashed = pending[k][0]
+                crashes[crashed] += 1
+                logger.warning(f"Worker {k} exited with code {p.exitcode} on episode {crashed + 1}, restarting ...")
+                if crashes[crashed] >= MAX_EPISODE_CRASHES:
+                    logger.error(f"Skipping episode {crashed + 1} after {crashes[crashed]} crashes.")
+                    self._save_crashed_episode(crashed)
+                    pending[k] = pending[k][1:]
+                if len(pending[k]) > 0:
+                    launch(k)
+        progress_bar.close()
+        self._merge_worker_results(runs)
+        self.print_task_eval_results(filename="summary.json")
+
+    @staticmethod
+    def _finished_episodes(run_log_path, selected_indexes):
+        # Workers number their episodes from 1 in the order of selected_indexes
+        res_path = os.path.join(run_log_path, 'results')
+        if not os.path.exists(res_path):
+            return {}
+        finished = {}
+        for file_name in os.listdir(res_path):
+            match = re.match(r'episode_(\d+)_res\.json$', file_name)
+            if match:
+                local_num = int(match.group(1))
+                finished[selected_indexes[local_num - 1]] = local_num
+        return finished
+
+    def _save_crashed_episode(self, index):
+        # Counted as a failure, so that the summary covers the same episodes as a serial run
+        episode_info = {'reward': [], 'action_success': [], 'task_success': 0, 'num_steps': 0,
+                        'planner_steps': 0, 'planner_output_error': 0, 'episode_elapsed_seconds': 0,
+                        'end_reason': END_CRASHED}
+        res_path = os.path.join(self.log_path, 'results')
+        os.makedirs(res_path, exist_ok=True)
+        with open(os.path.join(res_path, 'episode_{}_res.json'.format(index + 1)), 'w', encoding='utf-8') as f:
+            json.dump(episode_info, f, ensure_ascii=False)
+
+    def _merge_worker_results(self, runs):
+        res_path = os.path.join(self.log_path, 'results')
+        img_path = os.path.join(self.log_path, 'images')
+        os.makedirs(res_path, exist_ok=True)
+        os.makedirs(img_path, exist_ok=True)
+        for run_log_path, selected_indexes in runs:
+            for index, local_num in self._finished_episodes(run_log_path, selected_indexes).items():
+                run_res_path = os.path.join(run_log_path, 'results')
+                shutil.move(os.path.join(run_res_path, 'episode_{}_res.json'.format(local_num)),
+                            os.path.join(res_path, 'episode_{}_res.json'.format(index + 1)))
+                planner_output = os.path.join(run_res_path, 'planner_output_episode_{}.txt'.format(local_num))
+                if os.path.exists(planner_output):
+                    shutil.move(planner_output, os.path.join(res_path, 'planner_output_episode_{}.txt'.format(index + 1)))
+                images = os.path.join(run_log_path, 'images', 'episode_{}'.format(local_num))
+                if os.path.exists(images):
+                    episode_images = os.path.join(img_path, 'episode_{}'.format(index + 1))
+                    shutil.move(images, episode_images)
+                    # Images are named episode_<num>_step_..., also renumbered
+                    local_prefix = 'episode_{}_'.format(local_num)
+                    for file_name in os.listdir(episode_images):
+                        if file_name.startswith(local_prefix):
+                            os.rename(os.path.join(episode_images, file_name),
+                                      os.path.join(episode_images, 'episode_{}_{}'.format(index + 1, file_name[len(local_prefix):])))
+        shutil.rmtree(os.path.join(self.log_path, 'workers'), ignore_errors=True)
+
+    def build_planner(self):
+        ic_examples = self.load_demonstration()
+        return ManipPlanner(model_name=self.model_name,
+                            model_type=self.config['model_type'],
+                            system_prompt=eb_manipulation_system_prompt, 
+                            examples=ic_examples, 
+                            n_shot=self.config["n_shots"], 
+                            chat_history=self.config["chat_history"],
+                            language_only=self.config["language_only"],
+                            multiview=self.config["multiview"],
+                            multistep=self.config["multistep"],
+                            visual_icl=self.config["visual_icl"],
+                            tp=self.config["tp"])
     
     def evaluate_main(self):
         valid_eval_sets = self.config.get('eval_sets', ValidEvalSets)
@@ -207,20 +356,14 @@ class EB_ManipulationEvaluator():
                                                                                                     self.eval_set)
             else:
                 self.log_path = 'running/eb_manipulation/{}/{}/{}'.format(real_model_name, self.config["exp_name"], self.eval_set)
-            self.env = EBManEnv(eval_set=self.eval_set, img_size=(self.config['resolution'], self.config['resolution']), down_sample_ratio=self.config["down_sample_ratio"], log_path=self.log_path)
-            ic_examples = self.load_demonstration()
-            self.planner = ManipPlanner(model_name=self.model_name,
-                                        model_type=self.config['model_type'],
-                                        system_prompt=eb_manipulation_system_prompt, 
-                                        examples=ic_examples, 
-                                        n_shot=self.config["n_shots"], 
-                                        chat_history=self.config["chat_history"],
-                                        language_only=self.config["language_only"],
-                                        multiview=self.config["multiview"],
-                                        multistep=self.config["multistep"],
-                                        visual_icl=self.config["visual_icl"],
-                                        tp=self.config["tp"])
-            self.evaluate()
+            num_workers = self.config.get('num_workers', 1) or 1
+            if num_workers > 1:
+                self.env = None
+                self.evaluate_parallel(num_workers)
+            else:
+                self.env = EBManEnv(eval_set=self.eval_set, img_size=(self.config['resolution'], self.config['resolution']), down_sample_ratio=self.config["down_sample_ratio"], log_path=self.log_path, rebuild_index=self.config.get('rebuild_index', False))
+                self.planner = self.build_planner()
+                self.evaluate()
             with open(os.path.join(self.log_path, 'config.txt'), 'w') as f:
                 f.write(str(self.config))
                 
@@ -250,6 +393,8 @@ if __name__ == '__main__':
     parser.add_argument('--exp_name', type=str)
     parser.add_argument('--visual_icl', type=int, default=0)
     parser.add_argument('--tp', type=int, default=1, help='number of tensor parallel splits of the model parameters')
+    parser.add_argument('--num_workers', type=int, default=1, help='number of parallel CoppeliaSim instances')
+    parser.add_argument('--rebuild_index', type=int, default=0, help='Whether to rebuild the episode manifest of the eval data.')
     args = parser.parse_args()
 
     print("\n******** Evaluating eval set: {}, model: {} ********".format(args.eval_sets, args.model_name))
@@ -268,6 +413,8 @@ if __name__ == '__main__':
         'visual_icl': args.visual_icl,
         'exp_name': args.exp_name,
         'tp': args.tp,
+        'num_workers': args.num_workers,
+        'rebuild_index': args.rebuild_index,
         'selected_indexes': [0, 12]
     }
     print("printing config ...")
@@ -1,16 +1,16 @@
 import re
 import os
+import time
 import numpy as np
 from tqdm import tqdm
 import json
 from embodiedbench.envs.eb_navigation.EBNavEnv import EBNavigationEnv, ValidEvalSets
 from embodiedbench.planner.nav_planner import EBNavigationPlanner
 from embodiedbench.evaluator.summarize_result import average_json_values
+from embodiedbench.evaluator.episode_runner import EpisodeRunner
 import sys
 import warnings
 
-from time import sleep
-
 from embodiedbench.evaluator.config.system_prompts import eb_navigation_system_prompt
 from embodiedbench.evaluator.config.eb_navigation_example import examples
 from embodiedbench.main import logger
@@ -70,6 +70,8 @@ class EB_NavigationEvaluator():
 
     def evaluate(self):
         progress_bar = tqdm(total=self.env.number_of_episodes, desc="Episodes")
+        runner = EpisodeRunner.from_config(self.config)
+        self.env.image_writer = runner.image_writer
         while self.env._current_episode_num < self.env.number_of_episodes:
             logger.info(f"Evaluating episode {self.env._current_episode_num} ...")
             episode_info = {'reward': []}
@@ -78,18 +80,20 @@ class EB_NavigationEvaluator():
             user_instruction = self.env.episode_language_instruction
             print(f"Instruction: {user_instruction}")
             self.planner.reset()
+            runner.start_episode()
+            info = {'task_success': 0, 'env_step': self.env._current_step}
             done = False
-            while not done:
-                try:
-                    action, reasoning = self.planner.act(img_path, user_instruction)
+            while runner.should_continue(done):
+                with runner.guard():
+                    action, reasoning = runner.plan(self.planner.act, img_path, user_instruction)
                     print(f"Planner Output Action: {action}")
                     reasoning = json.loads(reasoning)
                     if type(action) == list:
                         for i, action_single in enumerate( action[:min(self.env._max_episode_steps - self.env._current_step + 1, len(action))] ):
                             if i==0:
-                                obs, reward, done, info = self.env.step(action_single,reasoning,1)
+                                obs, reward, done, info = runner.step(self.env.step, action_single, reasoning, 1)
                             else:
-                                obs, reward, done, info = self.env.step(action_single,reasoning,0)
+                                obs, reward, done, info = runner.step(self.env.step, action_single, reasoning, 0)
                             print(f"Executed action: {action_single}, Task success: {info['task_success']}")
                             logger.debug(f"reward: {reward}")
                             logger.debug(f"terminate: {done}\n")
@@ -105,7 +109,7 @@ class EB_NavigationEvaluator():
                                 print('invalid action, start replanning')
                                 break
                     else:
-                        obs, reward, done, info = self.env.step(action, reasoning, 1)
+                        obs, reward, done, info = runner.step(self.env.step, action, reasoning, 1)
                         print(f"Executed action: {action}, Task success: {info['task_success']}")
                         logger.debug(f"reward: {reward}")
                         logger.debug(f"terminate: {done}\n")
@@ -113,12 +117,6 @@ class EB_NavigationEvaluator():
                         img_path = self.env.save_image(obs)
                         episode_info['reward'].append(reward)
 
-                except Exception as e:
-                    sleep(1)
-                    print(e)
-                    print("retrying...")
-
-
             # evaluation metrics
             episode_info['instruction'] = user_instruction
             episode_info['reward'] = np.mean(episode_info['reward'])
@@ -130,9 +128,13 @@ class EB_NavigationEvaluator():
             episode_info['planner_output_error'] = self.planner.output_json_error
             # episode_info["num_invalid_actions"] = info["num_invalid_actions"]
             # episode_info["num_invalid_action_ratio"] = info["num_invalid_actions"] / info["env_step"]
-            episode_info["episode_elapsed_seconds"] = info["episode_elapsed_seconds"]
+            episode_info["episode_elapsed_seconds"] = info.get("episode_elapsed_seconds", time.time() - self.env._episode_start_time)
+            episode_info.update(runner.summary())
+            runner.flush_images()
             self.save_episode_metric(episode_info)
             progress_bar.update()
+        runner.close()
+        self.env.image_writer = None
 
     def check_config_valid(self):
         if self.config['multiview'] + self.config['multistep'] + self.config['visual_icl'] + self.config['chat_history'] > 1:
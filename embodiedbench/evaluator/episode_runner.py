@@ -0,0 +1,189 @@
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from embodiedbench.main import logger
+
+# Why an episode stopped, saved as `end_reason` in the episode results
+END_DONE = 'done'
+END_EMPTY_PLAN = 'empty_plan'
+END_INVALID_ACTIONS = 'invalid_action_limit'
+END_TIME_BUDGET = 'time_budget'
+END_PLANNER_BUDGET = 'planner_budget'
+END_STEP_BUDGET = 'step_budget'
+END_ERROR_LIMIT = 'error_limit'
+# The simulator crashed on the episode too many times, see EB_ManipulationEvaluator
+END_CRASHED = 'crashed'
+
+# Defaults of the config keys read by EpisodeRunner.from_config, None disables a budget
+RUNNER_DEFAULTS = {
+    'max_episode_seconds': 3600,
+    'max_planner_calls': 100,
+    'max_env_steps': None,
+    'max_consecutive_errors': 5,
+    'error_backoff_seconds': 2.0,
+    'max_error_backoff_seconds': 60.0,
+}
+
+
+class ImageWriter():
+    """
+    Saves PIL images on a background thread, so the PNG encoding of one step's
+    image overlaps with the next env step. Envs use it for `save_image` when
+    their `image_writer` is set; `flush` must be called before the images are
+    read back, e.g. by the planner.
+    """
+
+    def __init__(self, max_pending=8):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def save(self, img, path):
+        # the array behind img may be reused by the env
+        self._pending.append(self._executor.submit(img.copy().save, path))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft().result()
+
+    def flush(self):
+        """
+        Waits for all submitted images, raising the first error of a failed save.
+        """
+        while len(self._pending):
+            self._pending.popleft().result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+class EpisodeRunner():
+    """
+    Stopping rules shared by the evaluators' episode loops.
+
+    Tracks the wall-clock time, planner calls and env steps of an episode
+    against their budgets, and turns exceptions raised inside `guard()` into
+    retries with exponential backoff, up to `max_consecutive_errors` in a row.
+    The budgets are checked between planner calls, so a plan of several actions
+    is always executed as a whole. With `async_image_saving`, `image_writer`
+    saves the env's images in the background; `plan` waits for them first
+    since the planner reads the latest one from disk.
+
+        runner.start_episode()
+        done = False
+        while runner.should_continue(done):
+            with runner.guard():
+                action, reasoning = runner.plan(planner.act, img_path, instruction)
+                obs, reward, done, info = runner.step(env.step, action)
+        episode_info.update(runner.summary())
+    """
+
+    def __init__(self, max_episode_seconds=None, max_planner_calls=None, max_env_steps=None,
+                 max_consecutive_errors=None, error_backoff_seconds=2.0, max_error_backoff_seconds=60.0,
+                 async_image_saving=False):
+        self.max_episode_seconds = max_episode_seconds
+        self.max_planner_calls = max_planner_calls
+        self.max_env_steps = max_env_steps
+        self.max_consecutive_errors = max_consecutive_errors
+        self.error_backoff_seconds = error_backoff_seconds
+        self.max_error_backoff_seconds = max_error_backoff_seconds
+        self.image_writer = ImageWriter() if async_image_saving else None
+        self.start_episode()
+
+    @classmethod
+    def from_config(cls, config):
+        kwargs = {}
+        for key, default in RUNNER_DEFAULTS.items():
+            value = config.get(key, None)
+            kwargs[key] = default if value is None else value
+            # a non-positive value disables the budget
+            if key.startswith('max_') and kwargs[key] is not None and kwargs[key] <= 0:
+                kwargs[key] = None
+        kwargs['async_image_saving'] = bool(config.get('async_image_saving', True))
+        return cls(**kwargs)
+
+    def start_episode(self):
+        self.start_time = time.time()
+        self.planner_calls = 0
+        self.env_steps = 0
+        self.num_errors = 0
+        self.consecutive_errors = 0
+        self.end_reason = None
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def end(self, reason):
+        """
+        Records why the episode ended, the first reason wins.
+        """
+        if self.end_reason is None:
+            self.end_reason = reason
+
+    def should_continue(self, done=False):
+        if self.end_reason is not None:
+            return False
+        if done:
+            self.end(END_DONE)
+        elif self.max_episode_seconds is not None and self.elapsed() >= self.max_episode_seconds:
+            self.end(END_TIME_BUDGET)
+        elif self.max_planner_calls is not None and self.planner_calls >= self.max_planner_calls:
+            self.end(END_PLANNER_BUDGET)
+        elif self.max_env_steps is not None and self.env_steps >= self.max_env_steps:
+            self.end(END_STEP_BUDGET)
+        elif self.max_consecutive_errors is not None and self.consecutive_errors >= self.max_consecutive_errors:
+            self.end(END_ERROR_LIMIT)
+        if self.end_reason is not None:
+            if self.end_reason != END_DONE:
+                logger.warning(f"Episode stopped: {self.end_reason}")
+            return False
+        return True
+
+    def plan(self, act_fn, *args, **kwargs):
+        self.planner_calls += 1
+        self.flush_images()
+        return act_fn(*args, **kwargs)
+
+    def step(self, step_fn, *args, **kwargs):
+        self.env_steps += 1
+        return step_fn(*args, **kwargs)
+
+    @contextmanager
+    def guard(self):
+        """
+        Runs one planner call and the steps of its plan. An exception is
+        logged and followed by a backoff sleep instead of being raised.
+        """
+        try:
+            yield
+        except Exception as e:
+            self.num_errors += 1
+            self.consecutive_errors += 1
+            logger.warning(f"Error {self.consecutive_errors} in a row: {e}")
+            logger.debug(traceback.format_exc())
+            if self.max_consecutive_errors is not None and self.consecutive_errors >= self.max_consecutive_errors:
+                return
+            backoff = self.error_backoff_seconds * 2 ** (self.consecutive_errors - 1)
+            if self.max_error_backoff_seconds is not None:
+                backoff = min(backoff, self.max_error_backoff_seconds)
+            if self.max_episode_seconds is not None:
+                backoff = min(backoff, max(0, self.max_episode_seconds - self.elapsed()))
+            print(f"Retrying in {backoff:.1f}s ...")
+            time.sleep(backoff)
+        else:
+            self.consecutive_errors = 0
+
+    def flush_images(self):
+        if self.image_writer is not None:
+            self.image_writer.flush()
+
+    def close(self):
+        if self.image_writer is not None:
+            self.image_writer.close()
+
+    def summary(self):
+        return {
+            'end_reason': self.end_reason,
+            'num_errors': self.num_errors,
+        }
@@ -470,6 +470,9 @@ class HabitatBaselinesConfig(HabitatBaselinesBaseConfig):
     verbose: bool = True
     # Creates the vectorized environment.
     vector_env_factory: VectorEnvFactoryConfig = VectorEnvFactoryConfig()
+    # Whether the env workers send the image observations back through
+    # shared memory instead of pickling them through their pipe.
+    shared_memory_observations: bool = False
     evaluator: EvaluatorConfig = EvaluatorConfig()
     eval_keys_to_include_in_name: List[str] = field(default_factory=list)
     # For our use case, the CPU side things are mainly memory copies
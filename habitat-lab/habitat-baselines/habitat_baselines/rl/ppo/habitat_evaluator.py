@@ -9,6 +9,7 @@ import tqdm
 from habitat import logger
 from habitat.tasks.rearrange.rearrange_sensors import GfxReplayMeasure
 from habitat.tasks.rearrange.utils import write_gfx_replay
+from habitat.utils.visualizations.maps import TopDownMapRenderer
 from habitat.utils.visualizations.utils import (
     observations_to_image,
     overlay_frame,
@@ -94,6 +95,12 @@ class HabitatEvaluator(Evaluator):
                 ]
                 for env_idx in range(config.habitat_baselines.num_environments)
             ]
+            # The renderers stay correct for any sequence of maps, so they
+            # are not reordered when envs are paused.
+            top_down_map_renderers = [
+                TopDownMapRenderer()
+                for _ in range(config.habitat_baselines.num_environments)
+            ]
         else:
             rgb_frames = None
 
@@ -224,7 +231,9 @@ class HabitatEvaluator(Evaluator):
                 if len(config.habitat_baselines.eval.video_option) > 0:
                     # TODO move normalization / channel changing out of the policy and undo it here
                     frame = observations_to_image(
-                        {k: v[i] for k, v in batch.items()}, disp_info
+                        {k: v[i] for k, v in batch.items()},
+                        disp_info,
+                        top_down_map_renderers[i],
                     )
                     if not not_done_masks[i].any().item():
                         # The last frame corresponds to the first frame of the next episode
@@ -232,6 +241,7 @@ class HabitatEvaluator(Evaluator):
                         final_frame = observations_to_image(
                             {k: v[i] * 0.0 for k, v in batch.items()},
                             disp_info,
+                            top_down_map_renderers[i],
                         )
                         final_frame = overlay_frame(final_frame, disp_info)
                         rgb_frames[i].append(final_frame)
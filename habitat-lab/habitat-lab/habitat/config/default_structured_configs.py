@@ -1629,6 +1629,11 @@ class SimulatorConfig(HabitatBaseConfig):
     default_agent_navmesh: bool = True
     # if default navmesh is used, should it include static objects
     navmesh_include_static_objects: bool = False
+    # Directory where `RearrangeSim` caches the recomputed navmesh, largest
+    # indoor island index and receptacle bounds of each scene, keyed by a
+    # hash of the scene files and navmesh settings. It can be shared by all
+    # workers. None disables the cache.
+    scene_cache_dir: Optional[str] = None
 
     habitat_sim_v0: HabitatSimV0Config = HabitatSimV0Config()
     # ep_info is added to the config in some rearrange tasks inside
@@ -4,10 +4,12 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
 import signal
 import warnings
 from multiprocessing.connection import Connection
 from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
 from queue import Queue
 from threading import Thread
 from typing import (
@@ -65,6 +67,7 @@ RENDER_COMMAND = "render"
 CLOSE_COMMAND = "close"
 CALL_COMMAND = "call"
 COUNT_EPISODES_COMMAND = "count_episodes"
+SHARED_OBSERVATIONS_COMMAND = "shared_observations"
 
 EPISODE_OVER_NAME = "episode_over"
 GET_METRICS_NAME = "get_metrics"
@@ -92,6 +95,112 @@ def _make_env_fn(
     return habitat_env
 
 
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class _SharedArray:
+    r"""Placeholder sent over the pipe in place of an observation that the
+    worker wrote to the shared-memory buffer of its env.
+    """
+    key: str
+
+
+class _SharedObservations:
+    r"""Shared-memory buffer of one env holding its fixed-size observations.
+
+    Created by the parent process and attached to by the worker. For every
+    :ref:`spaces.Box` of the observation space the buffer has one slot, the
+    worker writes the observation of that key into its slot and only sends a
+    :ref:`_SharedArray` placeholder through the pipe. The parent copies the
+    slots back into the observation dict, so the returned arrays stay valid
+    after the next step.
+    """
+
+    # Slots start on a cache line
+    _ALIGNMENT = 64
+
+    def __init__(
+        self,
+        layout: Dict[str, Tuple[int, Tuple[int, ...], str]],
+        name: Optional[str] = None,
+    ) -> None:
+        self.layout = layout
+        size = max(
+            (
+                offset + int(np.prod(shape)) * np.dtype(dtype).itemsize
+                for offset, shape, dtype in layout.values()
+            ),
+            default=0,
+        )
+        self._shm = SharedMemory(name=name, create=name is None, size=size)
+        self._is_owner = name is None
+        self.arrays = {
+            key: np.ndarray(
+                shape,
+                dtype=np.dtype(dtype),
+                buffer=self._shm.buf,
+                offset=offset,
+            )
+            for key, (offset, shape, dtype) in layout.items()
+        }
+
+    @classmethod
+    def from_observation_space(
+        cls, observation_space: spaces.Dict
+    ) -> Optional["_SharedObservations"]:
+        layout = {}
+        offset = 0
+        for key, space in observation_space.spaces.items():
+            if not isinstance(space, spaces.Box) or space.dtype is None:
+                continue
+            nbytes = int(np.prod(space.shape)) * space.dtype.itemsize
+            if nbytes == 0:
+                continue
+            layout[key] = (offset, tuple(space.shape), space.dtype.str)
+            offset += -(-nbytes // cls._ALIGNMENT) * cls._ALIGNMENT
+        if len(layout) == 0:
+            return None
+        return cls(layout)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def write(self, observations: Any) -> Any:
+        r"""Worker side. Moves the observations matching the layout into the
+        buffer and returns a shallow copy of :p:`observations` holding
+        placeholders for them. Anything else is left to the pipe.
+        """
+        if not isinstance(observations, dict):
+            return observations
+        encoded = copy.copy(observations)
+        for key, array in self.arrays.items():
+            value = observations.get(key)
+            if (
+                isinstance(value, np.ndarray)
+                and value.shape == array.shape
+                and value.dtype == array.dtype
+            ):
+                np.copyto(array, value)
+                encoded[key] = _SharedArray(key)
+        return encoded
+
+    def read(self, observations: Any) -> Any:
+        r"""Parent side. Replaces the placeholders in :p:`observations` with
+        copies of the buffer.
+        """
+        if not isinstance(observations, dict):
+            return observations
+        for key, value in observations.items():
+            if isinstance(value, _SharedArray):
+                observations[key] = self.arrays[value.key].copy()
+        return observations
+
+    def close(self) -> None:
+        self.arrays = {}
+        self._shm.close()
+        if self._is_owner:
+            self._shm.unlink()
+
+
 @attr.s(auto_attribs=True, slots=True)
 class _ReadWrapper:
     r"""Convenience wrapper to track if a connection to a worker process
@@ -100,6 +209,7 @@ class _ReadWrapper:
     read_fn: Callable[[], Any]
     rank: int
     is_waiting: bool = False
+    shared_observations: Optional[_SharedObservations] = None
 
     def __call__(self) -> Any:
         if not self.is_waiting:
@@ -159,6 +269,7 @@ class VectorEnv:
         auto_reset_done: bool = True,
         multiprocessing_start_method: str = "forkserver",
         workers_ignore_signals: bool = False,
+        shared_memory_observations: bool = False,
     ) -> None:
         """..
 
@@ -176,6 +287,12 @@ class VectorEnv:
             used, the subproccess  must be started before any other GPU usage.
         :param workers_ignore_signals: Whether or not workers will ignore SIGINT and SIGTERM
             and instead will only exit when :ref:`close` is called
+        :param shared_memory_observations: Whether the workers write the
+            fixed-size observations (the :ref:`spaces.Box` entries of the
+            observation space, e.g. RGB and depth) of :ref:`step` and
+            :ref:`reset` into preallocated shared memory instead of pickling
+            them through the pipe. Only the remaining entries and small
+            placeholders are sent over the pipe.
         """
         self._is_closed = True
 
@@ -226,6 +343,29 @@ class VectorEnv:
         ]
         self._paused: List[Tuple] = []
 
+        if shared_memory_observations:
+            self._init_shared_observations()
+
+    def _init_shared_observations(self) -> None:
+        r"""Allocates the shared-memory buffer of every env and hands it to
+        its worker.
+        """
+        for read_fn, write_fn, observation_space in zip(
+            self._connection_read_fns,
+            self._connection_write_fns,
+            self.observation_spaces,
+        ):
+            shared = _SharedObservations.from_observation_space(
+                observation_space
+            )
+            if shared is None:
+                continue
+            read_fn.shared_observations = shared
+            write_fn(
+                (SHARED_OBSERVATIONS_COMMAND, (shared.name, shared.layout))
+            )
+            read_fn()
+
     @property
     def num_envs(self):
         r"""number of individual environments."""
@@ -253,6 +393,7 @@ class VectorEnv:
         env = EnvCountEpisodeWrapper(EnvObsDictWrapper(env_fn(*env_fn_args)))
         if parent_pipe is not None:
             parent_pipe.close()
+        shared_observations: Optional[_SharedObservations] = None
         try:
             command, data = connection_read_fn()
             while command != CLOSE_COMMAND:
@@ -262,12 +403,21 @@ class VectorEnv:
                     if auto_reset_done and done:
                         observations = env.reset()
 
+                    if shared_observations is not None:
+                        observations = shared_observations.write(observations)
                     connection_write_fn((observations, reward, done, info))
 
                 elif command == RESET_COMMAND:
                     observations = env.reset()
+                    if shared_observations is not None:
+                        observations = shared_observations.write(observations)
                     connection_write_fn(observations)
 
+                elif command == SHARED_OBSERVATIONS_COMMAND:
+                    name, layout = data
+                    shared_observations = _SharedObservations(layout, name)
+                    connection_write_fn(True)
+
                 elif command == RENDER_COMMAND:
                     connection_write_fn(env.render(*data[0], **data[1]))
 
@@ -296,6 +446,8 @@ class VectorEnv:
         except KeyboardInterrupt:
             logger.info("Worker KeyboardInterrupt")
         finally:
+            if shared_observations is not None:
+                shared_observations.close()
             if child_pipe is not None:
                 child_pipe.close()
             env.close()
@@ -386,7 +538,7 @@ class VectorEnv:
             write_fn((RESET_COMMAND, None))
         results = []
         for read_fn in self._connection_read_fns:
-            results.append(read_fn())
+            results.append(self._read_observations(read_fn, read_fn()))
         return results
 
     def reset_at(self, index_env: int):
@@ -396,7 +548,8 @@ class VectorEnv:
         :return: list containing the output of reset method of indexed env.
         """
         self._connection_write_fns[index_env]((RESET_COMMAND, None))
-        results = [self._connection_read_fns[index_env]()]
+        read_fn = self._connection_read_fns[index_env]
+        results = [self._read_observations(read_fn, read_fn())]
         return results
 
     def async_step_at(
@@ -407,7 +560,23 @@ class VectorEnv:
 
     @profiling_wrapper.RangeContext("wait_step_at")
     def wait_step_at(self, index_env: int) -> Any:
-        return self._connection_read_fns[index_env]()
+        read_fn = self._connection_read_fns[index_env]
+        result = read_fn()
+        if read_fn.shared_observations is None:
+            return result
+        observations, reward, done, info = result
+        return (
+            self._read_observations(read_fn, observations),
+            reward,
+            done,
+            info,
+        )
+
+    @staticmethod
+    def _read_observations(read_fn: _ReadWrapper, observations: Any) -> Any:
+        if read_fn.shared_observations is None:
+            return observations
+        return read_fn.shared_observations.read(observations)
 
     def step_at(self, index_env: int, action: Union[int, np.ndarray]):
         r"""Step in the index_env environment in the vector.
@@ -478,6 +647,13 @@ class VectorEnv:
         for _, _, _, process in self._paused:
             process.join()
 
+        for read_fn in self._connection_read_fns + [
+            read_fn for _, read_fn, _, _ in self._paused
+        ]:
+            if read_fn.shared_observations is not None:
+                read_fn.shared_observations.close()
+                read_fn.shared_observations = None
+
         self._is_closed = True
 
         if self._batch_renderer != None:
@@ -631,6 +807,10 @@ class ThreadedVectorEnv(VectorEnv):
     performance.
     """
 
+    def _init_shared_observations(self) -> None:
+        # The threads already share the observations with the main thread
+        pass
+
     def _spawn_workers(
         self,
         env_fn_args: Sequence[Tuple],
@@ -68,6 +68,18 @@ class Predicate:
     def n_args(self):
         return len(self._args)
 
+    @property
+    def arg_values(self) -> Optional[List[PddlEntity]]:
+        return self._arg_values
+
+    @property
+    def entities(self) -> List[PddlEntity]:
+        """
+        The entities the truth of the predicate depends on: its arguments and
+        the entities its simulator state refers to, such as the robot.
+        """
+        return [*(self._arg_values or []), *self._pddl_sim_state.entities]
+
     @property
     def name(self):
         return self._name
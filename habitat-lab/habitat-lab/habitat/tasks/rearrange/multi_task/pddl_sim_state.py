@@ -5,7 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 
 from dataclasses import dataclass, replace
-from typing import Any, Dict, Optional, cast
+from typing import Any, Dict, List, Optional, cast
 
 import magnum as mn
 import numpy as np
@@ -287,6 +287,22 @@ class PddlSimState:
         }
         return self
 
+    @property
+    def entities(self) -> List[PddlEntity]:
+        """
+        The entities the state refers to, including the robots and the
+        entities of their desired states.
+        """
+        entities = [*self._art_states, *self._obj_states]
+        entities.extend(self._obj_states.values())
+        for robot_entity, robot_state in self._robot_states.items():
+            entities.append(robot_entity)
+            if robot_state.holding is not None:
+                entities.append(robot_state.holding)
+            if isinstance(robot_state.pos, PddlEntity):
+                entities.append(robot_state.pos)
+        return entities
+
     def is_compatible(self, expr_types) -> bool:
         def type_matches(entity, match_names):
             return any(
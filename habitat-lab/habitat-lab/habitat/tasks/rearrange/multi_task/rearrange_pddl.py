@@ -4,9 +4,19 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import magnum as mn
 import numpy as np
@@ -147,10 +157,65 @@ class PddlSimInfo:
     recep_place_shrink_factor: float
 
     pred_truth_cache: Optional[Dict[str, bool]] = None
+    # Entity states at the last `get_dirty_entities` call of each tracker.
+    entity_states: Dict[Hashable, Dict[str, Any]] = field(
+        default_factory=dict
+    )
 
     def reset_pred_truth_cache(self):
         self.pred_truth_cache = {}
 
+    def get_entity_state(self, entity: PddlEntity) -> Any:
+        """
+        Summary of the simulator state that the predicates over `entity`
+        depend on. Predicates whose entities all kept their state keep their
+        truth value.
+        """
+        if self.check_type_matches(
+            entity, SimulatorObjectType.ROBOT_ENTITY.value
+        ):
+            agent_data = self.sim.get_agent_data(self.robot_ids[entity.name])
+            return (
+                *agent_data.articulated_agent.base_pos,
+                agent_data.articulated_agent.base_rot,
+                agent_data.grasp_mgr.snap_idx,
+            )
+        if self.check_type_matches(
+            entity, SimulatorObjectType.ARTICULATED_RECEPTACLE_ENTITY.value
+        ):
+            marker_info = self.marker_handles[entity.name]
+            return (
+                *marker_info.get_current_position(),
+                marker_info.get_targ_js(),
+            )
+        if self.check_type_matches(
+            entity, SimulatorObjectType.GOAL_ENTITY.value
+        ) or self.check_type_matches(
+            entity, SimulatorObjectType.STATIC_RECEPTACLE_ENTITY.value
+        ):
+            # Fixed for the episode.
+            return None
+        return tuple(self.get_entity_pos(entity))
+
+    def get_dirty_entities(
+        self, tracker: Hashable, entities: Iterable[PddlEntity]
+    ) -> Optional[Set[str]]:
+        """
+        Names of the `entities` whose state (see `get_entity_state`) changed
+        since the last call with the same `tracker`. Returns None on the
+        first call, when every entity has to be considered changed.
+        """
+        states = {e.name: self.get_entity_state(e) for e in entities}
+        prev_states = self.entity_states.get(tracker)
+        self.entity_states[tracker] = states
+        if prev_states is None:
+            return None
+        return {
+            name
+            for name, state in states.items()
+            if name not in prev_states or prev_states[name] != state
+        }
+
     def get_predicate(self, pred_name: str):
         return self.predicates[pred_name]
 
@@ -4,6 +4,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import hashlib
+import json
 import os
 import os.path as osp
 import time
@@ -63,6 +65,51 @@ if TYPE_CHECKING:
     from omegaconf import DictConfig
 
 
+# Bump when the format of the `scene_cache_dir` entries changes.
+SCENE_CACHE_VERSION = 1
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_cache_entry(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if path is None:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_file(path: str, write_fn: Callable[[str], Any]) -> None:
+    """
+    Writes a cache file through a temporary file, so other workers never read
+    a partially written one.
+    """
+    root, ext = osp.splitext(path)
+    tmp_path = f"{root}.tmp{os.getpid()}{ext}"
+    try:
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write the scene cache file {path}: {e}")
+
+
+def _write_cache_entry(path: str, entry: Dict[str, Any]) -> None:
+    def write_json(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+
+    _write_cache_file(path, write_json)
+
+
 @registry.register_simulator(name="RearrangeSim-v0")
 class RearrangeSim(HabitatSim):
     def __init__(self, config: "DictConfig"):
@@ -140,6 +187,9 @@ class RearrangeSim(HabitatSim):
             self.habitat_config.additional_object_paths
         )
         self._kinematic_mode = self.habitat_config.kinematic_mode
+        self._scene_cache_dir = self.habitat_config.scene_cache_dir
+        # The (scene id, content hash) of the last scene keyed in the cache.
+        self._scene_digest: Optional[Tuple[str, str]] = None
 
         self._extra_runtime_perf_stats: Dict[str, float] = defaultdict(float)
         self._perf_logging_enabled = False
@@ -459,9 +509,6 @@ class RearrangeSim(HabitatSim):
             self.pathfinder.load_nav_mesh(navmesh_path)
             logger.info(f"Loaded navmesh from {navmesh_path}")
         else:
-            logger.warning(
-                f"Requested navmesh to load from {navmesh_path} does not exist. Recomputing from configured values and caching."
-            )
             navmesh_settings = NavMeshSettings()
             navmesh_settings.set_defaults()
 
@@ -477,14 +524,79 @@ class RearrangeSim(HabitatSim):
             navmesh_settings.agent_max_climb = agent_config.max_climb
             navmesh_settings.agent_max_slope = agent_config.max_slope
             navmesh_settings.include_static_objects = True
-            self.recompute_navmesh(self.pathfinder, navmesh_settings)
-            os.makedirs(osp.dirname(navmesh_path), exist_ok=True)
-            self.pathfinder.save_nav_mesh(navmesh_path)
 
-        # NOTE: allowing indoor islands only
-        self._largest_indoor_island_idx = get_largest_island_index(
-            self.pathfinder, self, allow_outdoor=False
+            cached_navmesh_path = self._scene_cache_path(
+                ".navmesh",
+                "navmesh",
+                [
+                    agent_config.radius,
+                    agent_config.height,
+                    agent_config.max_climb,
+                    agent_config.max_slope,
+                ],
+            )
+            if cached_navmesh_path is not None and osp.exists(
+                cached_navmesh_path
+            ):
+                self.pathfinder.load_nav_mesh(cached_navmesh_path)
+                navmesh_path = cached_navmesh_path
+                logger.info(f"Loaded cached navmesh from {navmesh_path}")
+            else:
+                logger.warning(
+                    f"Requested navmesh to load from {navmesh_path} does not exist. Recomputing from configured values and caching."
+                )
+                self.recompute_navmesh(self.pathfinder, navmesh_settings)
+                if cached_navmesh_path is not None:
+                    navmesh_path = cached_navmesh_path
+                    _write_cache_file(
+                        navmesh_path, self.pathfinder.save_nav_mesh
+                    )
+                else:
+                    os.makedirs(osp.dirname(navmesh_path), exist_ok=True)
+                    self.pathfinder.save_nav_mesh(navmesh_path)
+
+        # The island index only depends on the scene and the navmesh.
+        island_cache_path = None
+        if osp.exists(navmesh_path):
+            island_cache_path = self._scene_cache_path(
+                ".json", "island", _file_digest(navmesh_path)
+            )
+        entry = _read_cache_entry(island_cache_path)
+        if entry is not None and "largest_island_idx" in entry:
+            self._largest_indoor_island_idx = entry["largest_island_idx"]
+        else:
+            # NOTE: allowing indoor islands only
+            self._largest_indoor_island_idx = get_largest_island_index(
+                self.pathfinder, self, allow_outdoor=False
+            )
+            if island_cache_path is not None:
+                _write_cache_entry(
+                    island_cache_path,
+                    {"largest_island_idx": self._largest_indoor_island_idx},
+                )
+
+    def _scene_cache_path(self, ext: str, *key: Any) -> Optional[str]:
+        """
+        Path of the `scene_cache_dir` entry of the current scene for the
+        JSON serializable `key`, or None if the cache is disabled. The scene
+        is identified by the content of its scene instance and scene dataset
+        files, so editing either of them invalidates its entries.
+        """
+        if self._scene_cache_dir is None:
+            return None
+        scene_id = self.ep_info.scene_id
+        if self._scene_digest is None or self._scene_digest[0] != scene_id:
+            scene_files = [scene_id, self.habitat_config.scene_dataset]
+            digests = [
+                _file_digest(path) if osp.isfile(path) else path
+                for path in scene_files
+            ]
+            self._scene_digest = (scene_id, json.dumps(digests))
+        key_data = json.dumps(
+            [SCENE_CACHE_VERSION, self._scene_digest[1], *key]
         )
+        key_hash = hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+        return osp.join(self._scene_cache_dir, key_hash + ext)
 
     @property
     def largest_island_idx(self) -> int:
@@ -655,30 +767,54 @@ class RearrangeSim(HabitatSim):
         self, scene_id: str, ignore_handles: List[str]
     ) -> Dict[str, mn.Range3D]:
         if scene_id not in self._receptacles_cache:
-            receps = {}
-            all_receps = find_receptacles(
-                self,
-                ignore_handles=ignore_handles,
-            )
-            for recep in all_receps:
-                recep = cast(AABBReceptacle, recep)
-                local_bounds = recep.bounds
-                global_T = recep.get_global_transform(self)
-                # Some coordinates may be flipped by the global transformation,
-                # mixing the minimum and maximum bound coordinates.
-                bounds = np.stack(
-                    [
-                        global_T.transform_point(local_bounds.min),
-                        global_T.transform_point(local_bounds.max),
-                    ],
-                    axis=0,
-                )
-                receps[recep.name] = mn.Range3D(
-                    np.min(bounds, axis=0), np.max(bounds, axis=0)
-                )
-            self._receptacles_cache[scene_id] = receps
+            # The handles of the episode objects are not part of the key, the
+            # same as for `_receptacles_cache`.
+            cache_path = self._scene_cache_path(".json", "receptacles")
+            entry = _read_cache_entry(cache_path)
+            if entry is not None and "receptacles" in entry:
+                recep_bounds = entry["receptacles"]
+            else:
+                recep_bounds = self._find_recep_bounds(ignore_handles)
+                if cache_path is not None:
+                    _write_cache_entry(
+                        cache_path, {"receptacles": recep_bounds}
+                    )
+            self._receptacles_cache[scene_id] = {
+                name: mn.Range3D(mn.Vector3(*lower), mn.Vector3(*upper))
+                for name, (lower, upper) in recep_bounds.items()
+            }
         return self._receptacles_cache[scene_id]
 
+    def _find_recep_bounds(
+        self, ignore_handles: List[str]
+    ) -> Dict[str, Tuple[List[float], List[float]]]:
+        """
+        The global (min, max) corners of every receptacle in the scene.
+        """
+        recep_bounds = {}
+        all_receps = find_receptacles(
+            self,
+            ignore_handles=ignore_handles,
+        )
+        for recep in all_receps:
+            recep = cast(AABBReceptacle, recep)
+            local_bounds = recep.bounds
+            global_T = recep.get_global_transform(self)
+            # Some coordinates may be flipped by the global transformation,
+            # mixing the minimum and maximum bound coordinates.
+            bounds = np.stack(
+                [
+                    global_T.transform_point(local_bounds.min),
+                    global_T.transform_point(local_bounds.max),
+                ],
+                axis=0,
+            )
+            recep_bounds[recep.name] = (
+                np.min(bounds, axis=0).tolist(),
+                np.max(bounds, axis=0).tolist(),
+            )
+        return recep_bounds
+
     def _create_obj_viz(self):
         """
         Adds a visualization of the goal for each of the target objects in the
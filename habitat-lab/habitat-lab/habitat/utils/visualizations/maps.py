@@ -5,6 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import os
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import imageio
@@ -70,6 +71,17 @@ def draw_agent(
         The modified background image. This operation is in place.
     """
 
+    resized_agent = _agent_sprite(float(agent_rotation), agent_radius_px)
+    utils.paste_overlapping_image(image, resized_agent, agent_center_coord)
+    return image
+
+
+@lru_cache(maxsize=256)
+def _agent_sprite(agent_rotation: float, agent_radius_px: int) -> np.ndarray:
+    r"""The agent sprite rotated and resized for `draw_agent`. Agents mostly
+    turn by fixed angles, so the same sprites are drawn again and again.
+    The returned array is shared and must not be modified.
+    """
     # Rotate before resize to keep good resolution.
     rotated_agent = scipy.ndimage.interpolation.rotate(
         AGENT_SPRITE, agent_rotation * 180 / np.pi
@@ -86,8 +98,8 @@ def draw_agent(
         (agent_size_px, agent_size_px),
         interpolation=cv2.INTER_LINEAR,
     )
-    utils.paste_overlapping_image(image, resized_agent, agent_center_coord)
-    return image
+    resized_agent.flags.writeable = False
+    return resized_agent
 
 
 def pointnav_draw_target_birdseye_view(
@@ -414,6 +426,16 @@ def colorize_draw_agent_and_fit_to_height(
     top_down_map = colorize_topdown_map(
         top_down_map, topdown_map_info["fog_of_war_mask"]
     )
+    return _draw_agent_and_fit_to_height(
+        top_down_map, topdown_map_info, output_height
+    )
+
+
+def _draw_agent_and_fit_to_height(
+    top_down_map: np.ndarray,
+    topdown_map_info: Dict[str, Any],
+    output_height: int,
+) -> np.ndarray:
     for agent_idx in range(len(topdown_map_info["agent_map_coord"])):
         map_agent_pos = topdown_map_info["agent_map_coord"][agent_idx]
         map_agent_angle = topdown_map_info["agent_angle"][agent_idx]
@@ -439,3 +461,76 @@ def colorize_draw_agent_and_fit_to_height(
     )
 
     return top_down_map
+
+
+class TopDownMapRenderer:
+    r"""Renders the TopDownMap measure of consecutive frames, like
+    `colorize_draw_agent_and_fit_to_height`. Between two frames only a few
+    cells of the map and of the fog of war change, so the colorized map is
+    kept and only the changed cells are colorized again before the agents
+    are drawn. One renderer should be used per environment, e.g. when
+    exporting the video of an episode.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self._map: Optional[np.ndarray] = None
+        self._fog_of_war_mask: Optional[np.ndarray] = None
+        self._colored_map: Optional[np.ndarray] = None
+
+    def colorize(
+        self,
+        top_down_map: np.ndarray,
+        fog_of_war_mask: Optional[np.ndarray] = None,
+        fog_of_war_desat_amount: float = 0.5,
+    ) -> np.ndarray:
+        r"""`colorize_topdown_map`, only recoloring the cells that changed
+        since the last call. The returned array is reused by the next call.
+        """
+        if (
+            self._map is None
+            or self._map.shape != top_down_map.shape
+            or (self._fog_of_war_mask is None) != (fog_of_war_mask is None)
+        ):
+            self._colored_map = colorize_topdown_map(
+                top_down_map, fog_of_war_mask, fog_of_war_desat_amount
+            )
+        else:
+            changed = self._map != top_down_map
+            if fog_of_war_mask is not None:
+                changed |= self._fog_of_war_mask != fog_of_war_mask
+            changed_idx = np.nonzero(changed)
+            if len(changed_idx[0]) > 0:
+                cells = top_down_map[changed_idx]
+                colors = TOP_DOWN_MAP_COLORS[cells]
+                if fog_of_war_mask is not None:
+                    fog_of_war_desat_values = np.array(
+                        [[fog_of_war_desat_amount], [1.0]]
+                    )
+                    desat_mask = cells != MAP_INVALID_POINT
+                    colors[desat_mask] = (
+                        colors
+                        * fog_of_war_desat_values[
+                            fog_of_war_mask[changed_idx]
+                        ]
+                    ).astype(np.uint8)[desat_mask]
+                self._colored_map[changed_idx] = colors
+        self._map = top_down_map.copy()
+        self._fog_of_war_mask = (
+            None if fog_of_war_mask is None else fog_of_war_mask.copy()
+        )
+        return self._colored_map
+
+    def render(
+        self, topdown_map_info: Dict[str, Any], output_height: int
+    ) -> np.ndarray:
+        r"""`colorize_draw_agent_and_fit_to_height` of the next frame."""
+        top_down_map = self.colorize(
+            topdown_map_info["map"], topdown_map_info["fog_of_war_mask"]
+        )
+        # The agents are drawn in place.
+        return _draw_agent_and_fit_to_height(
+            top_down_map.copy(), topdown_map_info, output_height
+        )
@@ -6,6 +6,7 @@
 
 import os
 import textwrap
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 import imageio
@@ -204,13 +205,59 @@ def tile_images(render_obs_images: List[np.ndarray]) -> np.ndarray:
     return final_im
 
 
-def observations_to_image(observation: Dict, info: Dict) -> np.ndarray:
+def _to_numpy(obs_k) -> np.ndarray:
+    if not isinstance(obs_k, np.ndarray):
+        obs_k = obs_k.cpu().numpy()
+    return obs_k
+
+
+def _to_rgb_uint8(obs_k) -> np.ndarray:
+    obs_k = _to_numpy(obs_k)
+    if obs_k.dtype != np.uint8:
+        obs_k = obs_k * 255.0
+        obs_k = obs_k.astype(np.uint8)
+    if obs_k.shape[-1] == 1:
+        obs_k = np.concatenate([obs_k for _ in range(3)], axis=-1)
+    return obs_k
+
+
+def _add_info_to_frame(
+    render_frame: np.ndarray,
+    info: Dict,
+    top_down_map_renderer: Optional["maps.TopDownMapRenderer"] = None,
+) -> np.ndarray:
+    # draw collision
+    collisions_key = "collisions"
+    if collisions_key in info and info[collisions_key]["is_collision"]:
+        render_frame = draw_collision(render_frame)
+
+    top_down_map_key = "top_down_map"
+    if top_down_map_key in info:
+        if top_down_map_renderer is not None:
+            top_down_map = top_down_map_renderer.render(
+                info[top_down_map_key], render_frame.shape[0]
+            )
+        else:
+            top_down_map = maps.colorize_draw_agent_and_fit_to_height(
+                info[top_down_map_key], render_frame.shape[0]
+            )
+        render_frame = np.concatenate((render_frame, top_down_map), axis=1)
+    return render_frame
+
+
+def observations_to_image(
+    observation: Dict,
+    info: Dict,
+    top_down_map_renderer: Optional["maps.TopDownMapRenderer"] = None,
+) -> np.ndarray:
     r"""Generate image of single frame from observation and info
     returned from a single environment step().
 
     Args:
         observation: observation returned from an environment step().
         info: info returned from an environment step().
+        top_down_map_renderer: renders the top down map of consecutive
+            frames of the same environment faster, if given.
 
     Returns:
         generated image of a single frame.
@@ -218,15 +265,9 @@ def observations_to_image(observation: Dict, info: Dict) -> np.ndarray:
     render_obs_images: List[np.ndarray] = []
     for sensor_name in observation:
         if len(observation[sensor_name].shape) > 1:
-            obs_k = observation[sensor_name]
-            if not isinstance(obs_k, np.ndarray):
-                obs_k = obs_k.cpu().numpy()
-            if obs_k.dtype != np.uint8:
-                obs_k = obs_k * 255.0
-                obs_k = obs_k.astype(np.uint8)
-            if obs_k.shape[2] == 1:
-                obs_k = np.concatenate([obs_k for _ in range(3)], axis=2)
-            render_obs_images.append(obs_k)
+            render_obs_images.append(
+                _to_rgb_uint8(observation[sensor_name])
+            )
 
     assert (
         len(render_obs_images) > 0
@@ -238,18 +279,70 @@ def observations_to_image(observation: Dict, info: Dict) -> np.ndarray:
     else:
         render_frame = np.concatenate(render_obs_images, axis=1)
 
-    # draw collision
-    collisions_key = "collisions"
-    if collisions_key in info and info[collisions_key]["is_collision"]:
-        render_frame = draw_collision(render_frame)
+    return _add_info_to_frame(render_frame, info, top_down_map_renderer)
 
-    top_down_map_key = "top_down_map"
-    if top_down_map_key in info:
-        top_down_map = maps.colorize_draw_agent_and_fit_to_height(
-            info[top_down_map_key], render_frame.shape[0]
+
+def observations_to_images(
+    observations: List[Dict],
+    infos: List[Dict],
+    top_down_map_renderer: Optional["maps.TopDownMapRenderer"] = None,
+) -> List[np.ndarray]:
+    r"""`observations_to_image` of consecutive frames of one environment,
+    e.g. an episode to export as a video. The sensor images of all frames
+    are converted and concatenated at once, and the top down map is only
+    recolored where it changed between frames.
+
+    Args:
+        observations: observation of every frame.
+        infos: info of every frame.
+        top_down_map_renderer: renderer to continue with, e.g. for the next
+            chunk of the same episode. A new one is used if not given.
+
+    Returns:
+        generated image of every frame.
+    """
+    assert len(observations) == len(infos)
+    if top_down_map_renderer is None:
+        top_down_map_renderer = maps.TopDownMapRenderer()
+    if len(observations) == 0:
+        return []
+
+    sensor_names = [
+        sensor_name
+        for sensor_name in observations[0]
+        if len(observations[0][sensor_name].shape) > 1
+    ]
+    sensor_frames = {
+        sensor_name: [
+            _to_numpy(observation[sensor_name]) for observation in observations
+        ]
+        for sensor_name in sensor_names
+    }
+    # Frames can only be converted at once if every sensor keeps its shape
+    # and type, and tiling is not needed.
+    can_stack = len(sensor_names) > 0 and all(
+        len({(obs_k.shape, obs_k.dtype) for obs_k in frames}) == 1
+        for frames in sensor_frames.values()
+    )
+    if can_stack:
+        can_stack = (
+            len({frames[0].shape[:2] for frames in sensor_frames.values()})
+            == 1
         )
-        render_frame = np.concatenate((render_frame, top_down_map), axis=1)
-    return render_frame
+    if not can_stack:
+        return [
+            observations_to_image(observation, info, top_down_map_renderer)
+            for observation, info in zip(observations, infos)
+        ]
+
+    render_frames = np.concatenate(
+        [_to_rgb_uint8(np.stack(frames)) for frames in sensor_frames.values()],
+        axis=2,
+    )
+    return [
+        _add_info_to_frame(render_frame, info, top_down_map_renderer)
+        for render_frame, info in zip(render_frames, infos)
+    ]
 
 
 def append_text_underneath_image(image: np.ndarray, text: str):
@@ -262,11 +355,22 @@ def append_text_underneath_image(image: np.ndarray, text: str):
     :param text: The string to display.
     :return: A new image with text appended underneath.
     """
-    h, w, c = image.shape
+    text_image = _text_image(text, *image.shape)
+    final = np.concatenate((image, text_image), axis=0)
+    return final
+
+
+@lru_cache(maxsize=64)
+def _text_image(text: str, h: int, w: int, c: int) -> np.ndarray:
+    r"""The text block of `append_text_underneath_image`. The text is mostly
+    the same for all frames of an episode, e.g. its instruction, so it is
+    only rendered once. The returned array is shared and must not be
+    modified.
+    """
     font_size = 0.5
     font_thickness = 1
     font = cv2.FONT_HERSHEY_SIMPLEX
-    blank_image = np.zeros(image.shape, dtype=np.uint8)
+    blank_image = np.zeros((h, w, c), dtype=np.uint8)
 
     char_size = cv2.getTextSize(" ", font, font_size, font_thickness)[0]
     wrapped_text = textwrap.wrap(text, width=int(w / char_size[0]))
@@ -286,9 +390,9 @@ def append_text_underneath_image(image: np.ndarray, text: str):
             font_thickness,
             lineType=cv2.LINE_AA,
         )
-    text_image = blank_image[0 : y + 10, 0:w]
-    final = np.concatenate((image, text_image), axis=0)
-    return final
+    text_image = blank_image[0 : y + 10, 0:w].copy()
+    text_image.flags.writeable = False
+    return text_image
 
 
 def overlay_text_to_image(
@@ -11,7 +11,7 @@ from typing import List
 
 import numpy as np
 import pytest
-from gym import Wrapper
+from gym import Wrapper, spaces
 
 import habitat
 from habitat.config.default import get_agent_config, get_config
@@ -171,6 +171,45 @@ def test_number_of_episodes():
         assert envs.number_of_episodes == [10000, 10000, 10000, 10000]
 
 
+def test_shared_memory_observations():
+    configs, _ = _load_test_data()
+    num_envs = len(configs)
+    env_fn_args = tuple((c,) for c in configs)
+    with habitat.VectorEnv(
+        make_env_fn=make_gym_from_config,
+        env_fn_args=env_fn_args,
+        multiprocessing_start_method="forkserver",
+    ) as envs:
+        expected = envs.reset()
+    with habitat.VectorEnv(
+        make_env_fn=make_gym_from_config,
+        env_fn_args=env_fn_args,
+        multiprocessing_start_method="forkserver",
+        shared_memory_observations=True,
+    ) as envs:
+        observations = envs.reset()
+        for obs, expected_obs in zip(observations, expected):
+            assert obs.keys() == expected_obs.keys()
+            for k in obs:
+                assert np.array_equal(obs[k], expected_obs[k])
+
+        for _ in range(2 * configs[0].habitat.environment.max_episode_steps):
+            outputs = envs.step(
+                sample_non_stop_action_gym(envs.action_spaces[0], num_envs)
+            )
+            for (obs, _, _, _), space in zip(
+                outputs, envs.observation_spaces
+            ):
+                for k, v in space.spaces.items():
+                    if isinstance(v, spaces.Box):
+                        assert isinstance(obs[k], np.ndarray)
+                        assert obs[k].shape == v.shape
+
+        envs.pause_at(0)
+
+    assert envs._is_closed
+
+
 def test_threaded_vectorized_env():
     configs, datasets = _load_test_data()
     num_envs = len(configs)
@@ -6,7 +6,11 @@
 
 import numpy as np
 
-from habitat.utils.visualizations.utils import observations_to_image
+from habitat.utils.visualizations import maps
+from habitat.utils.visualizations.utils import (
+    observations_to_image,
+    observations_to_images,
+)
 
 
 def test_observations_to_image():
@@ -57,3 +61,54 @@ def test_different_dim_observations_to_image():
         1570,
         3,
     ), "Resulted image resolution doesn't match."
+
+
+def _top_down_map_info(top_down_map, fog_of_war_mask, angle):
+    return {
+        "map": top_down_map,
+        "fog_of_war_mask": fog_of_war_mask,
+        "agent_map_coord": [(50, 60)],
+        "agent_angle": [angle],
+    }
+
+
+def test_top_down_map_renderer():
+    renderer = maps.TopDownMapRenderer()
+    top_down_map = np.random.randint(low=0, high=12, size=(120, 160))
+    fog_of_war_mask = np.random.randint(low=0, high=2, size=(120, 160))
+    for step in range(4):
+        # Draw part of a path and reveal part of the map.
+        top_down_map[step * 10 : step * 10 + 5, 20:40] = 10
+        fog_of_war_mask[:, step * 20 : step * 20 + 10] = 1
+        info = _top_down_map_info(
+            top_down_map, fog_of_war_mask, step * np.pi / 2
+        )
+        assert np.array_equal(
+            renderer.render(info, 200),
+            maps.colorize_draw_agent_and_fit_to_height(info, 200),
+        )
+
+
+def test_observations_to_images():
+    observations = [
+        {
+            "rgb": np.random.rand(200, 400, 3),
+            "depth": np.random.rand(200, 400, 1),
+        }
+        for _ in range(3)
+    ]
+    infos = [
+        {
+            "collisions": {"is_collision": step == 1},
+            "top_down_map": _top_down_map_info(
+                np.random.randint(low=0, high=12, size=(300, 300)),
+                np.random.randint(low=0, high=2, size=(300, 300)),
+                np.random.random(),
+            ),
+        }
+        for step in range(3)
+    ]
+    images = observations_to_images(observations, infos)
+    assert len(images) == 3
+    for image, observation, info in zip(images, observations, infos):
+        assert np.array_equal(image, observations_to_image(observation, info))
@@ -0,0 +1,94 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath("."))
+
+import numpy as np
+import pytest
+
+pytest.importorskip("habitat")
+pytest.importorskip("habitat_sim")
+if not os.path.isdir("data"):
+    pytest.skip("habitat scene data is not downloaded", allow_module_level=True)
+
+from omegaconf import OmegaConf
+from embodiedbench.envs.eb_habitat.EBHabEnv import EBHabEnv
+from embodiedbench.envs.eb_habitat.sensors import ObsLangSensor
+
+
+@pytest.fixture(scope="module")
+def env():
+    env = EBHabEnv(eval_set='base', down_sample_ratio=0.1)
+    yield env
+    env.close()
+
+
+def _action(env, prefix):
+    return next(i for i, name in enumerate(env.language_skill_set) if name.startswith(prefix))
+
+
+def _state(env, obs):
+    task = env.env.unwrapped._env.task
+    return {
+        'obs': obs,
+        'true_predicates': sorted(p.compact_str for p in task.pddl.get_true_predicates()),
+        'measures': dict(task.measurements.get_metrics()),
+        'current_step': env._current_step,
+    }
+
+
+def _assert_equal(a, b, path='state'):
+    if isinstance(a, dict):
+        assert a.keys() == b.keys(), path
+        for k in a:
+            _assert_equal(a[k], b[k], '{}[{!r}]'.format(path, k))
+    elif isinstance(a, (np.ndarray, np.generic)):
+        np.testing.assert_array_equal(a, b, err_msg=path)
+    else:
+        assert a == b, path
+
+
+def test_snapshot_restore(env):
+    obs = env.reset()
+    nav, pick = _action(env, 'navigate to'), _action(env, 'pick up')
+    snapshot = env.snapshot()
+    before = _state(env, obs)
+
+    obs, _, _, _ = env.step(nav)
+    after_nav = _state(env, obs)
+    env.step(pick)
+
+    obs = env.restore(snapshot)
+    _assert_equal(_state(env, obs), before)
+    obs, _, _, _ = env.step(nav)
+    _assert_equal(_state(env, obs), after_nav)
+
+    # the snapshot is not consumed by restoring it
+    obs = env.restore(snapshot)
+    _assert_equal(_state(env, obs), before)
+
+
+def test_obs_lang_follows_robot(env):
+    env.reset()
+    task = env.env.unwrapped._env.task
+    sensor = ObsLangSensor(config=OmegaConf.create({'max_len': 512}), task=task)
+
+    def check():
+        tokens = sensor.get_observation()
+        sim_info = task.pddl_problem.sim_info
+        expected = ". ".join(p.compact_str for p in sensor.predicates_list if p.is_true(sim_info))
+        assert sensor._state_s == expected
+        return tokens
+
+    tokens = moved = check()
+    # robot_at and not_holding only refer to the robot and static receptacles
+    navs = [i for i, name in enumerate(env.language_skill_set) if name.startswith('navigate to')]
+    for nav in navs[:3]:
+        env.step(nav)
+        moved = check()
+        if not np.array_equal(tokens, moved):
+            break
+    assert not np.array_equal(tokens, moved)
+    _, _, _, info = env.step(_action(env, 'pick up'))
+    picked = check()
+    if info['last_action_success']:
+        assert not np.array_equal(moved, picked)